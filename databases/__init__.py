@@ -3,19 +3,82 @@
 
 VERSION = 0.1
 
-from .sqlite import SqliteInterface
-from .databases import Data, DBInterface, DBEnums
+from .databases import Data, Columns, DBInterface, DBEnums, RowTypes
 
 from enum import Enum, auto
+from importlib import import_module
+from typing import Union
+
+ENTRY_POINTS = "simpcrm.databases" # Group of entry points for external engines
 
 class DBTypes(Enum):
     SQLITE = auto()
+    MEMORY = auto()
+    SQLITE_SHARDED = auto()
+
+# Engines are imported only when selected: {name: "module:Class" or DBInterface subclass}
+ENGINES = {"sqlite": "databases.sqlite:SqliteInterface",
+           "sqlite3": "databases.sqlite:SqliteInterface",
+           "memory": "databases.memory:MemoryInterface",
+           "sqlite_sharded": "databases.sharded:ShardedSqliteInterface"}
+
+TYPES = {DBTypes.SQLITE: "sqlite",
+         DBTypes.MEMORY: "memory",
+         DBTypes.SQLITE_SHARDED: "sqlite_sharded"}
+
+LAZY = {"SqliteInterface": "sqlite",
+        "MemoryInterface": "memory",
+        "ShardedSqliteInterface": "sqlite_sharded"}
+
+def register_engine(name:str, engine:Union[str, type]) -> None:
+    """Registers a new engine to be used by new_db_interface
+    Arguments:
+        name: name of the engine as given in configuration
+        engine: DBInterface subclass or str "module:Class" to import it when selected
+    """
+    if not isinstance(engine, str) and not (isinstance(engine, type) and issubclass(engine, DBInterface)):
+        raise TypeError("engine must be a DBInterface subclass or a 'module:Class' string")
+    ENGINES[name] = engine
+
+def _entry_point(name:str):
+    """Returns the entry point registering an engine in ENTRY_POINTS group or None
+    Arguments:
+        name: name of the engine
+    """
+    from importlib.metadata import entry_points
+    try:
+        found = entry_points(group=ENTRY_POINTS)
+    except TypeError: # Python < 3.10
+        found = entry_points().get(ENTRY_POINTS, [])
+    for entry_point in found:
+        if entry_point.name == name:
+            return entry_point
+    return None
+
+def get_engine(engine:Union[str, DBTypes]) -> type:
+    """Returns the DBInterface subclass of an engine, importing it if needed.
+    Installed packages can add engines through the "simpcrm.databases" entry points.
+    Arguments:
+        engine: DBTypes instance or name of the engine
+    """
+    if isinstance(engine, DBTypes):
+        engine = TYPES[engine]
+    if engine not in ENGINES:
+        entry_point = _entry_point(engine)
+        if entry_point is None:
+            raise TypeError("dbtype must be a DBTypes instance or a correct string from configuration")
+        ENGINES[engine] = entry_point.load()
+    if isinstance(ENGINES[engine], str):
+        module, name = ENGINES[engine].split(":")
+        ENGINES[engine] = getattr(import_module(module), name)
+    return ENGINES[engine]
+
+def new_db_interface(*, engine, server="", user="", password="", encryption="", database="", **options):
+    return get_engine(engine)(database=database, server=server, user=user, password=password, encryption=encryption, **options)
 
-def new_db_interface(*, engine, server="", user="", password="", encryption="", database=""):
-    types = {"sqlite": DBTypes.SQLITE,
-             "sqlite3": DBTypes.SQLITE}
-    if not isinstance(engine, DBTypes) and engine in types:
-        engine = types[engine]
-    else:
-        raise TypeError("dbtype must be a DBTypes instance or a correct string from configuration")
-    return {DBTypes.SQLITE: SqliteInterface}[engine](database=database, server=server, user=user, password=password, encryption=encryption)
+def __getattr__(name:str):
+    """Imports default engines only when they are accessed
+    """
+    if name in LAZY:
+        return get_engine(LAZY[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
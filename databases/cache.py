@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+__author__ = "Iván Uría"
+
+"""This module gives a bounded cache of select results to be used by any
+DBInterface. Entries are kept with the version of their table when they were
+read, so any write bumping the version invalidates them.
+Example of use:
+    cache = SelectCache(size=256, max_bytes=8*2**20)
+    version = db.table_version("customers")
+    data = cache.get(key, version)
+    if data is MISS:
+        data = run_the_query()
+        cache.put(key, version, data)
+    cache.hit_ratio
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import NoReturn, Hashable
+
+MISS = object() # Returned by get when there is no valid entry
+
+def sizeof(data:list) -> int:
+    """Returns an approximation of the bytes used by a list of rows
+    Arguments:
+        data: list of dicts or tuples
+    """
+    size = sys.getsizeof(data)
+    for row in data:
+        size += sys.getsizeof(row)
+        for value in (row.values() if isinstance(row, dict) else row):
+            size += sys.getsizeof(value)
+    return size
+
+
+class SelectCache:
+    """LRU cache of select results with a maximum of entries and bytes.
+    Threadsafe.
+    Arguments:
+        size: maximum number of entries
+        max_bytes: maximum bytes of all entries, approximated by sizeof
+    Attributes:
+        hits: number of valid entries found
+        misses: number of queries not found or invalidated
+        evictions: number of entries removed to keep size and bytes
+        invalidations: number of entries found with an old version
+        nbytes: bytes used by entries
+        hit_ratio: hits / (hits + misses)
+    Methods:
+        get: returns data of a key if its version is still the same
+        put: keeps data of a key with the version it was read at
+        clear: removes all entries
+        stats: returns a dict with the instrumentation attributes
+    """
+    def __init__(self, size:int=256, max_bytes:int=8*2**20) -> NoReturn:
+        self.size = size
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        """Returns the ratio of hits in all lookups. 0.0 if there weren't lookups
+        """
+        lookups = self.hits + self.misses
+        return lookups and self.hits / lookups or 0.0
+
+    def get(self, key:Hashable, version:Hashable):
+        """Returns data kept for key or MISS. Entries with other version are removed
+        Arguments:
+            key: hashable key of the query
+            version: current version of the table
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+                self.invalidations += 1
+            self.misses += 1
+            return MISS
+
+    def put(self, key:Hashable, version:Hashable, data:list) -> NoReturn:
+        """Keeps data for key. Data bigger than max_bytes is not kept
+        Arguments:
+            key: hashable key of the query
+            version: version of the table read before running the query
+            data: result of the query
+        """
+        nbytes = sizeof(data)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, data, nbytes)
+            self.nbytes += nbytes
+            while len(self._entries) > self.size or self.nbytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key:Hashable) -> NoReturn:
+        self.nbytes -= self._entries.pop(key)[2]
+
+    def clear(self) -> NoReturn:
+        """Removes all entries. Instrumentation is kept
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        """Returns a dict with instrumentation
+        """
+        return {"entries": len(self._entries),
+                "bytes": self.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_ratio": self.hit_ratio}
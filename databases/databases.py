@@ -17,8 +17,24 @@ Example:
         ...
 """
 
+import re
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
 from enum import Enum, auto
-from typing import NoReturn, Union
+from functools import lru_cache, partial
+from typing import NoReturn, Union, Any, Callable, Iterator
+
+@lru_cache(maxsize=None)
+def _numpy():
+    """Returns the numpy module, imported the first time it's asked for, or
+    None if it's not installed. It's optional, only used with use_numpy
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
 
 class DBEnums(Enum):
     """Enumerator of Constants used by database objects.
@@ -38,6 +54,13 @@ class DBEnums(Enum):
         ALTER_TABLE_MODIFY_COLUMN: Indicator for changing type of a column in sql
         GET_SCHEMA: Indicator for getting the schema in sql
         PRIMARY: Indicator for adding a column in sql
+        SEARCHABLE: Indicator for text columns to be included in the full-text index
+        SEARCH: Indicator for full-text search clauses
+        INDEX: Indicator for columns to be indexed for fast lookups
+        SORTED: Indicator for columns to be indexed in order for range filters
+        COUNT: Indicator for counting rows without retrieving them
+        INCREMENT: Value for update adding 1 to the stored one, NULL counted as 0
+        AUTOINCREMENT: Indicator for primary keys not given again once their rows are deleted
     """
     SELECT = auto()
     INSERT = auto()
@@ -53,6 +76,120 @@ class DBEnums(Enum):
     GET_SCHEMA = auto()
     PRIMARY = auto()
     CREATE_TABLE_AS_ANOTHER = auto()
+    SEARCHABLE = auto()
+    SEARCH = auto()
+    INDEX = auto()
+    COUNT = auto()
+    SORTED = auto()
+    INCREMENT = auto()
+    AUTOINCREMENT = auto()
+
+class RowTypes(Enum):
+    """Enumerator of representations of rows given by select.
+
+    Attributes:
+        DICT: a dict by row {"column": value}. Default one
+        TUPLE: a tuple of values by row in the order of columns. The cheapest
+        ROW: sqlite3.Row in sqlite engines, a record in other engines
+        RECORD: an immutable record, read by key, position or attribute.
+            Its class is created only once by table and columns. See record_type
+    """
+    DICT = auto()
+    TUPLE = auto()
+    ROW = auto()
+    RECORD = auto()
+
+class Record(tuple):
+    """Base class of records given by RowTypes.RECORD. Values can be read by
+    key, position or attribute: record["name"], record[0] or record.name
+    """
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def __repr__(self) -> str:
+        return self.__class__.__name__+repr(self._asdict())
+
+    def keys(self) -> tuple:
+        return self._fields
+
+    def _asdict(self) -> dict:
+        return dict(zip(self._fields, self))
+
+@lru_cache(maxsize=None)
+def record_type(table:str, fields:tuple) -> type:
+    """Returns the Record class of a table and its columns. Created only once
+    Arguments:
+        table: name of the table
+        fields: tuple with the names of the columns in order
+    """
+    namespace = {"__slots__": (), "_fields": fields, "_index": {key: index for index, key in enumerate(fields)}}
+    for index, key in enumerate(fields):
+        namespace.setdefault(key, property(lambda self, index=index: tuple.__getitem__(self, index)))
+    cls = type(table.strip("_").title().replace("_", "")+"Record", (Record,), namespace)
+    cls._make = partial(tuple.__new__, cls)
+    return cls
+
+def as_row_type(data:list, row_type:RowTypes, table:str, fields:list=None) -> list:
+    """Converts a list of dicts to the representation given by row_type.
+    Used by engines without a cheaper way.
+    Arguments:
+        data: list of dicts with the same keys
+        row_type: RowTypes member
+        table: name of the table
+        fields: names of the columns in order. Keys of the first row by default
+    """
+    if row_type is RowTypes.DICT or not data:
+        return data
+    fields = tuple(fields or data[0].keys())
+    rows = [tuple([row[key] for key in fields]) for row in data]
+    if row_type is RowTypes.TUPLE:
+        return Data(rows)
+    return Data(list(map(record_type(table, fields)._make, rows)))
+
+def parse_order(order:Union[str, list, tuple]) -> list:
+    """Returns a list of (field, descending) from an order given to select
+    Arguments:
+        order: name of a field or list of names. "-name" for descending order
+    """
+    if not order:
+        return []
+    if isinstance(order, str):
+        order = [order]
+    parsed = []
+    for field in order:
+        descending = field.startswith("-")
+        field = field[1:] if descending else field
+        if not re.fullmatch(r"\w+", field):
+            raise Exception(f"Field not allowed in order: {field}")
+        parsed.append((field, descending))
+    return parsed
+
+def order_rows(data:list, order:Union[str, list]=None, limit:int=None, offset:int=None, get:Callable=None) -> list:
+    """Sorts, skips and limits rows as ORDER BY, OFFSET and LIMIT in sql, with
+    None before any value. Used by engines without a cheaper way.
+    Arguments:
+        data: list of rows
+        order: name of a field or list of names. "-name" for descending order
+        limit: maximum number of rows. All by default
+        offset: number of rows to skip. None by default
+        get: callable(row, field) giving the value of a field. row[field] by default
+    """
+    if get is None:
+        get = lambda row, field: row[field]
+    data = list(data)
+    for field, descending in reversed(parse_order(order)): # Sorts are stable
+        data.sort(key=lambda row: (get(row, field) is not None, get(row, field)), reverse=descending)
+    if offset:
+        data = data[offset:]
+    if limit is not None:
+        data = data[:limit]
+    return data
 
 class Data(list): #not checked datatypes
     """Custom list inherited class to check if it has been checked or not
@@ -62,6 +199,57 @@ class Data(list): #not checked datatypes
             data = [data]
         super().__init__(data)
 
+class Columns(dict):
+    """Custom dict inherited class with a column oriented result: {"column": values}.
+    Integers are kept in array("q"), floats in array("d") and anything else in lists.
+    Attributes:
+        length: number of rows
+    """
+    def __init__(self, columns:dict=None, length:int=0):
+        super().__init__(columns or {})
+        self.length = length
+
+    @staticmethod
+    def to_column(values:Union[list, tuple], use_numpy:bool=False) -> Union[array, list]:
+        """Returns the most compact container for values
+        Arguments:
+            values: values of a column
+            use_numpy: returns numpy arrays instead of array.array if numpy is installed
+        """
+        kinds = set(map(type, values))
+        typecode = None
+        if kinds == {int}:
+            typecode = "q"
+        elif kinds and kinds <= {int, float}:
+            typecode = "d"
+        if typecode is None:
+            return list(values)
+        try:
+            column = array(typecode, values)
+        except OverflowError:
+            return list(values)
+        numpy = use_numpy and _numpy()
+        if numpy:
+            return numpy.frombuffer(column, dtype=numpy.int64 if typecode == "q" else numpy.float64)
+        return column
+
+    @classmethod
+    def from_rows(cls, names:list, rows:list, use_numpy:bool=False) -> "Columns":
+        """Creates Columns from a list of tuples
+        Arguments:
+            names: names of the columns in the same order than values in rows
+            rows: list of tuples
+            use_numpy: returns numpy arrays instead of array.array if numpy is installed
+        """
+        values = list(zip(*rows)) or [()]*len(names)
+        return cls(zip(names, [cls.to_column(column, use_numpy) for column in values]), len(rows))
+
+    def rows(self) -> list:
+        """Returns a list of dicts from columns. Expensive, intended for debugging
+        """
+        names = list(self.keys())
+        return [dict(zip(names, row)) for row in zip(*self.values())]
+
 class DBInterface:
     """Semi-abstract class to derive implementations to access any kind of databases
 
@@ -98,6 +286,13 @@ class DBInterface:
         create_table: creates indicated table.
         drop_table: deletes indicated table. Must be called from super() on overriding
         select: gets and returns data from table. Must be called from super() on overriding
+        select_columns: gets data from table as Columns. Built over select by default
+        select_join: gets rows of a table joined with another one. Built over
+            select by default
+        select_union: gets rows of several tables with the same columns. Built
+            over select by default
+        move: moves rows to another table. Built over select, insert and delete by default
+        attach: attaches another database file. Must be overriden
         insert: inserts data on table. Must be called from super() on overriding
         update: updates data from table with indicated filter.
             Must be called from super() on overriding
@@ -115,6 +310,27 @@ class DBInterface:
             Must be called from super() on overriding
         get_primary_key: gets the primary key of a table or tree
             Must be called from super() on overriding
+        create_search_index: creates a full-text index over text fields
+            Must be called from super() on overriding
+        drop_search_index: deletes the full-text index of a table
+            Must be called from super() on overriding
+        search: gets ranked data from the full-text index
+            Must be called from super() on overriding
+        create_change_log: starts logging inserts, updates and deletes of a table
+            Must be called from super() on overriding
+        drop_change_log: stops logging changes of a table
+            Must be called from super() on overriding
+        changes_since: gets changes logged after a sequence number
+            Must be called from super() on overriding
+        oldest_change: gets the oldest sequence number kept in the change log
+        changes_pruned: tells if changes after a sequence number were pruned
+        data_version: gets a value changing with commits of other connections
+        schema_version: gets a value kept by the database changing with its schema
+        transaction: groups writes of current thread in one transaction
+        in_transaction: tells if a transaction is open in current thread
+        after_commit: calls a function once current transaction is committed
+        table_version: gets the write counter of a table
+        bump_version: increases the write counter of a table. Called by writes
     """
     def __init__(self, database:str="", server:str="localhost", user:str="", password:str="", encryption:str="") -> NoReturn:
         """Initializes DB Interface
@@ -132,6 +348,7 @@ class DBInterface:
         self._encryption = encryption
         self._table = ""
         self._filter = {}
+        self._versions = defaultdict(int) # Write counters by table, None for schema changes
 
     @property
     def database(self) -> str:
@@ -170,6 +387,81 @@ class DBInterface:
                 "exists":True
                 }
 
+    def table_version(self, table:str=None) -> tuple:
+        """Returns the version of a table: changes on every write in the table
+        and every change of schema in the database made through this interface
+        Arguments:
+            table: name of table. Table already set by default
+        """
+        if table is None:
+            table = self.table
+        return self._versions[None], self._versions[table]
+
+    def data_version(self, table:str=None) -> Any:
+        """Returns a value that changes when other connections or processes
+        commit changes, as PRAGMA data_version in sqlite. Together with
+        table_version it tells if data must be read again.
+            To be overriden in child class if writes can come from outside this interface
+        Arguments:
+            table: name of table. Table already set by default
+        Returns:
+            None by default: all writes are made through this interface
+        """
+        return None
+
+    def schema_version(self, database:str=None) -> Any:
+        """Returns a value kept by the database that changes with every change
+        of schema, as PRAGMA schema_version in sqlite. Used to know if saved
+        metadata is still valid.
+            To be overriden in child class
+        Arguments:
+            database: name of database. Database already set by default
+        Returns:
+            None by default: not known
+        """
+        return None
+
+    def bump_version(self, table:str=None) -> NoReturn:
+        """Increases the write counter of a table. To be called by writes in child class
+        Arguments:
+            table: name of the table written. None for changes of schema, which
+                change the version of every table
+        """
+        self._versions[table] += 1
+
+    @contextmanager
+    def transaction(self, database:str=None):
+        """Groups writes made in current thread in one transaction: they are
+        committed at the end of the outermost transaction or rolled back if an
+        exception is raised. Nested transactions join the outermost one.
+            To be overriden in child class. By default writes are not grouped
+        Arguments:
+            database: name of database. Database already set by default
+        Example:
+            with db.transaction():
+                db.insert({"name": "Pepi"}, table="customers")
+                db.update({"age": 33}, filter={"name": "Pepi"}, table="customers")
+        """
+        yield self
+
+    def in_transaction(self) -> bool:
+        """Returns if a transaction is open in current thread, so its writes
+        are not committed yet.
+            To be overriden in child class along with transaction
+        """
+        return False
+
+    def after_commit(self, callback:Callable, rollback:Callable=None) -> NoReturn:
+        """Calls callback once the outermost transaction of current thread is
+        committed, or rollback if it's rolled back. At once if there is no
+        transaction open.
+            To be overriden in child class along with transaction
+        Arguments:
+            callback: callable without arguments
+            rollback: callable without arguments. Nothing by default
+        """
+        callback()
+
     def connect(self) -> NoReturn:
         """Connects to database.
         To be implemented in child class.
@@ -281,7 +573,8 @@ class DBInterface:
             table = self.table
         return table, database
 
-    def select(self, filter:dict=None, table:str=None, fields:list=None, database:str=None) -> tuple:
+    def select(self, filter:dict=None, table:str=None, fields:list=None, database:str=None, row_type:RowTypes=RowTypes.DICT,
+               order:Union[str, list]=None, limit:int=None, offset:int=None) -> tuple:
         """Selects data in database and table with set_filter
             To be overriden in child class, to use defaults given by this class use:
                 filter, table, fields, database = super().select(filter, table, fields, database)
@@ -290,6 +583,12 @@ class DBInterface:
             table: name of table. Table already set by default
             fields: list of fields to get. All fields by default
             database: name of database. Database already set by default
+            row_type: RowTypes member with the representation of each row.
+                Dicts by default. To be handled in child class
+            order: name of a field or list of names to sort by, "-name" for
+                descending order. See parse_order. To be handled in child class
+            limit: maximum number of rows. To be handled in child class
+            offset: number of rows to skip. To be handled in child class
         Returns:
             filter, table, fields, database
         """
@@ -303,6 +602,173 @@ class DBInterface:
             fields = []
         return filter, table, fields, database
 
+    def select_columns(self, filter:dict=None, table:str=None, fields:list=None, database:str=None, use_numpy:bool=False) -> Columns:
+        """Selects data in database and table in a column oriented result,
+        avoiding a dict by row. Built over select by default, to be overriden in
+        child class with a cheaper implementation.
+        Arguments:
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            fields: list of fields to get. All fields by default
+            database: name of database. Database already set by default
+            use_numpy: returns numpy arrays for numbers if numpy is installed
+        Returns:
+            Columns with results
+        """
+        data = self.select(filter, table, fields, database)
+        names = fields or (data and list(data[0].keys())) or []
+        return Columns.from_rows(names, [[row[name] for name in names] for row in data], use_numpy)
+
+    def count(self, filter:dict=None, table:str=None, database:str=None) -> int:
+        """Returns the number of rows in table with filter. Built over select
+        by default, to be overriden in child class with a cheaper implementation.
+        Arguments:
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        return len(self.select(filter, table, database=database, row_type=RowTypes.TUPLE))
+
+    def _join_defaults(self, other:str, on:dict, how:str="inner", fields:list=None, filter:dict=None,
+                       table:str=None, database:str=None) -> tuple:
+        """Checks arguments of select_join and gives defaults to use internally
+        Arguments:
+            as in select_join
+        Returns:
+            table, on, how, fields as a list of (table, field), filter with
+            "table.field" keys, database
+        """
+        if table is None:
+            table = self.table
+        if database is None:
+            database = self.database
+        if filter is None:
+            filter = self.filter
+        how = how.lower()
+        if how not in ("inner", "left") or table == other:
+            raise Exception("Join not allowed (yet)")
+        if not on or not all([re.fullmatch(r"\w+", field) for pair in on.items() for field in pair]):
+            raise Exception(f"Fields not allowed in join: {on}")
+        def qualify(field):
+            name, _, column = field.rpartition(".")
+            name = name or table
+            if name not in (table, other) or not re.fullmatch(r"\w+", column):
+                raise Exception(f"Field not allowed in join: {field}")
+            return name, column
+        if fields:
+            fields = [qualify(field) for field in fields]
+        else:
+            fields = [(name, field) for name in (table, other) for field in self.get_schema(name, database)]
+        filter = {".".join(qualify(key)): value for key, value in filter.items()}
+        return table, dict(on), how, fields, filter, database
+
+    def select_join(self, other:str, on:dict, how:str="inner", fields:list=None, filter:dict=None,
+                    table:str=None, database:str=None, row_type:RowTypes=RowTypes.DICT) -> Iterator:
+        """Selects rows of table joined with rows of other table with the same
+        values in on fields. Rows are given while they are read. Built over
+        select by default joining them in python, to be overriden in child class
+        with a join in database.
+        Arguments:
+            other: name of the table to join
+            on: dict of the form {"field of table": "field of other"}
+            how: "inner" to get rows matched in both tables or "left" to keep rows
+                of table not matched too, with None in fields of other
+            fields: list of fields as "table.field", or "field" of table. All
+                fields of both tables by default
+            filter: filter to use, with fields as in fields. Filter already set by default
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+            row_type: RowTypes.DICT or RowTypes.TUPLE
+        Returns:
+            iterator of rows, dicts with "table.field" keys or tuples in fields order
+        Example:
+            db.select_join("contacts", {"id": "account"}, how="left",
+                           fields=["name", "contacts.name"], table="accounts")
+        """
+        table, on, how, fields, filter, database = self._join_defaults(other, on, how, fields, filter, table, database)
+        filters = {table: {}, other: {}}
+        for key, value in filter.items():
+            name, _, column = key.rpartition(".")
+            filters[name][column] = value
+        if filters[other]: # As in sql, missing rows of other never match its conditions
+            how = "inner"
+        index = {}
+        for row in self.select(filters[other], other, database=database):
+            key = tuple([row[field] for field in on.values()])
+            if None not in key:
+                index.setdefault(key, []).append(row)
+        names = [f"{name}.{field}" for name, field in fields]
+        def rows():
+            for row in self.select(filters[table], table, database=database):
+                for match in index.get(tuple([row[field] for field in on]), [None] if how == "left" else []):
+                    values = tuple([row[field] if name == table else match and match[field] for name, field in fields])
+                    yield values if row_type is RowTypes.TUPLE else dict(zip(names, values))
+        return rows()
+
+    def select_union(self, tables:list, filter:dict=None, fields:list=None, database:str=None,
+                     row_type:RowTypes=RowTypes.DICT, order:Union[str, list]=None, limit:int=None,
+                     offset:int=None) -> list:
+        """Selects rows with the same filter from several tables with the same
+        columns, as a single result (UNION ALL). Built over select by default
+        sorting and slicing in python, to be overriden in child class with a
+        single query.
+        Arguments:
+            tables: list of names of tables
+            filter: filter to use. Filter already set by default
+            fields: list of fields to get. All fields by default
+            database: name of database. Database already set by default
+            row_type: RowTypes member with the representation of each row
+            order: field or list of fields to sort by, "-field" for descending order
+            limit: maximum number of rows. All by default
+            offset: number of rows to skip. None by default
+        Returns:
+            list of rows as given by row_type
+        """
+        if filter is None:
+            filter = self.filter
+        extra = [field for field, _ in parse_order(order) if fields and field not in fields] # Needed to sort
+        data = []
+        for table in tables: # Each table gives limit+offset rows at most, the rest is never needed
+            data.extend(self.select(dict(filter), table, fields and list(fields)+extra, database, order=order,
+                                    limit=None if limit is None else limit+(offset or 0)))
+        data = order_rows(data, order, limit, offset)
+        if extra:
+            data = [{key: row[key] for key in fields} for row in data]
+        return as_row_type(data, row_type, tables[0], fields)
+
+    def move(self, filter:dict, destination:str, limit:int=None, table:str=None, database:str=None) -> int:
+        """Moves the rows of table with filter to destination, a table with the
+        same columns, in one transaction. Built over select, insert and delete
+        by default, to be overriden in child class with a cheaper implementation.
+        Arguments:
+            filter: filter of the rows to move
+            destination: name of the table receiving the rows
+            limit: maximum number of rows to move. All by default
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            number of rows moved
+        """
+        if table is None:
+            table = self.table
+        primary_key = self.get_primary_key(table, database)
+        with self.transaction():
+            rows = self.select(filter, table, database=database, order=primary_key, limit=limit)
+            if rows:
+                self.insert(list(rows), table=destination, database=database)
+                self.delete({primary_key: ["IN", [row[primary_key] for row in rows]]}, table=table, database=database)
+        return len(rows)
+
+    def attach(self, path:str, schema:str) -> NoReturn:
+        """Attaches another database file, so its tables can be used as
+        "schema.table" along with the ones of this database.
+        To be implemented in child class.
+        Arguments:
+            path: path of the database file, created if needed
+            schema: name to qualify its tables with
+        """
+        raise NotImplementedError
+
     def insert(self, data:Union[dict, list, tuple], table:str=None, database:str=None) -> tuple:
         """Inserts data in database and table
             To be overriden in child class, to use defaults given by this class use:
@@ -495,3 +961,132 @@ class DBInterface:
         for item in schema:
             if isinstance(schema[item], list) and DBEnums.PRIMARY in schema[item]:
                 return item
+
+    #Full-text search
+    def create_search_index(self, fields:list, table:str=None, database:str=None) -> tuple:
+        """Creates a full-text index over the given fields of a table. The index
+        must be kept in sync with the data of the table.
+            To be overriden in child class, to use defaults given by this class use:
+                fields, table, database = super().create_search_index(fields, table, database)
+        Arguments:
+            fields: list of names of the text fields to index
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            fields, table, database
+        """
+        if table is None:
+            table = self.table
+        if database is None:
+            database = self.database
+        return list(fields), table, database
+
+    def drop_search_index(self, table:str=None, database:str=None) -> tuple:
+        """Deletes the full-text index of a table
+            To be overriden in child class, to use defaults given by this class use:
+                table, database = super().drop_search_index(table, database)
+        Arguments:
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            table, database
+        """
+        if table is None:
+            table = self.table
+        if database is None:
+            database = self.database
+        return table, database
+
+    def search(self, query:str, table:str=None, limit:int=20, database:str=None) -> tuple:
+        """Searches data in the full-text index of a table
+            To be overriden in child class, to use defaults given by this class use:
+                query, table, limit, database = super().search(query, table, limit, database)
+        Arguments:
+            query: text to search
+            table: name of table. Table already set by default
+            limit: maximum number of results. 20 by default
+            database: name of database. Database already set by default
+        Returns:
+            query, table, limit, database
+        """
+        if table is None:
+            table = self.table
+        if database is None:
+            database = self.database
+        return query, table, limit, database
+
+    #Change data capture
+    def create_change_log(self, table:str=None, keep:int=100000, database:str=None) -> tuple:
+        """Starts logging every insert, update and delete of a table in the change log
+        as (seq, table_name, pk, op, ts). op is "I", "U" or "D". Old entries are
+        pruned automatically.
+            To be overriden in child class, to use defaults given by this class use:
+                table, keep, database = super().create_change_log(table, keep, database)
+        Arguments:
+            table: name of table. Table already set by default
+            keep: number of entries kept in the change log after pruning
+            database: name of database. Database already set by default
+        Returns:
+            table, keep, database
+        """
+        if table is None:
+            table = self.table
+        if database is None:
+            database = self.database
+        return table, int(keep), database
+
+    def drop_change_log(self, table:str=None, database:str=None) -> tuple:
+        """Stops logging changes of a table. Logged entries are kept until pruned
+            To be overriden in child class, to use defaults given by this class use:
+                table, database = super().drop_change_log(table, database)
+        Arguments:
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            table, database
+        """
+        if table is None:
+            table = self.table
+        if database is None:
+            database = self.database
+        return table, database
+
+    def changes_since(self, seq:int=0, table:str=None, database:str=None) -> tuple:
+        """Gets changes of a table logged after seq, ordered by seq
+            To be overriden in child class, to use defaults given by this class use:
+                seq, table, database = super().changes_since(seq, table, database)
+        Arguments:
+            seq: last sequence number already known. 0 by default, all of them
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            seq, table, database
+        """
+        if table is None:
+            table = self.table
+        if database is None:
+            database = self.database
+        return int(seq), table, database
+
+    def oldest_change(self, table:str=None, database:str=None) -> int:
+        """Gets the oldest sequence number kept in the change log of table, so
+        changes after any older one have been pruned.
+            To be implemented in child class.
+        Arguments:
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            sequence number or None if the change log is empty
+        """
+        raise NotImplementedError
+
+    def changes_pruned(self, seq:int, table:str=None, database:str=None) -> bool:
+        """Returns if changes of table logged after seq were pruned from the
+        change log, so they can't be got from changes_since anymore
+        Arguments:
+            seq: last sequence number already known
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        oldest = self.oldest_change(table, database)
+        return oldest is not None and int(seq) < oldest - 1
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+__author__ = "Iván Uría"
+
+"""This module gives the evaluation of filters in python, with the same
+semantics as the ones of SqliteInterface. Used by MemoryInterface and by
+subscriptions to the events of Entities, without loading any engine.
+Example of use:
+    conditions = compile_filter({"age": [">", 30], "name": ["LIKE", "P%"]})
+    match_filter({"name": "Pepi", "age": 32}, conditions) # True
+
+Functions:
+    compile_filter: translates a filter dictionary into a list of conditions
+    check_condition: checks a single condition as sqlite would
+    match_filter: checks whether a row passes all conditions
+    sort_rank: returns the sqlite sort class of a value
+"""
+
+import re
+from functools import lru_cache
+from typing import Callable
+
+OPERATIONS = ("=", "!=", "<=", ">=", "<", ">", "LIKE", "IN")
+
+def compile_filter(filter:dict) -> list:
+    """Translates a filter dictionary into a list of conditions. It accepts the
+    same forms as DBInterface.set_filter, without modifying the given filter.
+    Arguments:
+        filter: Dictionary with the filter.
+    Returns:
+        list of tuples of the form (field, operation, value)
+    """
+    conditions = []
+    for key, value in filter.items():
+        if not isinstance(value, (list, tuple)) or len(value) != 2:
+            conditions.append((key, "=", value))
+            continue
+        if not isinstance(value[0], (list, tuple)):
+            value = [value]
+        for item in value:
+            if isinstance(item[0], str) and item[0].strip().upper() in OPERATIONS:
+                conditions.append((key, item[0].strip().upper(), item[1]))
+            else:
+                raise Exception("Operation not allowed (yet)")
+    return conditions
+
+@lru_cache(maxsize=256)
+def _like(pattern:str) -> Callable:
+    """Returns the match function of a LIKE pattern. Case insensitive as in sqlite.
+    Arguments:
+        pattern: LIKE pattern with % and _ wildcards
+    """
+    regex = "".join([{"%": ".*", "_": "."}.get(char, re.escape(char)) for char in pattern])
+    return re.compile(regex, re.IGNORECASE | re.DOTALL).fullmatch
+
+def sort_rank(value) -> int:
+    """Returns the sqlite sort class of a value: numbers < text < blobs
+    """
+    if isinstance(value, (int, float)):
+        return 0
+    if isinstance(value, str):
+        return 1
+    return 2
+
+def check_condition(value, operation:str, expected) -> bool:
+    """Checks a single condition as sqlite would. Comparisons with None are
+    always False.
+    Arguments:
+        value: stored value
+        operation: one of OPERATIONS
+        expected: value given in the filter
+    """
+    if operation == "IN":
+        if not isinstance(expected, (list, tuple, set, frozenset)):
+            expected = [expected]
+        return value is not None and value in expected
+    if value is None or expected is None:
+        return False
+    if operation == "LIKE":
+        return _like(str(expected))(str(value)) is not None
+    try:
+        if operation == "=":
+            return value == expected
+        elif operation == "!=":
+            return value != expected
+        elif operation == "<":
+            return value < expected
+        elif operation == ">":
+            return value > expected
+        elif operation == "<=":
+            return value <= expected
+        elif operation == ">=":
+            return value >= expected
+    except TypeError:
+        return check_condition(sort_rank(value), operation, sort_rank(expected))
+    return False
+
+def match_filter(row:dict, conditions:list) -> bool:
+    """Checks whether a row passes all conditions given by compile_filter
+    Arguments:
+        row: dictionary of data {"field": value}
+        conditions: list of tuples (field, operation, value)
+    """
+    return all([check_condition(row.get(key), operation, value) for key, operation, value in conditions])
@@ -0,0 +1,770 @@
+#!/usr/bin/env python
+
+__author__ = "Iván Uría"
+
+"""This module gives an interface inherited from "DBInterface" that keeps all
+data in memory, without any SQL. Intended for unit tests, caching tiers and
+ephemeral sessions.
+Tables are stored column oriented, with a hash index on the primary key and on
+every field declared with DBEnums.INDEX, and a sorted index for range filters on
+every field declared with DBEnums.SORTED. Filters follow the same semantics as
+the ones of SqliteInterface.
+Example of use:
+    db = MemoryInterface()
+    db.create_table("customers", {"name": [str, DBEnums.INDEX], "age": int})
+    db.insert({"name": "Sofía", "age": 70}, table="customers")
+    data = db.select({"name": "Sofía"}, table="customers")
+    db.update({"age": 71}, filter={"id": 1}, table="customers")
+    db.delete({"id": 1}, table="customers")
+"""
+
+import bisect
+import re
+import threading
+import time
+from collections import defaultdict, OrderedDict
+from databases.databases import Data, Columns, DBInterface, DBEnums, RowTypes, record_type, parse_order, order_rows
+from databases.filters import compile_filter, check_condition, sort_rank
+from typing import NoReturn, Union
+
+WORDS = re.compile(r"\w+") # Tokens for the full-text search
+
+
+class MemoryTable:
+    """Column oriented storage of a table.
+    Arguments:
+        fields: OrderedDict with names of fields and list of definitions
+    Attributes:
+        columns: dict of the form {"field": [value, value...]}
+        schema: OrderedDict of the form {"field": [type, DBEnums...]}
+        primary_key: name of the primary key field. None if there isn't
+        indexes: dict of hash indexes of the form {"field": {value: {position}}}
+        sorted: dict of sorted indexes of the form {"field": (keys, positions)},
+            None until a range filter needs it after a change
+        searchable: list of fields in the full-text index
+    """
+    def __init__(self, fields:OrderedDict) -> NoReturn:
+        self.schema = fields
+        self.columns = OrderedDict([(key, []) for key in fields])
+        self.primary_key = None
+        for key in fields:
+            if DBEnums.PRIMARY in fields[key]:
+                self.primary_key = key
+        self.indexes = {}
+        for key in fields:
+            if key == self.primary_key or DBEnums.INDEX in fields[key]:
+                self.indexes[key] = defaultdict(set)
+        self.sorted = {key: None for key in fields if DBEnums.SORTED in fields[key]}
+        self.searchable = []
+        self.sequence = 0
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()), []))
+
+    def row(self, position:int, fields:list=None) -> dict:
+        """Returns a dictionary with the data in position
+        Arguments:
+            position: index of the row
+            fields: list of fields to return. All fields by default
+        """
+        columns = self.columns
+        return {key: columns[key][position] for key in (fields or columns)}
+
+    def reindex(self) -> NoReturn:
+        """Rebuilds all indexes. Used after deletions, which move positions
+        """
+        for key in self.indexes:
+            index = defaultdict(set)
+            for position, value in enumerate(self.columns[key]):
+                self._add_to_index(index, value, position)
+            self.indexes[key] = index
+        for key in self.sorted:
+            self.sorted[key] = None
+
+    @staticmethod
+    def _add_to_index(index:dict, value, position:int) -> NoReturn:
+        try:
+            index[value].add(position)
+        except TypeError:
+            pass # Unhashable values are only reached by scans
+
+    @staticmethod
+    def _remove_from_index(index:dict, value, position:int) -> NoReturn:
+        try:
+            index[value].discard(position)
+            if not index[value]:
+                del(index[value])
+        except (TypeError, KeyError):
+            pass
+
+    def _sorted_index(self, key:str) -> tuple:
+        """Returns the sorted index of a field, building it if needed. Values are
+        sorted as sqlite does, numbers < text < blobs, and None is left out.
+        Arguments:
+            key: name of the field
+        Returns:
+            tuple (keys, positions) or None if values cannot be sorted
+        """
+        if self.sorted[key] is None:
+            entries = [((sort_rank(value), value), position) for position, value in enumerate(self.columns[key])
+                       if value is not None]
+            try:
+                entries.sort()
+            except TypeError:
+                return None # Not comparable values are only reached by scans
+            self.sorted[key] = ([entry[0] for entry in entries], [entry[1] for entry in entries])
+        return self.sorted[key]
+
+    def _range(self, key:str, operation:str, value) -> set:
+        """Returns the positions passing a range condition with the sorted index
+        of the field, or None if it cannot be used
+        Arguments:
+            key: name of the field
+            operation: one of <, <=, >, >=
+            value: value given in the filter
+        """
+        index = self._sorted_index(key)
+        if index is None or value is None:
+            return None
+        keys, positions = index
+        target = (sort_rank(value), value)
+        try:
+            if operation in ("<", "<="):
+                end = (bisect.bisect_left if operation == "<" else bisect.bisect_right)(keys, target)
+                return set(positions[:end])
+            start = (bisect.bisect_right if operation == ">" else bisect.bisect_left)(keys, target)
+            return set(positions[start:])
+        except TypeError:
+            return None
+
+    def positions(self, conditions:list) -> list:
+        """Returns the sorted positions of the rows passing all conditions.
+        Indexed equalities are solved first, the rest by scanning the candidates.
+        Arguments:
+            conditions: list of tuples (field, operation, value)
+        """
+        for key, _, _ in conditions:
+            if key not in self.columns:
+                raise RuntimeError(f"no such column: {key}")
+        candidates = None
+        remaining = []
+        for condition in conditions:
+            key, operation, value = condition
+            if key in self.indexes and operation in ("=", "IN"):
+                values = operation == "IN" and isinstance(value, (list, tuple, set, frozenset)) and value or [value]
+                found = set()
+                for item in values:
+                    if item is None:
+                        continue # NULL never equals anything
+                    try:
+                        found.update(self.indexes[key].get(item, ()))
+                    except TypeError:
+                        pass
+                candidates = found if candidates is None else candidates & found
+                continue
+            if key in self.sorted and operation in ("<", "<=", ">", ">="):
+                found = self._range(key, operation, value)
+                if found is not None:
+                    candidates = found if candidates is None else candidates & found
+            remaining.append(condition) # Checked again, as in sqlite for mixed types
+        if candidates is None:
+            candidates = range(len(self))
+        else:
+            candidates = sorted(candidates)
+        if not remaining:
+            return list(candidates)
+        columns = self.columns
+        return [position for position in candidates
+                if all([check_condition(columns[key][position], operation, value)
+                        for key, operation, value in remaining])]
+
+    def append(self, data:dict) -> NoReturn:
+        """Appends a new row
+        Arguments:
+            data: dictionary of data {"field": value}
+        """
+        for key in data:
+            if key not in self.columns:
+                raise RuntimeError(f"table has no column named {key}")
+        if self.primary_key is not None:
+            value = data.get(self.primary_key)
+            if value is None and int in self.schema[self.primary_key]:
+                value = self.sequence + 1
+                data = dict(data)
+                data[self.primary_key] = value
+            if value in self.indexes[self.primary_key]:
+                raise RuntimeError(f"UNIQUE constraint failed: {self.primary_key}")
+            if isinstance(value, int) and value > self.sequence:
+                self.sequence = value
+        position = len(self)
+        for key, column in self.columns.items():
+            column.append(data.get(key))
+            if key in self.indexes:
+                self._add_to_index(self.indexes[key], data.get(key), position)
+        for key in self.sorted:
+            self.sorted[key] = None
+
+    def change(self, position:int, data:dict) -> NoReturn:
+        """Changes the values of a row
+        Arguments:
+            position: index of the row
+            data: dictionary of data {"field": value}
+        """
+        for key, value in data.items():
+            if key not in self.columns:
+                raise RuntimeError(f"no such column: {key}")
+            old = self.columns[key][position]
+            if value is DBEnums.INCREMENT:
+                value = (old or 0) + 1
+            if key == self.primary_key and value != old and value in self.indexes[key]:
+                raise RuntimeError(f"UNIQUE constraint failed: {self.primary_key}")
+            self.columns[key][position] = value
+            if key in self.indexes:
+                self._remove_from_index(self.indexes[key], old, position)
+                self._add_to_index(self.indexes[key], value, position)
+            if key in self.sorted:
+                self.sorted[key] = None
+
+    def remove(self, positions:list) -> NoReturn:
+        """Removes rows in positions
+        Arguments:
+            positions: list of indexes of rows
+        """
+        if not positions:
+            return
+        removing = set(positions)
+        for key in self.columns:
+            self.columns[key] = [value for position, value in enumerate(self.columns[key])
+                                 if position not in removing]
+        self.reindex()
+
+
+class MemoryInterface(DBInterface):
+    """Inherited from DBInterface keeps tables in memory, with no persistency.
+    All instances are independent databases.
+
+    Attributes:
+        database: name of the database
+        server: server path
+        table: active table or tree
+        filter: active filter
+        tables: dict of the MemoryTable objects {"table": MemoryTable}
+        changes: change log, list of tuples (seq, table_name, pk, op, ts)
+    Arguments:
+        database: (str) name of the database. Only informative
+        server: (str) server path. Ignored
+        user: (str)  user name. Ignored
+        password: (str) password. Ignored
+        encryption: (str) encryption. Ignored
+    Methods:
+        Same ones than SqliteInterface
+    """
+    def __init__(self, database:str="memory", server:str="localhost", *args, **kwargs) -> NoReturn:
+        """Initializes MemoryInterface
+        Arguments:
+            database: db name. Only informative
+            server: default "localhost". Ignored
+        """
+        super().__init__(database, server, *args, **kwargs)
+        self.tables = {}
+        self.lock = threading.RLock()
+        self.changes = []
+        self._change_seq = 0
+        self._change_keep = 100000
+        self._logged = set()
+
+    def _get_table(self, table:str) -> MemoryTable:
+        """Returns the MemoryTable of a table or raises RuntimeError as sqlite would
+        Arguments:
+            table: name of the table
+        """
+        if table not in self.tables:
+            raise RuntimeError(f"no such table: {table}")
+        return self.tables[table]
+
+    # Connection Methods
+    def connect(self) -> NoReturn:
+        """Nothing to connect to
+        """
+        pass
+
+    def disconnect(self) -> NoReturn:
+        """Nothing to disconnect from. Data remains available
+        """
+        pass
+
+    def check_table_exists(self, table:str, database:str=None) -> bool:
+        """Checks if table exists.
+        Arguments:
+            table: Name of the table to check
+            database: Ignored
+        """
+        return table in self.tables
+
+    def delete_database(self, database:str=None) -> NoReturn:
+        """Deletes all tables
+        Arguments:
+            database: Ignored
+        """
+        with self.lock:
+            self.tables.clear()
+
+    # Tables operations
+    def create_table(self, table:str, fields:dict={}, data:list=[], exists:bool=True, database:str=None) -> NoReturn:
+        """Creates table with fields definition. If no primary key is defined,
+        it will be "id", as in SqliteInterface.
+        Arguments:
+            table: name of the table
+            fields: dict with the name of the filed and the python type associated
+                Example:
+                {"id": [int, DBEnums.PRIMARY],
+                 "foo": [str, DBEnums.INDEX],
+                 "bar": datatime.datetime}
+                 fields also accepts a list with a list of fields, but in this
+                 case data argument becomes mandatory
+            data: list of types paired with fields. Not necessary if fields is dict
+            exists: boolean to ignore the creation if table already exists. True by default.
+            database: name of database. Database already set by default.
+        """
+        assert fields # Thay must not be void
+        if isinstance(fields, dict):
+            data = list(fields.values())
+            fields = list(fields.keys())
+        data = [list(item) if isinstance(item, (list, tuple)) else [item] for item in data]
+        if not any([DBEnums.PRIMARY in item for item in data]):
+            if "id" in fields:
+                data[fields.index("id")].append(DBEnums.PRIMARY)
+            else:
+                data = [[int, DBEnums.PRIMARY]] + data
+                fields = ["id"] + list(fields)
+        with self.lock:
+            if table in self.tables:
+                if exists:
+                    return
+                raise RuntimeError(f"table {table} already exists")
+            self.tables[table] = MemoryTable(OrderedDict(zip(fields, data)))
+        self.bump_version(None)
+
+    def drop_table(self, table:str=None, database:str=None) -> NoReturn:
+        """Drops selected table
+        Arguments:
+            table: name of table. Table already set by default.
+            database: name of database. Database already set by default.
+        """
+        table, database = super().drop_table(database=database, table=table)
+        with self.lock:
+            if table in self.tables:
+                del(self.tables[table])
+        self.bump_version(None)
+
+    # Executings
+    def select(self, filter:dict=None, table:str=None, fields:list=None, database:str=None, row_type:RowTypes=RowTypes.DICT,
+               order:Union[str, list]=None, limit:int=None, offset:int=None) -> Data:
+        """Selects data in table with set_filter
+        Arguments:
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            fields: list of fields to get. All fields by default
+            database: name of database. Database already set by default
+            row_type: RowTypes member. ROW gives records as there is no sqlite3.Row
+            order: field or list of fields to sort by, "-field" for descending order
+            limit: maximum number of rows. All by default
+            offset: number of rows to skip. None by default
+        Returns:
+            Data(list of dicts) with results in insertion order if no order is given
+        """
+        filter, table, fields, database = super().select(filter, table, fields, database)
+        with self.lock:
+            memory_table = self._get_table(table)
+            for key in list(fields)+[field for field, _ in parse_order(order)]:
+                if key not in memory_table.columns:
+                    raise RuntimeError(f"no such column: {key}")
+            positions = memory_table.positions(compile_filter(filter))
+            if order or limit is not None or offset:
+                columns = memory_table.columns
+                positions = order_rows(positions, order, limit, offset,
+                                       get=lambda position, field: columns[field][position])
+            if row_type is RowTypes.DICT:
+                return Data([memory_table.row(position, fields) for position in positions])
+            names = tuple(fields or memory_table.columns)
+            columns = [memory_table.columns[key] for key in names]
+            rows = [tuple([column[position] for column in columns]) for position in positions]
+            if row_type is RowTypes.TUPLE:
+                return Data(rows)
+            return Data(list(map(record_type(table, names)._make, rows)))
+
+    def count(self, filter:dict=None, table:str=None, database:str=None) -> int:
+        """Returns the number of rows in table with filter without building them
+        Arguments:
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        filter, table, fields, database = super().select(filter, table, None, database)
+        with self.lock:
+            return len(self._get_table(table).positions(compile_filter(filter)))
+
+    def select_columns(self, filter:dict=None, table:str=None, fields:list=None, database:str=None, use_numpy:bool=False) -> Columns:
+        """Selects data in table in a column oriented result, taken directly
+        from the stored columns
+        Arguments:
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            fields: list of fields to get. All fields by default
+            database: name of database. Database already set by default
+            use_numpy: returns numpy arrays for numbers if numpy is installed
+        Returns:
+            Columns with results in insertion order
+        """
+        filter, table, fields, database = super().select(filter, table, fields, database)
+        with self.lock:
+            memory_table = self._get_table(table)
+            for key in fields:
+                if key not in memory_table.columns:
+                    raise RuntimeError(f"no such column: {key}")
+            positions = memory_table.positions(compile_filter(filter))
+            columns = Columns(length=len(positions))
+            for key in fields or memory_table.columns:
+                column = memory_table.columns[key]
+                columns[key] = Columns.to_column([column[position] for position in positions], use_numpy)
+            return columns
+
+    def insert(self, data:Union[dict, list, tuple], table:str=None, database:str=None) -> list:
+        """Inserts data in table
+        Arguments:
+            data: dict or list of dicts with the same keys with data to be inserted
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            list with the primary key of every row inserted, in order. None if
+            the table has not one
+        """
+        table, fields, values, database = super().insert(data, database=database, table=table)
+        if isinstance(data, dict):
+            values = [values]
+        keys = None
+        with self.lock:
+            memory_table = self._get_table(table)
+            for row in values:
+                memory_table.append(dict(zip(fields, row)))
+            if memory_table.primary_key is not None:
+                keys = list(memory_table.columns[memory_table.primary_key][-len(values):])
+                if table in self._logged:
+                    self._log_changes(table, [(key, "I") for key in keys])
+        self.bump_version(table)
+        return keys
+
+    def update(self, data:dict, table:str=None, filter:dict=None, database:str=None) -> int:
+        """Updates data in table with given filter
+        Arguments:
+            data: dict with data to be updated. DBEnums.INCREMENT adds 1
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            number of rows changed
+        """
+        filter, table, fields, values, database = super().update(data, filter=filter, database=database, table=table)
+        with self.lock:
+            memory_table = self._get_table(table)
+            logged = []
+            positions = memory_table.positions(compile_filter(filter))
+            for position in positions:
+                if table in self._logged and memory_table.primary_key is not None:
+                    old = memory_table.columns[memory_table.primary_key][position]
+                memory_table.change(position, dict(zip(fields, values)))
+                if table in self._logged and memory_table.primary_key is not None:
+                    new = memory_table.columns[memory_table.primary_key][position]
+                    logged.extend(old == new and [(new, "U")] or [(old, "D"), (new, "I")])
+            if logged:
+                self._log_changes(table, logged)
+        self.bump_version(table)
+        return len(positions)
+
+    def delete(self, filter:dict=None, table:str=None, database:str=None) -> NoReturn:
+        """Removes data in table with given filter
+        Arguments:
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        filter, table, database = super().delete(filter, table, database)
+        with self.lock:
+            memory_table = self._get_table(table)
+            positions = memory_table.positions(compile_filter(filter))
+            if table in self._logged and memory_table.primary_key is not None:
+                column = memory_table.columns[memory_table.primary_key]
+                self._log_changes(table, [(column[position], "D") for position in positions])
+            memory_table.remove(positions)
+        self.bump_version(table)
+
+    #Table Alterations
+    def alter_table_rename_table(self, new_name:str, table:str=None, database:str=None) -> NoReturn:
+        """Changes name of table
+        Arguments:
+            new_name: new name for table
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, new_name, database = super().alter_table_rename_table(new_name, table=table)
+        with self.lock:
+            self.tables[new_name] = self._get_table(table)
+            del(self.tables[table])
+        self.bump_version(None)
+
+    def alter_table_rename_column(self, column:str, new_name:str, table:str=None, database:str=None) -> NoReturn:
+        """Changes name of column in table
+        Arguments:
+            column: real name of column
+            new_name: new name for column
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, column, new_name, database = super().alter_table_rename_column(column, new_name, table=table)
+        with self.lock:
+            memory_table = self._get_table(table)
+            for attribute in ("schema", "columns"):
+                renamed = OrderedDict([(new_name if key == column else key, value)
+                                       for key, value in getattr(memory_table, attribute).items()])
+                setattr(memory_table, attribute, renamed)
+            if column in memory_table.indexes:
+                memory_table.indexes[new_name] = memory_table.indexes.pop(column)
+            if column in memory_table.sorted:
+                memory_table.sorted[new_name] = memory_table.sorted.pop(column)
+            if memory_table.primary_key == column:
+                memory_table.primary_key = new_name
+            memory_table.searchable = [new_name if key == column else key for key in memory_table.searchable]
+        self.bump_version(None)
+
+    def alter_table_add_column(self, column:str, column_type:type, table:str=None, database:str=None) -> NoReturn:
+        """Adds new column in table
+        Arguments:
+            column: name of column
+            column_type: python type for this new column
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, column, column_type, database = super().alter_table_add_column(column, column_type, table=table)
+        with self.lock:
+            memory_table = self._get_table(table)
+            if column in memory_table.columns:
+                raise RuntimeError(f"duplicate column name: {column}")
+            column_type = list(column_type) if isinstance(column_type, (list, tuple)) else [column_type]
+            memory_table.schema[column] = column_type
+            memory_table.columns[column] = [None]*len(memory_table)
+            if DBEnums.INDEX in column_type:
+                memory_table.indexes[column] = defaultdict(set)
+                memory_table.reindex()
+            if DBEnums.SORTED in column_type:
+                memory_table.sorted[column] = None
+        self.bump_version(None)
+
+    def alter_table_drop_column(self, column:str, table:str=None, database:str=None) -> NoReturn:
+        """Drops columns in table
+        Arguments:
+            column: name of column
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, column, database = super().alter_table_drop_column(column, table=table)
+        with self.lock:
+            memory_table = self._get_table(table)
+            for attribute in (memory_table.schema, memory_table.columns, memory_table.indexes, memory_table.sorted):
+                if column in attribute:
+                    del(attribute[column])
+            if memory_table.primary_key == column:
+                memory_table.primary_key = None
+        self.bump_version(None)
+
+    def alter_table_modify_column(self, column:str, column_type:type, table:str=None, database:str=None) -> NoReturn:
+        """Changes data type in specified column. Values that can't be converted
+        are kept as they are, as sqlite does.
+        Arguments:
+            column: name of column
+            column_type: python type to apply.
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, column, column_type, database = super().alter_table_modify_column(column, column_type, table=table)
+        with self.lock:
+            memory_table = self._get_table(table)
+            definition = list(column_type) if isinstance(column_type, (list, tuple)) else [column_type]
+            if column == memory_table.primary_key and DBEnums.PRIMARY not in definition:
+                definition.append(DBEnums.PRIMARY)
+            memory_table.schema[column] = definition
+            python_type = definition[0]
+            if python_type in (str, int, float):
+                values = []
+                for value in memory_table.columns[column]:
+                    try:
+                        values.append(value if value is None else python_type(value))
+                    except (TypeError, ValueError):
+                        values.append(value)
+                memory_table.columns[column] = values
+                if column in memory_table.indexes or column in memory_table.sorted:
+                    memory_table.reindex()
+        self.bump_version(None)
+
+    #Get SCHEMA
+    def get_schema(self, table:str=None, database:str=None) -> OrderedDict:
+        """Gets Schema for table
+        Arguments:
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            OrderedDict of the form {"field": [type, DBEnums.PRIMARY]}
+        """
+        table, database = super().get_schema(table, database)
+        memory_table = self._get_table(table)
+        return OrderedDict([(key, [item for item in value if not isinstance(item, DBEnums) or item is DBEnums.PRIMARY])
+                            for key, value in memory_table.schema.items()])
+
+    def create_table_as_another(self, new_table:str, filter:dict=None, database:str=None, table:str=None, fields:list=None, exists:bool=True) -> NoReturn:
+        """Creates new table with indicaed fields and the same content as the
+        active table or specified one. As in sqlite, primary key isn't kept.
+        Arguments:
+            new_table: name of the new table
+            filter: filter to apply in the copying
+            database: name of the database
+            table: name of the table to copy
+            fields: list of fields to copy
+            exists: whether to check if table exists or not. True by default.
+        """
+        filter, table, fields, database = super().select(filter=filter, database=database, table=table, fields=fields)
+        with self.lock:
+            if new_table in self.tables:
+                if exists:
+                    return
+                raise RuntimeError(f"table {new_table} already exists")
+            memory_table = self._get_table(table)
+            fields = fields or list(memory_table.columns)
+            schema = OrderedDict([(key, [item for item in memory_table.schema[key] if not isinstance(item, DBEnums)])
+                                  for key in fields])
+            copy = MemoryTable(schema)
+            for position in memory_table.positions(compile_filter(filter)):
+                copy.append(memory_table.row(position, fields))
+            self.tables[new_table] = copy
+        self.bump_version(None)
+
+    #Full-text search
+    def create_search_index(self, fields:list, table:str=None, database:str=None) -> NoReturn:
+        """Marks fields to be used by search. No index is stored: rows are
+        scanned and ranked on every search.
+        Arguments:
+            fields: list of names of the text fields to index
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        fields, table, database = super().create_search_index(fields, table, database)
+        with self.lock:
+            self._get_table(table).searchable = fields
+
+    def drop_search_index(self, table:str=None, database:str=None) -> NoReturn:
+        """Unmarks fields to be used by search
+        Arguments:
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, database = super().drop_search_index(table, database)
+        with self.lock:
+            if table in self.tables:
+                self.tables[table].searchable = []
+
+    def search(self, query:str, table:str=None, limit:int=20, database:str=None, raw:bool=False) -> Data:
+        """Searches rows containing all words in query, ranked by the number of
+        occurrences. A word ended in * matches as prefix.
+        Arguments:
+            query: words to search
+            table: name of table. Table already set by default
+            limit: maximum number of results. 20 by default
+            database: name of database. Database already set by default
+            raw: ignored, queries have no other syntax. For compatibility with SqliteInterface
+        Returns:
+            Data(list of dicts) with results, best ranked first
+        """
+        query, table, limit, database = super().search(query, table, limit, database)
+        terms = [(match.group().lower(), query[match.end():match.end()+1] == "*")
+                 for match in WORDS.finditer(query)]
+        ranking = []
+        with self.lock:
+            memory_table = self._get_table(table)
+            for position in range(len(memory_table)):
+                words = []
+                for key in memory_table.searchable:
+                    value = memory_table.columns[key][position]
+                    if isinstance(value, str):
+                        words.extend(WORDS.findall(value.lower()))
+                score = 0
+                for term, prefix in terms:
+                    found = len([word for word in words if word == term or (prefix and word.startswith(term))])
+                    if not found:
+                        break
+                    score += found
+                else:
+                    if terms:
+                        ranking.append((-score, position))
+            ranking.sort()
+            return Data([memory_table.row(position) for _, position in ranking[:limit]])
+
+    #Change data capture
+    def _log_changes(self, table:str, changes:list) -> NoReturn:
+        """Appends changes to the change log and prunes it over keep
+        Arguments:
+            table: name of the table
+            changes: list of tuples (pk, op)
+        """
+        now = time.time()
+        for key, operation in changes:
+            self._change_seq += 1
+            self.changes.append((self._change_seq, table, key, operation, now))
+        if len(self.changes) > self._change_keep + max(1, self._change_keep // 10):
+            del(self.changes[:-self._change_keep])
+
+    def create_change_log(self, table:str=None, keep:int=100000, database:str=None) -> NoReturn:
+        """Starts logging changes of table in changes
+        Arguments:
+            table: name of table. Table already set by default
+            keep: number of entries kept after pruning. Shared by all tables
+            database: name of database. Database already set by default
+        """
+        table, keep, database = super().create_change_log(table, keep, database)
+        with self.lock:
+            self._get_table(table)
+            self._logged.add(table)
+            self._change_keep = keep
+
+    def drop_change_log(self, table:str=None, database:str=None) -> NoReturn:
+        """Stops logging changes of table. Its entries are kept until pruned
+        Arguments:
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, database = super().drop_change_log(table, database)
+        with self.lock:
+            self._logged.discard(table)
+
+    def changes_since(self, seq:int=0, table:str=None, database:str=None) -> Data:
+        """Gets changes of table logged after seq
+        Arguments:
+            seq: last sequence number already known. 0 by default, all of them
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            Data(list of tuples) (seq, pk, op, ts) ordered by seq
+        """
+        seq, table, database = super().changes_since(seq, table, database)
+        with self.lock:
+            start = bisect.bisect_right(self.changes, (seq, "\uffff"))
+            return Data([(number, key, operation, ts) for number, name, key, operation, ts in self.changes[start:]
+                         if name == table])
+
+    def oldest_change(self, table:str=None, database:str=None) -> int:
+        """Gets the oldest seq kept in the change log. Pruning is shared by all tables
+        Arguments:
+            table: name of table. Not needed, kept for compatibility
+            database: name of database. Database already set by default
+        Returns:
+            sequence number or None if the change log is empty
+        """
+        with self.lock:
+            return self.changes and self.changes[0][0] or None
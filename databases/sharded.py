@@ -0,0 +1,751 @@
+#!/usr/bin/env python
+
+__author__ = "Iván Uría"
+
+"""This module gives an interface inherited from "DBInterface" that spreads the
+tables of a database across several sqlite files, so writes to busy tables
+don't serialise the rest of them.
+Every table is routed to its own file. Tables given in partitions are also
+hash-partitioned by primary key across N files. Operations on several files
+are run in parallel threads and their results merged.
+Example of use:
+    db = ShardedSqliteInterface(database="data.db", partitions={"activities": 4})
+    db.create_table("customers", {"name": str})      # data.customers.db
+    db.create_table("activities", {"subject": str})  # data.activities.0.db ... data.activities.3.db
+    db.insert([{"subject": "Call"}, {"subject": "Mail"}], table="activities")
+    data = db.select({"subject": "Call"}, table="activities")
+"""
+
+import heapq
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
+from databases.databases import Data, Columns, DBInterface, DBEnums, RowTypes, as_row_type, parse_order, order_rows
+from databases.sqlite import SqliteInterface, MEMORY, fts_query
+from itertools import islice
+from operator import itemgetter
+from typing import NoReturn, Union, Callable
+
+REGISTRY = "__shards" # Table in the main file with the files of every table
+SEQUENCES = "__sequences" # Table in the main file with the last id of partitioned tables
+SEQ_BITS = 40 # Bits of the position in every file in sequence numbers of change logs of partitioned tables
+
+def parse_partitions(partitions:Union[dict, str, None]) -> dict:
+    """Returns a dict of partitions from the configuration string.
+    Arguments:
+        partitions: dict of the form {"table": shards} or a str like
+            "activities:4, emails:8"
+    """
+    if not partitions:
+        return {}
+    if isinstance(partitions, dict):
+        return {table: int(shards) for table, shards in partitions.items()}
+    final = {}
+    for item in partitions.replace(";", ",").split(","):
+        if item.strip():
+            table, shards = item.split(":")
+            final[table.strip()] = int(shards)
+    return final
+
+def shard_index(value, shards:int) -> int:
+    """Returns the shard of a primary key value. Stable between processes.
+    Arguments:
+        value: primary key value
+        shards: number of shards
+    """
+    if isinstance(value, int):
+        return value % shards
+    return zlib.crc32(str(value).encode("utf-8")) % shards
+
+
+class ShardedSqliteInterface(DBInterface):
+    """Inherited from DBInterface routes tables to their own sqlite file, using
+    a SqliteInterface by file.
+
+    Attributes:
+        database: name of the main database file. Registry and sequences are kept here
+        partitions: dict of partitioned tables {"table": shards}
+        routed: whether not partitioned tables go to their own file
+    Arguments:
+        database: (str) name of the main database file. Can't be :memory:
+        server: (str) server path
+        user: (str)  user name if required
+        password: (str) password if required
+        encryption: (str) if exncryption is required -> implementation not defined yet
+        partitions: (dict or str) tables to hash-partition. See parse_partitions
+        routed: (bool) False to keep not partitioned tables in the main file. True by default
+        workers: (int) maximum threads for fan-out operations
+        compact: (bool) compact storage of datetimes and bools. See SqliteInterface
+        cache: (int) select results kept by every shard. See SqliteInterface
+        cache_bytes: (int) bytes of select results kept by every shard
+    Methods:
+        Same ones than SqliteInterface. Select, update and delete on partitioned
+        tables are run in all shards unless the filter gives the primary key.
+    """
+    def __init__(self, database:str="data.db", server:str="localhost", *args,
+                 partitions:Union[dict, str]=None, routed:bool=True, workers:int=None,
+                 compact:bool=False, cache:int=0, cache_bytes:int=8*2**20, **kwargs) -> NoReturn:
+        """Initializes ShardedSqliteInterface
+        Arguments:
+            database: name of the main database file
+            server: default "localhost"
+            partitions: tables to hash-partition
+            routed: whether not partitioned tables go to their own file
+            workers: maximum threads for fan-out operations
+            compact: compact storage of datetimes and bools. See SqliteInterface
+            cache: maximum number of select results kept by every shard. See SqliteInterface
+            cache_bytes: maximum bytes of select results kept by every shard
+        """
+        if database == MEMORY:
+            raise ValueError("Sharding needs a database file")
+        super().__init__(database, server, *args, **kwargs)
+        self.partitions = parse_partitions(partitions)
+        self.routed = routed not in (False, "0", "false", "False", "no")
+        self._workers = workers and int(workers) or min(32, (os.cpu_count() or 1) + 4)
+        self._compact = compact
+        self._cache_options = {"cache": cache, "cache_bytes": cache_bytes}
+        self._executor = None
+        self._shards = {}
+        self._routes = {}
+        self._primary_keys = {}
+        self._lock = threading.RLock()
+        self._transactions = {} # (ExitStack, paths in it) by thread with an open transaction
+        self._hooks = {} # [(callback, rollback), ...] to call at the end of the transaction by thread
+        self._main = self._shard(database)
+        self._main.create_table(REGISTRY, {"table_name": [str, DBEnums.PRIMARY], "files": str})
+        self._main.create_table(SEQUENCES, {"table_name": [str, DBEnums.PRIMARY], "value": int})
+
+    # Routing
+    def _shard(self, path:str) -> SqliteInterface:
+        """Returns the SqliteInterface of a file
+        Arguments:
+            path: path of the sqlite file
+        """
+        with self._lock:
+            if path not in self._shards:
+                self._shards[path] = SqliteInterface(database=path, compact=self._compact, **self._cache_options)
+            shard = self._shards[path]
+        transaction = self._transactions.get(threading.current_thread())
+        if transaction is not None and path not in transaction[1]:
+            transaction[1].add(path)
+            transaction[0].enter_context(shard.transaction())
+        return shard
+
+    def _default_files(self, table:str) -> list:
+        """Returns the files a new table must be created in
+        Arguments:
+            table: name of the table
+        """
+        stem, ext = os.path.splitext(self.database)
+        ext = ext or ".db"
+        if table in self.partitions:
+            return [f"{stem}.{table}.{index}{ext}" for index in range(self.partitions[table])]
+        elif self.routed:
+            return [f"{stem}.{table}{ext}"]
+        return [self.database]
+
+    def _files(self, table:str, create:bool=False) -> list:
+        """Returns the files of a table from the registry
+        Arguments:
+            table: name of the table
+            create: registers the default files if the table isn't registered
+        """
+        if table in (REGISTRY, SEQUENCES):
+            return [self.database]
+        with self._lock:
+            if table not in self._routes:
+                data = self._main.select({"table_name": table}, table=REGISTRY)
+                if data:
+                    self._routes[table] = data[0]["files"].split(";")
+                elif create:
+                    self._routes[table] = self._default_files(table)
+                    self._main.insert({"table_name": table, "files": ";".join(self._routes[table])},
+                                      table=REGISTRY)
+                else:
+                    raise RuntimeError(f"no such table: {table}")
+            return self._routes[table]
+
+    def _route(self, table:str, create:bool=False) -> list:
+        """Returns the SqliteInterface objects holding a table
+        Arguments:
+            table: name of the table
+            create: registers the default files if the table isn't registered
+        """
+        return [self._shard(path) for path in self._files(table, create)]
+
+    def _primary_key(self, table:str) -> str:
+        """Returns the cached primary key of a table
+        Arguments:
+            table: name of the table
+        """
+        if table not in self._primary_keys:
+            self._primary_keys[table] = self._route(table)[0].get_primary_key(table)
+        return self._primary_keys[table]
+
+    def _prune(self, table:str, filter:dict) -> list:
+        """Returns the shards where rows passing filter may be. Only equalities
+        on the primary key of partitioned tables prune shards.
+        Arguments:
+            table: name of the table
+            filter: filter to apply
+        """
+        shards = self._route(table)
+        if len(shards) == 1 or not filter:
+            return shards
+        value = filter.get(self._primary_key(table))
+        if value is None:
+            return shards
+        if isinstance(value, (list, tuple)) and len(value) == 2 and isinstance(value[0], str):
+            if value[0].strip() == "=":
+                value = [value[1]]
+            elif value[0].strip().upper() == "IN" and isinstance(value[1], (list, tuple)):
+                value = value[1]
+            else:
+                return shards
+        elif isinstance(value, (list, tuple)):
+            return shards
+        else:
+            value = [value]
+        return [shards[index] for index in sorted(set([shard_index(item, len(shards)) for item in value]))]
+
+    def _fan_out(self, shards:list, function:Callable) -> list:
+        """Calls function(shard) for every shard in parallel threads
+        Arguments:
+            shards: list of SqliteInterface objects
+            function: callable getting a SqliteInterface
+        Returns:
+            list of results in the order of shards
+        """
+        if len(shards) == 1 or threading.current_thread() in self._transactions:
+            return [function(shard) for shard in shards] # Transactions are kept by thread
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers,
+                                                    thread_name_prefix="shard")
+            executor = self._executor
+        return list(executor.map(function, shards))
+
+    def _next_ids(self, table:str, count:int) -> list:
+        """Reserves count new ids for a partitioned table. Atomic between processes.
+        Arguments:
+            table: name of the table
+            count: number of ids
+        """
+        conn = self._main.conn
+        with self._lock:
+            try: # Writing first takes the lock of the file before reading
+                conn.execute(f"INSERT INTO {SEQUENCES} (table_name, value) VALUES (:table, :count) "
+                             f"ON CONFLICT(table_name) DO UPDATE SET value=value+excluded.value",
+                             {"table": table, "count": count})
+                last = conn.execute(f"SELECT value FROM {SEQUENCES} WHERE table_name=:table",
+                                    {"table": table}).fetchone()["value"] - count
+                self._main._commit()
+            except Exception:
+                if threading.current_thread() not in self._transactions:
+                    conn.rollback()
+                raise
+        return list(range(last+1, last+count+1))
+
+    def _reserve_ids(self, table:str, value:int) -> NoReturn:
+        """Moves the sequence of a partitioned table past an explicit id
+        Arguments:
+            table: name of the table
+            value: id given
+        """
+        conn = self._main.conn
+        with self._lock:
+            conn.execute(f"INSERT INTO {SEQUENCES} (table_name, value) VALUES (:table, :value) "
+                         f"ON CONFLICT(table_name) DO UPDATE SET value=max(value, excluded.value)",
+                         {"table": table, "value": value})
+            self._main._commit()
+
+    @contextmanager
+    def transaction(self, database:str=None):
+        """Groups writes made in current thread in one transaction by file: files
+        are committed one by one at the end of the outermost transaction or
+        rolled back if an exception is raised. Writes on several files are run
+        in current thread while it's open.
+        Arguments:
+            database: name of database. Database already set by default
+        """
+        thread = threading.current_thread()
+        if thread in self._transactions:
+            yield self # Joins the outermost one
+            return
+        try:
+            with ExitStack() as stack:
+                self._transactions[thread] = (stack, set())
+                try:
+                    for path in list(self._shards):
+                        self._shard(path)
+                    yield self
+                finally:
+                    del(self._transactions[thread])
+        except BaseException:
+            for _, rollback in self._hooks.pop(thread, []):
+                if rollback is not None:
+                    rollback()
+            raise
+        for callback, _ in self._hooks.pop(thread, []):
+            callback()
+
+    def in_transaction(self) -> bool:
+        """Returns if a transaction is open in current thread
+        """
+        return threading.current_thread() in self._transactions
+
+    def after_commit(self, callback:Callable, rollback:Callable=None) -> NoReturn:
+        """Calls callback once all files of the outermost transaction of current
+        thread are committed, or rollback if it's rolled back. At once if there
+        is no transaction open
+        Arguments:
+            callback: callable without arguments
+            rollback: callable without arguments. Nothing by default
+        """
+        if not self.in_transaction():
+            callback()
+        else:
+            self._hooks.setdefault(threading.current_thread(), []).append((callback, rollback))
+
+    # Connection Methods
+    def connect(self) -> NoReturn:
+        """Connects all known files in current thread
+        """
+        for shard in list(self._shards.values()):
+            shard.connect()
+
+    def disconnect(self) -> NoReturn:
+        """Disconnects all files in current thread and stops the fan-out threads
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for shard in list(self._shards.values()):
+            if threading.current_thread() in shard._conn:
+                shard.disconnect()
+            for thread in [thread for thread in shard._conn if not thread.is_alive()]:
+                del(shard._conn[thread]) # Left by the fan-out threads
+            for thread in [thread for thread in shard._cursor if not thread.is_alive()]:
+                del(shard._cursor[thread])
+
+    def check_table_exists(self, table:str, database:str=None) -> bool:
+        """Checks if table exists.
+        Arguments:
+            table: Name of the table to check
+            database: Ignored
+        """
+        try:
+            return self._route(table)[0].check_table_exists(table)
+        except RuntimeError:
+            return False
+
+    def delete_database(self, database:str=None) -> NoReturn:
+        """Disconnects and deletes all files
+        Arguments:
+            database: Ignored
+        """
+        self.disconnect()
+        for path in list(self._shards):
+            if os.path.exists(path):
+                os.remove(path)
+        self._shards, self._routes, self._primary_keys = {}, {}, {}
+
+    # Tables operations
+    def create_table(self, table:str, fields:dict={}, data:list=[], exists:bool=True, database:str=None) -> NoReturn:
+        """Creates table with fields definition in all its files.
+        See SqliteInterface.create_table
+        """
+        if isinstance(fields, dict):
+            data = list(fields.values())
+            fields = list(fields.keys())
+        self._fan_out(self._route(table, create=True),
+                      lambda shard: shard.create_table(table, list(fields), [item for item in data], exists=exists))
+
+    def drop_table(self, table:str=None, database:str=None) -> NoReturn:
+        """Drops selected table from all its files and from the registry
+        Arguments:
+            table: name of table. Table already set by default.
+            database: name of database. Database already set by default.
+        """
+        table, database = super().drop_table(database=database, table=table)
+        try:
+            shards = self._route(table)
+        except RuntimeError:
+            return
+        self._fan_out(shards, lambda shard: shard.drop_table(table))
+        self._main.delete({"table_name": table}, table=REGISTRY)
+        self._main.delete({"table_name": table}, table=SEQUENCES)
+        with self._lock:
+            self._routes.pop(table, None)
+            self._primary_keys.pop(table, None)
+
+    # Executings
+    def select(self, filter:dict=None, table:str=None, fields:list=None, database:str=None, row_type:RowTypes=RowTypes.DICT,
+               order:Union[str, list]=None, limit:int=None, offset:int=None) -> Data:
+        """Selects data in all shards of table with set_filter
+        Arguments:
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            fields: list of fields to get. All fields by default
+            database: name of database. Database already set by default
+            row_type: RowTypes member. Rows of several shards are merged as dicts
+                before being converted
+            order: field or list of fields to sort by, "-field" for descending order
+            limit: maximum number of rows. All by default
+            offset: number of rows to skip. None by default
+        Returns:
+            Data(list of dicts) with results. Rows of partitioned tables are
+            sorted by primary key if it is selected and no order is given
+        """
+        filter, table, fields, database = super().select(filter, table, fields, database)
+        shards = self._prune(table, filter)
+        if len(shards) == 1:
+            return shards[0].select(dict(filter), table=table, fields=fields, row_type=row_type,
+                                    order=order, limit=limit, offset=offset)
+        primary_key = self._primary_key(table)
+        if not order and (not fields or primary_key in fields):
+            order = primary_key
+        needed = [field for field, descending in parse_order(order) if fields and field not in fields]
+        window = None if limit is None else limit+(offset or 0) # Enough rows of every shard
+        results = self._fan_out(shards, lambda shard: shard.select(dict(filter), table=table, fields=fields and fields+needed,
+                                                                   order=order, limit=window))
+        data = order_rows([row for result in results for row in result], order, limit, offset)
+        if needed:
+            data = [{key: row[key] for key in fields} for row in data]
+        return as_row_type(Data(data), row_type, table, fields)
+
+    def count(self, filter:dict=None, table:str=None, database:str=None) -> int:
+        """Returns the number of rows in all shards of table with filter
+        Arguments:
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        filter, table, fields, database = super().select(filter, table, None, database)
+        return sum(self._fan_out(self._prune(table, filter), lambda shard: shard.count(dict(filter), table=table)))
+
+    def select_columns(self, filter:dict=None, table:str=None, fields:list=None, database:str=None, use_numpy:bool=False) -> Columns:
+        """Selects data in all shards of table in a column oriented result.
+        Tables in one shard are read directly, partitioned ones are merged by select.
+        Arguments:
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            fields: list of fields to get. All fields by default
+            database: name of database. Database already set by default
+            use_numpy: returns numpy arrays for numbers if numpy is installed
+        Returns:
+            Columns with results
+        """
+        filter, table, fields, database = super().select(filter, table, fields, database)
+        shards = self._prune(table, filter)
+        if len(shards) == 1:
+            return shards[0].select_columns(dict(filter), table=table, fields=fields, use_numpy=use_numpy)
+        return super().select_columns(filter, table, fields, database, use_numpy)
+
+    def insert(self, data:Union[dict, list, tuple], table:str=None, database:str=None) -> list:
+        """Inserts data in the shards given by the primary key of each row.
+        Ids of partitioned tables are reserved in the main file.
+        Arguments:
+            data: dict or list of dicts with the same keys with data to be inserted
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            list with the primary key of every row inserted, in order. See
+            SqliteInterface.insert
+        """
+        table, fields, values, database = super().insert(data, database=database, table=table)
+        if isinstance(data, dict):
+            values = [values]
+        shards = self._route(table)
+        if len(shards) == 1:
+            return shards[0].insert(data, table=table)
+        primary_key = self._primary_key(table)
+        rows = [dict(zip(fields, row)) for row in values]
+        given = [row[primary_key] for row in rows if isinstance(row.get(primary_key), int)]
+        if given:
+            self._reserve_ids(table, max(given))
+        missing = [row for row in rows if row.get(primary_key) is None]
+        for row, value in zip(missing, self._next_ids(table, len(missing))):
+            row[primary_key] = value
+        groups = {}
+        for row in rows:
+            groups.setdefault(shard_index(row[primary_key], len(shards)), []).append(row)
+        self._fan_out(list(groups.items()),
+                      lambda group: shards[group[0]].insert(group[1], table=table))
+        return [row[primary_key] for row in rows]
+
+    def update(self, data:dict, table:str=None, filter:dict=None, database:str=None) -> int:
+        """Updates data in the shards of table with given filter
+        Arguments:
+            data: dict with data to be updated. DBEnums.INCREMENT adds 1
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            number of rows changed
+        """
+        filter, table, fields, values, database = super().update(data, filter=filter, database=database, table=table)
+        shards = self._prune(table, filter)
+        if len(self._route(table)) > 1 and self._primary_key(table) in data:
+            raise RuntimeError("Primary key of a partitioned table can't be changed")
+        return sum(self._fan_out(shards, lambda shard: shard.update(dict(data), table=table, filter=dict(filter))))
+
+    def delete(self, filter:dict=None, table:str=None, database:str=None) -> NoReturn:
+        """Removes data in the shards of table with given filter
+        Arguments:
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        filter, table, database = super().delete(filter, table, database)
+        self._fan_out(self._prune(table, filter),
+                      lambda shard: shard.delete(dict(filter), table=table))
+
+    #Table Alterations
+    def alter_table_rename_table(self, new_name:str, table:str=None, database:str=None) -> NoReturn:
+        """Changes name of table in all its files. Files are not renamed.
+        Arguments:
+            new_name: new name for table
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, new_name, database = super().alter_table_rename_table(new_name, table=table)
+        files = self._files(table)
+        self._fan_out(self._route(table), lambda shard: shard.alter_table_rename_table(new_name, table=table))
+        self._main.update({"table_name": new_name}, filter={"table_name": table}, table=REGISTRY)
+        self._main.update({"table_name": new_name}, filter={"table_name": table}, table=SEQUENCES)
+        with self._lock:
+            self._routes.pop(table, None)
+            self._routes[new_name] = files
+            if table in self._primary_keys:
+                self._primary_keys[new_name] = self._primary_keys.pop(table)
+
+    def alter_table_rename_column(self, column:str, new_name:str, table:str=None, database:str=None) -> NoReturn:
+        """Changes name of column in all files of table
+        Arguments:
+            column: real name of column
+            new_name: new name for column
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, column, new_name, database = super().alter_table_rename_column(column, new_name, table=table)
+        self._fan_out(self._route(table), lambda shard: shard.alter_table_rename_column(column, new_name, table=table))
+        self._primary_keys.pop(table, None)
+
+    def alter_table_add_column(self, column:str, column_type:type, table:str=None, database:str=None) -> NoReturn:
+        """Adds new column in all files of table
+        Arguments:
+            column: name of column
+            column_type: python type for this new column
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, column, column_type, database = super().alter_table_add_column(column, column_type, table=table)
+        self._fan_out(self._route(table), lambda shard: shard.alter_table_add_column(column, column_type, table=table))
+
+    def alter_table_drop_column(self, column:str, table:str=None, database:str=None) -> NoReturn:
+        """Drops columns in all files of table
+        Arguments:
+            column: name of column
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, column, database = super().alter_table_drop_column(column, table=table)
+        self._fan_out(self._route(table), lambda shard: shard.alter_table_drop_column(column, table=table))
+
+    def alter_table_modify_column(self, column:str, column_type:type, table:str=None, database:str=None) -> NoReturn:
+        """Changes data type in specified column in all files of table
+        Arguments:
+            column: name of column
+            column_type: python type to apply. Data can be lost in this transaction
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, column, column_type, database = super().alter_table_modify_column(column, column_type, table=table)
+        self._fan_out(self._route(table), lambda shard: shard.alter_table_modify_column(column, column_type, table=table))
+
+    #Get SCHEMA
+    def get_schema(self, table:str=None, database:str=None):
+        """Gets Schema for table from its first file
+        Arguments:
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, database = super().get_schema(table, database)
+        return self._route(table)[0].get_schema(table)
+
+    def create_table_as_another(self, new_table:str, filter:dict=None, database:str=None, table:str=None, fields:list=None, exists:bool=True) -> NoReturn:
+        """Creates new table with indicaed fields and the same content as the
+        active table or specified one. The new table lives in the same files.
+        Arguments:
+            new_table: name of the new table
+            filter: filter to apply in the copying
+            database: name of the database
+            table: name of the table to copy
+            fields: list of fields to copy
+            exists: whether to check if table exists or not. True by default.
+        """
+        filter, table, fields, database = super().select(filter=filter, database=database, table=table, fields=fields)
+        files = self._files(table)
+        with self._lock:
+            if new_table not in self._routes and not self._main.select({"table_name": new_table}, table=REGISTRY):
+                self._main.insert({"table_name": new_table, "files": ";".join(files)}, table=REGISTRY)
+            self._routes[new_table] = files
+        self._fan_out(self._route(table),
+                      lambda shard: shard.create_table_as_another(new_table, filter=dict(filter), table=table,
+                                                                  fields=fields, exists=exists))
+
+    #Full-text search
+    def create_search_index(self, fields:list, table:str=None, database:str=None) -> NoReturn:
+        """Creates the FTS5 index in all files of table. See SqliteInterface
+        """
+        fields, table, database = super().create_search_index(fields, table, database)
+        self._fan_out(self._route(table), lambda shard: shard.create_search_index(fields, table=table))
+
+    def drop_search_index(self, table:str=None, database:str=None) -> NoReturn:
+        """Deletes the FTS5 index in all files of table. See SqliteInterface
+        """
+        table, database = super().drop_search_index(table, database)
+        self._fan_out(self._route(table), lambda shard: shard.drop_search_index(table=table))
+
+    def search(self, query:str, table:str=None, limit:int=20, database:str=None, raw:bool=False) -> Data:
+        """Searches data in the FTS5 index of all files of table. Results of
+        partitioned tables are merged by their bm25 rank in every shard.
+        Arguments:
+            query: words to search, see fts_query
+            table: name of table. Table already set by default
+            limit: maximum number of results. 20 by default
+            database: name of database. Database already set by default
+            raw: whether query is given as FTS5 syntax. False by default
+        """
+        query, table, limit, database = super().search(query, table, limit, database)
+        if not raw:
+            query = fts_query(query)
+            if not query:
+                return Data([])
+        results = self._fan_out(self._route(table), lambda shard: shard._search_ranked(query, table, limit))
+        return Data([row for rank, row in islice(heapq.merge(*results, key=itemgetter(0)), limit)])
+
+    def table_version(self, table:str=None) -> tuple:
+        """Returns the versions of table in every file. See DBInterface
+        Arguments:
+            table: name of table. Table already set by default
+        """
+        if table is None:
+            table = self.table
+        return tuple([shard.table_version(table) for shard in self._route(table)])
+
+    def data_version(self, table:str=None) -> tuple:
+        """Returns PRAGMA data_version of every file of table. See SqliteInterface
+        Arguments:
+            table: name of table. Table already set by default
+        """
+        if table is None:
+            table = self.table
+        return tuple([shard.data_version() for shard in self._route(table)])
+
+    #Change data capture
+    @staticmethod
+    def _positions(seq:int, count:int) -> list:
+        """Returns the positions in the change log of every file of a
+        partitioned table kept in a sequence number. See changes_since
+        Arguments:
+            seq: sequence number given by changes_since
+            count: number of files of the table
+        """
+        mask = (1 << SEQ_BITS) - 1
+        return [(seq >> (SEQ_BITS * index)) & mask for index in range(count)]
+
+    @staticmethod
+    def _sequence(positions:list) -> int:
+        """Returns the sequence number keeping the positions in the change log
+        of every file of a partitioned table. Grows with any of them
+        Arguments:
+            positions: list of sequence numbers by file
+        """
+        return sum([position << (SEQ_BITS * index) for index, position in enumerate(positions)])
+
+    def create_change_log(self, table:str=None, keep:int=100000, database:str=None) -> NoReturn:
+        """Creates the change log of table in all its files. See SqliteInterface
+        """
+        table, keep, database = super().create_change_log(table, keep, database)
+        self._fan_out(self._route(table), lambda shard: shard.create_change_log(table, keep=keep))
+
+    def drop_change_log(self, table:str=None, database:str=None) -> NoReturn:
+        """Deletes the change log triggers of table in all its files. See SqliteInterface
+        """
+        table, database = super().drop_change_log(table, database)
+        self._fan_out(self._route(table), lambda shard: shard.drop_change_log(table))
+
+    def changes_since(self, seq:int=0, table:str=None, database:str=None) -> Data:
+        """Gets changes of table logged after seq. Changes of partitioned tables
+        are logged in every file and merged by (ts, file, seq), and their
+        sequence numbers keep the position read in every file, so they are only
+        meaningful to this method, changes_pruned and oldest_change.
+        See SqliteInterface
+        Arguments:
+            seq: last sequence number already known. 0 by default, all of them
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            Data(list of tuples) (seq, pk, op, ts) in merged order
+        """
+        seq, table, database = super().changes_since(seq, table, database)
+        shards = self._route(table)
+        if len(shards) == 1:
+            return shards[0].changes_since(seq, table)
+        positions = self._positions(seq, len(shards))
+        results = self._fan_out(shards, lambda shard: shard.changes_since(positions[shards.index(shard)], table))
+        logs = [[(ts, index, number, key, operation) for number, key, operation, ts in rows]
+                for index, rows in enumerate(results)]
+        changes = []
+        for ts, index, number, key, operation in heapq.merge(*logs):
+            positions[index] = number
+            changes.append((self._sequence(positions), key, operation, ts))
+        return Data(changes)
+
+    def oldest_change(self, table:str=None, database:str=None) -> int:
+        """Gets the oldest seq kept in the change log of the files of table, for
+        partitioned tables the one keeping the oldest of every file. See SqliteInterface
+        """
+        if table is None:
+            table = self.table
+        shards = self._route(table)
+        oldest = [shard.oldest_change(table) for shard in shards]
+        if len(shards) == 1 or all([number is None for number in oldest]):
+            return oldest[0]
+        return self._sequence([number or 0 for number in oldest])
+
+    def changes_pruned(self, seq:int, table:str=None, database:str=None) -> bool:
+        """Returns if changes of table after seq were pruned in any of its files.
+        See DBInterface
+        """
+        if table is None:
+            table = self.table
+        shards = self._route(table)
+        if len(shards) == 1:
+            return shards[0].changes_pruned(seq, table)
+        positions = self._positions(int(seq), len(shards))
+        return any([shard.changes_pruned(position, table) for shard, position in zip(shards, positions)])
+
+    #Storage
+    def migrate_compact(self, tables:list=None) -> list:
+        """Migrates timestamp and BOOLEAN columns to compact storage in all files.
+        See SqliteInterface.migrate_compact
+        Arguments:
+            tables: list of names of tables to migrate. All of them by default
+        Returns:
+            list of names of migrated tables
+        """
+        if tables is None:
+            tables = [item["table_name"] for item in self._main.select(table=REGISTRY)]
+        migrated = []
+        for table in tables:
+            results = self._fan_out(self._route(table), lambda shard: shard.migrate_compact([table]))
+            if any(results):
+                migrated.append(table)
+        self._compact = self._compact or bool(migrated)
+        return migrated
@@ -19,16 +19,45 @@ import datetime
 import re
 import sqlite3
 import threading
-from databases.databases import Data, DBInterface, DBEnums
+from databases.cache import SelectCache, MISS
+from databases.databases import Data, Columns, DBInterface, DBEnums, RowTypes, record_type, parse_order
 from collections import defaultdict, OrderedDict
-from typing import NoReturn, Union, Tuple
+from contextlib import contextmanager
+from typing import NoReturn, Union, Tuple, Iterator, Callable, Any
 
 #Converters
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+def to_epoch_micros(value:datetime.datetime) -> int:
+    """Adapts a datetime to integer microseconds since epoch for compact storage.
+    Aware datetimes are stored in UTC.
+    Arguments:
+        value: datetime to adapt
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // MICROSECOND
+
+def from_epoch_micros(value:bytes) -> datetime.datetime:
+    """Converts integer microseconds since epoch to a naive datetime
+    Arguments:
+        value: bytes given by sqlite3
+    """
+    return EPOCH + datetime.timedelta(microseconds=int(value))
+
 sqlite3.register_converter("BOOLEAN", lambda v: bool(int(v)))
+sqlite3.register_converter("EPOCHMICROS", from_epoch_micros) # Compact datetime
+sqlite3.register_converter("BOOLINT", {b"0": False, b"1": True}.__getitem__) # Compact bool, no python call
 
 # Constants
 MEMORY = ":memory:" # For memory database
-RE = re.compile(r"[a-zA-Z0-9 ]+") # Just for search column name and type in
+CHANGES = "__changes" # Change log table
+NOW = "(julianday('now') - 2440587.5) * 86400.0" # Epoch seconds in sqlite
+RE = re.compile(r"[a-zA-Z0-9_ ]+") # Just for search column name and type in
+COLUMN = re.compile(r'\s*("[^"]+"|`[^`]+`|\[[^\]]+\]|\w+)\s+(TIMESTAMP|BOOLEAN)\b', re.IGNORECASE) # Name and type to compact
+COMPACT = {"TIMESTAMP": "EPOCHMICROS", "BOOLEAN": "BOOLINT"} # Declared types for compact storage
+CHUNK = 500 # Rows fetched at once by streamed selects
 
 def dict_factory(cursor:sqlite3.Cursor, row:list) -> dict:
     """Factory to transform fetching list to dictionary.
@@ -45,6 +74,21 @@ def dict_factory(cursor:sqlite3.Cursor, row:list) -> dict:
         d[col[0]] = row[idx]
     return d
 
+def fts_query(query:str) -> str:
+    """Returns a FTS5 query matching all words of query. Every word is quoted
+    as a FTS5 string, so punctuation as in "O'Brien" or "AT&T" is not taken as
+    syntax. A word ended in * matches as prefix, as in MemoryInterface.search
+    Arguments:
+        query: words to search
+    """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if word:
+            terms.append('"'+word.replace('"', '""')+'"'+(prefix and "*" or ""))
+    return " ".join(terms)
+
 class SqliteInterface(DBInterface):
     """Inherited from DBInterface implements sqlite3 connections with a low use
     of SQL intended.
@@ -81,15 +125,29 @@ class SqliteInterface(DBInterface):
         create_table: creates indicated table
         drop_table: deletes indicated table.
         select: gets and returns data from table.
+        select_union: gets rows of several tables in one UNION ALL query.
         insert: inserts data on table.
         update: updates data from table with indicated filter.
         delete: deletes data from table with indicated filter.
+        move: moves rows to another table with INSERT ... SELECT and DELETE.
+        attach: attaches another database file as a schema.
         alter_table_rename_table: renames table or tree.
         alter_table_rename_column: renames column or attribute of a tree.
         alter_table_add_column: adds column to table or attribute to a tree.
         alter_table_modify_column: modifies type of data in a column.
         get_schema: gets data schema.
         get_primary_key: gets the primary key of a table or tree.
+        create_search_index: creates an FTS5 table synced by triggers.
+        drop_search_index: deletes the FTS5 table and its triggers.
+        search: gets data from the FTS5 table ranked by bm25.
+        create_change_log: creates triggers logging changes in __changes.
+        drop_change_log: deletes the triggers logging changes of a table.
+        changes_since: gets changes of a table logged in __changes after a seq.
+        oldest_change: gets the oldest seq kept in __changes.
+        migrate_compact: converts timestamp and BOOLEAN columns to compact storage.
+        table_version: gets the write counter of a table, used by the select cache.
+        data_version: gets PRAGMA data_version of the connection of current thread.
+        schema_version: gets PRAGMA schema_version, changed with every schema change.
     Static Methods:
         _create_filter_query: creates separately a "where" clause. For inner use only.
         _create_fields_pairing: creates separately a pairing key-value clause.
@@ -97,7 +155,8 @@ class SqliteInterface(DBInterface):
         _create_fields_value_for_insert: creates separately a pairing key-value
             clause for insertion. For inner use only.
     """
-    def __init__(self, database:str=MEMORY, server:str="localhost", *args, **kwargs) -> NoReturn:
+    def __init__(self, database:str=MEMORY, server:str="localhost", *args, compact:bool=False,
+                 cache:int=0, cache_bytes:int=8*2**20, **kwargs) -> NoReturn:
         """Initializes SQLiteInterface
         Arguments:
             server: default "localhost"
@@ -105,11 +164,32 @@ class SqliteInterface(DBInterface):
             user: user name to access server
             password: password to access server
             encryption: if encryption is needed
+            compact: stores datetimes as epoch microseconds and bools as integers
+                in new columns. Use migrate_compact for existing ones. False by
+                default, True if the database already has compact columns
+            cache: maximum number of select results kept in a SelectCache. 0 by default, no cache
+            cache_bytes: maximum bytes of the select results kept. 8 MiB by default
         """
         super().__init__(database, server, *args, **kwargs)
+        self._compact = compact in (True, 1, "1", "true", "True", "yes")
+        self._cache = SelectCache(int(cache), int(cache_bytes)) if int(cache) else None
+        self._data_versions = {}
         self._conn = {}
         self._cursor = {}
+        self._depth = {} # Depth of transactions by thread
+        self._attached = {} # Paths of attached files by schema
+        self._hooks = {} # [(callback, rollback), ...] to call at the end of the transaction by thread
+        self._columns = {} # Names of EPOCHMICROS columns by table
+        self._rowids = {} # Name of the INTEGER PRIMARY KEY column by table, None if there is not
         self.connect()
+        if not self._compact:
+            self._compact = self._has_compact_columns()
+
+    @property
+    def cache(self) -> SelectCache:
+        """Returns the SelectCache of select results. None if not enabled
+        """
+        return self._cache
 
     @property
     def cursor(self) -> sqlite3.Cursor:
@@ -151,45 +231,48 @@ class SqliteInterface(DBInterface):
                 values.append(["=", filter[key]])
                 continue
             elif isinstance(filter[key], (list, tuple)) and len(filter[key]) == 2 and not isinstance(filter[key][0], (list, tuple)):
-                filter[key] = [filter[key]]
-            for item in filter[key]:
+                items = [filter[key]] # Given filter is not modified
+            else:
+                items = filter[key]
+            for item in items:
                 if (isinstance(item[0], str) and
-                    item[0].upper() in ("=", "!=", "<=", ">=", "<", ">", "LIKE", "IN")):
-                    if item[0].upper() == "LIKE":
-                        item[0] = " LIKE "
-                    if item[0].upper() == "IN":
-                        item[0] = " IN "
+                    item[0].strip().upper() in ("=", "!=", "<=", ">=", "<", ">", "LIKE", "IN")):
+                    operation = item[0].strip().upper()
+                    if operation in ("LIKE", "IN"):
+                        operation = " "+operation+" "
                     keys.append(key)
-                    values.append(item)
+                    values.append([operation, item[1]])
                 else:
                     raise Exception("Operation not allowed (yet)")
         #keys = list(filter.keys())
         safe = {}
         f = []
         for i, key in enumerate(keys):
+            name = re.sub(r"\W", "_", key) # "table.field" keys of joins
             if values[i][0] == " IN " and isinstance(values[i][1], (list, tuple)):
                 to_f = []
                 for k, v in enumerate(values[i][1]):
-                    dakey = "filter"+key+"value"+str(i)+"in"+str(k)
+                    dakey = "filter"+name+"value"+str(i)+"in"+str(k)
                     to_f.append(":"+dakey)
                     safe[dakey] = values[i][1][k]
                 f.append(key+values[i][0]+"("+", ".join(to_f)+")")
             else:
-                f.append(key+values[i][0]+":filter"+key+"value"+str(i))
-                safe["filter"+key+"value"+str(i)] = values[i][1]
+                f.append(key+values[i][0]+":filter"+name+"value"+str(i))
+                safe["filter"+name+"value"+str(i)] = values[i][1]
         #string = " and ".join([key+values[i][0]+":filter"+key+"value"+str(i) for i, key in enumerate(keys)])
         string = " and ".join(f)
         string = "WHERE {}".format(string)
         return string, safe
 
     @classmethod
-    def _create_fields_pairing(cls, fields:list, data:list, joiner:str=" ") -> Tuple[str, dict]:
+    def _create_fields_pairing(cls, fields:list, data:list, joiner:str=" ", compact:bool=False) -> Tuple[str, dict]:
         """Creates sql fields pairing to use internally by _create_sql_query
         Arguments:
             fields: list of fields to pair with data
             data: list of types or data to pair with fields
             joiner: the string between field and data. a space by default ->
                 in this case, data must be a list of types
+            compact: whether datetime and bool types are declared for compact storage
         Returns:
             str with the sql query and dict with safe passing
         """
@@ -213,19 +296,29 @@ class SqliteInterface(DBInterface):
                                 object: "BLOB",
                                 bool: "BOOLEAN",
                                 datetime.datetime: "timestamp",
-                                datetime.date: "date"})
+                                datetime.date: "date",
+                                DBEnums.SEARCHABLE: "",
+                                DBEnums.INDEX: "",
+                                DBEnums.SORTED: "",
+                                DBEnums.AUTOINCREMENT: "AUTOINCREMENT"})
+            if compact:
+                defs.update({datetime.datetime: "EPOCHMICROS",
+                             bool: "BOOLINT"})
             for index, item in enumerate(pairs):
                 if not isinstance(item[1], list) and not isinstance(item[1], tuple):
                     pairs[index] = [item[0], [item[1]]]
                 final_item = []
                 for definition in pairs[index][1]:
-                    final_item.append(defs[definition])
+                    if defs[definition]:
+                        final_item.append(defs[definition])
                 pairs[index] = [item[0], final_item]
             pairing = ", ".join([joiner.join((item[0], " ".join(item[1]))) for item in pairs])
         else:
-            pairing = ", ".join([joiner.join((item[0], ":"+item[0]+"value")) for item in pairs])
+            pairing = ", ".join([joiner.join((item[0], f"COALESCE({item[0]}, 0) + 1" if item[1] is DBEnums.INCREMENT
+                                                       else ":"+item[0]+"value")) for item in pairs])
             for key, value in pairs:
-                sql_safe_passing[key+"value"] = value
+                if value is not DBEnums.INCREMENT:
+                    sql_safe_passing[key+"value"] = value
         return pairing, sql_safe_passing
 
     @classmethod
@@ -258,7 +351,8 @@ class SqliteInterface(DBInterface):
 
     def _create_sql_query(self, *, table:str=None, method:DBEnums=DBEnums.SELECT,
                           fields:Union[list, tuple]=[], data:Union[list, tuple]=[],
-                          exists:bool=True, filter:dict=None) -> Tuple[str, dict]:
+                          exists:bool=True, filter:dict=None, order:Union[str, list]=None,
+                          limit:int=None, offset:int=None) -> Tuple[str, dict]:
         """Creates sql query with given kwargs to be used by sqlite3
             You can use self.sql_dict to have a default dictionary for key args.
         Key Arguments:
@@ -268,6 +362,9 @@ class SqliteInterface(DBInterface):
             data: data to use in the same order than fields if needed
             exists: True by default. Check if table or item exists before executeing clause
             filter: filter to apply, no filter by default.
+            order: field or list of fields to sort selects, "-field" for descending order
+            limit: maximum number of rows of selects
+            offset: number of rows to skip in selects
         Returns:
             str with the sql query and a dictionary with the values to safe passing.
         """
@@ -303,6 +400,10 @@ class SqliteInterface(DBInterface):
             exists = kwargs["exists"]
         else:
             exists = False
+        if method in (DBEnums.SELECT, DBEnums.COUNT, DBEnums.DELETE, DBEnums.UPDATE):
+            filter = self._adapt_filter(filter, table)
+        if method in (DBEnums.INSERT, DBEnums.UPDATE):
+            data = self._adapt_data(table, fields, list(data))
         sql_string = ""
         sql_safe_passing = {}
         template = {DBEnums.SELECT: "SELECT {fields} FROM {table} {where};",
@@ -316,7 +417,10 @@ class SqliteInterface(DBInterface):
                     DBEnums.ALTER_TABLE_DROP_COLUMN: "ALTER TABLE {table} DROP COLUMN {column};",
                     DBEnums.ALTER_TABLE_RENAME_TABLE: "ALTER TABLE {table} RENAME TO {new_name};",
                     DBEnums.ALTER_TABLE_RENAME_COLUMN: "ALTER TABLE {table} RENAME COLUMN {column} TO {new_name};",
-                    DBEnums.GET_SCHEMA: "SELECT * FROM sqlite_master WHERE name = :table;"}
+                    DBEnums.GET_SCHEMA: "SELECT * FROM sqlite_master WHERE name = :table;",
+                    DBEnums.COUNT: "SELECT COUNT(*) FROM {table} {where};",
+                    DBEnums.INDEX: "CREATE INDEX {exists} {table}__{column}__index ON {table} ({column});",
+                    DBEnums.SEARCH: "SELECT {table}.* FROM {table} JOIN {index} ON {table}.rowid = {index}.rowid WHERE {index} MATCH :query ORDER BY bm25({index}) LIMIT :limit;"}
 
         if method is DBEnums.SELECT:
             if fields and (isinstance(fields, list) or isinstance(fields, tuple)):
@@ -324,9 +428,14 @@ class SqliteInterface(DBInterface):
             else:
                 field_str = "*"
             where_str, sql_safe_passing = self._create_filter_query(filter)
+            if order or limit is not None or offset:
+                where_str = self._create_order_query(where_str, sql_safe_passing, order, limit, offset)
             sql_string = template[method].format(fields=field_str,
                                                 where=where_str,
                                                 table=table)
+        elif method is DBEnums.COUNT:
+            where_str, sql_safe_passing = self._create_filter_query(filter)
+            sql_string = template[method].format(where=where_str, table=table)
         elif method is DBEnums.INSERT:
             fields_str, values_str, sql_safe_passing = self._create_fields_value_for_insert(fields, data)
             sql_string = template[method].format(fields=fields_str,
@@ -343,7 +452,7 @@ class SqliteInterface(DBInterface):
             where_str, sql_safe_passing = self._create_filter_query(filter)
             sql_string = template[method].format(where=where_str, table=table)
         elif method is DBEnums.CREATE_TABLE:
-            pairing, sql_safe_passing = self._create_fields_pairing(fields, data, " ")
+            pairing, sql_safe_passing = self._create_fields_pairing(fields, data, " ", self._compact)
             if exists:
                 exists_str = "IF NOT EXISTS"
             else:
@@ -354,7 +463,7 @@ class SqliteInterface(DBInterface):
         elif method is DBEnums.DROP_TABLE:
             sql_string = template[method].format(table=table)
         elif method is DBEnums.ALTER_TABLE_ADD_COLUMN:
-            pairing, sql_safe_passing = self._create_fields_pairing(fields, data, " ")
+            pairing, sql_safe_passing = self._create_fields_pairing(fields, data, " ", self._compact)
             sql_string = template[method].format(table=table, pairing=pairing)
         elif method is DBEnums.ALTER_TABLE_DROP_COLUMN:
             sql_string = template[method].format(table=table, column=fields[0])
@@ -372,7 +481,196 @@ class SqliteInterface(DBInterface):
                 exists_str = ""
             sql_string = template[method].format(exists=exists_str,
                                                  table=table)
+        elif method is DBEnums.INDEX:
+            if exists:
+                exists_str = "IF NOT EXISTS"
+            else:
+                exists_str = ""
+            sql_string = template[method].format(exists=exists_str,
+                                                 table=table,
+                                                 column=fields[0])
+        elif method is DBEnums.SEARCH:
+            sql_string = template[method].format(table=table,
+                                                 index=self._search_index_name(table))
+            sql_safe_passing = {"query": data[0], "limit": data[1]}
         return sql_string, sql_safe_passing
+
+    @classmethod
+    def _create_order_query(cls, where:str, safe:dict, order:Union[str, list]=None,
+                            limit:int=None, offset:int=None) -> str:
+        """Appends ORDER BY, LIMIT and OFFSET clauses to a where clause to use
+        internally by _create_sql_query
+        Arguments:
+            where: where clause
+            safe: dict with safe passing, limit and offset are added to it
+            order: field or list of fields, "-field" for descending order
+            limit: maximum number of rows
+            offset: number of rows to skip
+        Returns:
+            str with the clauses
+        """
+        clauses = [where] if where else []
+        parsed = parse_order(order)
+        if parsed:
+            clauses.append("ORDER BY "+", ".join([field+(" DESC" if descending else "")
+                                                  for field, descending in parsed]))
+        if limit is not None or offset:
+            clauses.append("LIMIT :limit")
+            safe["limit"] = -1 if limit is None else int(limit)
+        if offset:
+            clauses.append("OFFSET :offset")
+            safe["offset"] = int(offset)
+        return " ".join(clauses)
+
+    @classmethod
+    def _create_join_query(cls, table:str, other:str, on:dict, how:str, fields:list, filter:dict) -> Tuple[str, dict]:
+        """Creates sql join query of two tables to use internally by select_join
+        Arguments:
+            table: name of left table
+            other: name of right table
+            on: dict of the form {"field of table": "field of other"}
+            how: "inner" or "left"
+            fields: list of (table, field)
+            filter: filter with "table.field" keys
+        Returns:
+            str with the sql query and dict with safe passing
+        """
+        where, safe = cls._create_filter_query(filter)
+        sql = "SELECT {} FROM {} {} JOIN {} ON {} {};".format(
+            ", ".join([f'{name}.{field} AS "{name}.{field}"' for name, field in fields]),
+            table, how.upper(), other,
+            " AND ".join([f"{table}.{key} = {other}.{value}" for key, value in on.items()]),
+            where)
+        return sql, safe
+
+    @classmethod
+    def _search_index_name(cls, table:str) -> str:
+        """Returns the name of the FTS5 table indexing the given table
+        Arguments:
+            table: name of the indexed table
+        """
+        return table+"__search"
+
+    def _has_compact_columns(self) -> bool:
+        """Returns if any table of the database has columns of compact storage,
+        as those migrated by migrate_compact
+        """
+        return bool(self.conn.execute("SELECT name FROM sqlite_master WHERE type='table' "
+                                      "AND (sql LIKE '%EPOCHMICROS%' OR sql LIKE '%BOOLINT%') LIMIT 1;").fetchall())
+
+    def _compact_columns(self, table:str) -> frozenset:
+        """Returns the names of the columns of table storing datetimes as epoch
+        microseconds, by their declared type. Kept until the schema changes
+        Arguments:
+            table: name of the table, "schema.table" for attached files
+        """
+        columns = self._columns.get(table)
+        if columns is None:
+            schema, _, name = table.rpartition(".")
+            pragma = f"PRAGMA {schema}.table_info({name});" if schema else f"PRAGMA table_info({name});"
+            columns = frozenset([item["name"] for item in self.conn.execute(pragma).fetchall()
+                                 if item["type"].upper() == "EPOCHMICROS"])
+            self._columns[table] = columns
+        return columns
+
+    def _rowid_column(self, table:str) -> str:
+        """Returns the name of the INTEGER PRIMARY KEY column of table, alias of
+        its rowid, or None. Kept until the schema changes
+        Arguments:
+            table: name of the table, "schema.table" for attached files
+        """
+        if table not in self._rowids:
+            schema, _, name = table.rpartition(".")
+            pragma = f"PRAGMA {schema}.table_info({name});" if schema else f"PRAGMA table_info({name});"
+            keys = [item for item in self.conn.execute(pragma).fetchall() if item["pk"]]
+            self._rowids[table] = keys[0]["name"] if len(keys) == 1 and keys[0]["type"].upper() == "INTEGER" else None
+        return self._rowids[table]
+
+    @classmethod
+    def _to_epoch_micros(cls, value:Any) -> Any:
+        """Adapts datetimes in a value or in the operations of a filter to epoch microseconds
+        """
+        if isinstance(value, datetime.datetime):
+            return to_epoch_micros(value)
+        if isinstance(value, (list, tuple)):
+            return type(value)([cls._to_epoch_micros(item) for item in value])
+        return value
+
+    def _adapt_filter(self, filter:dict, table:str, *others:str) -> dict:
+        """Adapts datetimes in a filter to the columns they are compared with
+        Arguments:
+            filter: filter to adapt, not modified
+            table: name of the table of "field" keys
+            others: names of other tables of "table.field" keys
+        Returns:
+            the filter adapted
+        """
+        if not filter:
+            return filter
+        columns = set(self._compact_columns(table))
+        for name in (table,)+others:
+            columns.update([name+"."+column for column in self._compact_columns(name)])
+        if not columns:
+            return filter
+        return {key: self._to_epoch_micros(value) if key in columns else value for key, value in filter.items()}
+
+    def _adapt_data(self, table:str, fields:list, data:list) -> list:
+        """Adapts datetimes of values or lists of values paired with fields to
+        the columns they are written in
+        Arguments:
+            table: name of the table
+            fields: list of fields
+            data: list of values or list of lists of values in fields order
+        Returns:
+            the data adapted
+        """
+        columns = self._compact_columns(table)
+        if not columns or not any([field in columns for field in fields]):
+            return data
+        if data and isinstance(data[0], list):
+            return [self._adapt_data(table, fields, item) for item in data]
+        return [self._to_epoch_micros(value) if field in columns else value for field, value in zip(fields, data)]
+
+    def bump_version(self, table:str=None) -> NoReturn:
+        """Increases the write counter of a table, forgetting declared types on
+        changes of schema. See DBInterface
+        """
+        if table is None:
+            self._columns.clear()
+            self._rowids.clear()
+        super().bump_version(table)
+
+    def _execute(self, sql:str, safe:Union[dict, list]={}) -> sqlite3.Cursor:
+        """Executes a query with safe passing values in the cursor of the
+        current thread. A list of dicts is executed with executemany.
+        Arguments:
+            sql: sql query
+            safe: dict or list of dicts with values
+        Returns:
+            the cursor
+        """
+        if isinstance(safe, list):
+            return self.cursor.executemany(sql, safe)
+        return self.cursor.execute(sql, safe)
+
+    def _fetch(self, sql:str, safe:dict={}, row_factory:type=None) -> Tuple[tuple, list]:
+        """Fetches all rows of a query in its own cursor with the given row_factory
+        instead of dict_factory
+        Arguments:
+            sql: sql query
+            safe: dict with values
+            row_factory: row_factory of the cursor. Tuples by default
+        Returns:
+            tuple with names of columns, list of rows
+        """
+        cursor = self.conn.cursor()
+        cursor.row_factory = row_factory
+        try:
+            rows = cursor.execute(sql, safe).fetchall()
+            return tuple([column[0] for column in cursor.description]), rows
+        finally:
+            cursor.close()
+
     # Connection Methods
 
     def connect(self) -> NoReturn:
@@ -381,14 +679,135 @@ class SqliteInterface(DBInterface):
         self._conn[threading.currentThread()] = sqlite3.connect(self._database, detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES)
         self._conn[threading.currentThread()].row_factory = dict_factory
         self._cursor[threading.currentThread()] = self._conn[threading.currentThread()].cursor()
+        if self._attached:
+            self._attach()
+
+    def attach(self, path:str, schema:str) -> NoReturn:
+        """Attaches another database file, so its tables can be used as
+        "schema.table" in queries of this database, in a single transaction.
+        Connections opened later attach it too, those of other threads already
+        opened do it when attach is called from them. Done once by connection
+        Arguments:
+            path: path of the database file, created if needed
+            schema: name to qualify its tables with
+        """
+        if not re.fullmatch(r"\w+", schema):
+            raise Exception(f"Schema not allowed: {schema}")
+        self._attached[schema] = path
+        self._attach()
+
+    def _attach(self) -> NoReturn:
+        """Attaches the files not attached yet in the connection of current thread
+        """
+        attached = [row["name"] for row in self.conn.execute("PRAGMA database_list;").fetchall()]
+        for schema, path in self._attached.items():
+            if schema not in attached:
+                self.conn.execute(f"ATTACH DATABASE :path AS {schema};", {"path": path})
 
     def disconnect(self) -> NoReturn:
         """Disconnects from database.
         """
         self.conn.close()
         del(self._conn[threading.currentThread()])
+        self._cursor.pop(threading.currentThread(), None)
+        self._data_versions.pop(threading.currentThread(), None)
+        self._depth.pop(threading.currentThread(), None)
+        self._hooks.pop(threading.currentThread(), None)
+
+    def _commit(self) -> NoReturn:
+        """Commits current connection unless a transaction is open in current thread
+        """
+        if not self._depth.get(threading.currentThread()):
+            self.conn.commit()
+
+    @contextmanager
+    def transaction(self, database:str=None):
+        """Groups writes made in current thread in one transaction: they are
+        committed at the end of the outermost transaction or rolled back if an
+        exception is raised. Nested transactions join the outermost one.
+        Arguments:
+            database: name of database. Database already set by default
+        """
+        thread = threading.currentThread()
+        self._depth[thread] = self._depth.get(thread, 0) + 1
+        try:
+            if self._depth[thread] == 1 and not self.conn.in_transaction:
+                self.conn.execute("BEGIN") # So creations of tables are rolled back too
+            yield self
+        except BaseException:
+            if self._depth[thread] == 1:
+                self.conn.rollback()
+                self.bump_version(None) # Versions bumped by rolled back writes
+                for _, rollback in self._hooks.pop(thread, []):
+                    if rollback is not None:
+                        rollback()
+            raise
+        else:
+            if self._depth[thread] == 1:
+                self.conn.commit()
+        finally:
+            self._depth[thread] -= 1
+        if not self._depth[thread]: # Called out of the transaction, so they can write
+            for callback, _ in self._hooks.pop(thread, []):
+                callback()
+
+    def in_transaction(self) -> bool:
+        """Returns if a transaction is open in current thread
+        """
+        return bool(self._depth.get(threading.currentThread()))
+
+    def after_commit(self, callback:Callable, rollback:Callable=None) -> NoReturn:
+        """Calls callback once the outermost transaction of current thread is
+        committed, or rollback if it's rolled back. At once if there is no
+        transaction open
+        Arguments:
+            callback: callable without arguments
+            rollback: callable without arguments. Nothing by default
+        """
+        if not self.in_transaction():
+            callback()
+        else:
+            self._hooks.setdefault(threading.currentThread(), []).append((callback, rollback))
+
+    def data_version(self, table:str=None) -> int:
+        """Returns PRAGMA data_version of the connection of current thread. It
+        changes when other connections commit, from other threads or processes
+        Arguments:
+            table: name of table. Not needed, the value is the same for all tables
+        """
+        return self.conn.execute("PRAGMA data_version;").fetchone()["data_version"]
+
+    def schema_version(self, database:str=None) -> int:
+        """Returns PRAGMA schema_version, changed by sqlite with every change of
+        schema from any connection
+        Arguments:
+            database: name of database. Database already set by default
+        """
+        return self.conn.execute("PRAGMA schema_version;").fetchone()["schema_version"]
+
+    def _check_data_version(self) -> NoReturn:
+        """Checks PRAGMA data_version of the connection of current thread. If it
+        has changed, the version of every table is bumped
+        """
+        version = self.data_version()
+        if self._data_versions.get(threading.currentThread()) != version:
+            self._data_versions[threading.currentThread()] = version
+            self.bump_version(None)
 
     # Tables operations
+    def check_table_exists(self, table:str, database:str=None) -> bool:
+        """Checks if table exists.
+        Arguments:
+            table: Name of the table to check
+            database: Name of the database to check. Database already set by default.
+        Returns:
+            True: Table exists
+            False: Table doesn't exists
+        """
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=:table;",
+                            {"table": table})
+        return self.cursor.fetchone() is not None
+
     def create_table(self, table:str, fields:dict={}, data:list=[], exists:bool=True, database:str=None) -> NoReturn:
         """Creates table with fields definition
             To be implemented in child class.
@@ -400,6 +819,10 @@ class SqliteInterface(DBInterface):
                 {"id": [int, DBEnums.PRIMARY],
                  "foo": str,
                  "bar": datatime.datetime}
+                 DBEnums.INDEX may be added to any field definition to create
+                 an index on it. DBEnums.SORTED too, as sqlite indexes are sorted.
+                 DBEnums.AUTOINCREMENT after DBEnums.PRIMARY keeps ids of
+                 deleted rows from being given again.
                  fields also accepts a list with a list of fields, but in this
                  case data argument becomes mandatory
             data: list of types paired with fields. Not necessary if fields is dict
@@ -428,7 +851,15 @@ class SqliteInterface(DBInterface):
                       exists=exists)
         sql, safe = self._create_sql_query(**kwargs)
         self.cursor.execute(sql, safe)
-        self.conn.commit()
+        for index, item in enumerate(data):
+            if isinstance(item, (list, tuple)) and (DBEnums.INDEX in item or DBEnums.SORTED in item):
+                sql, safe = self._create_sql_query(method=DBEnums.INDEX,
+                                                   table=table,
+                                                   fields=[fields[index]],
+                                                   exists=True)
+                self.cursor.execute(sql, safe)
+        self._commit()
+        self.bump_version(None)
 
     def drop_table(self, table:str=None, database:str=None) -> NoReturn:
         """Drops selected table
@@ -442,55 +873,211 @@ class SqliteInterface(DBInterface):
         sql, safe = self._create_sql_query(method=DBEnums.DROP_TABLE,
                                             table=table)
         self.cursor.execute(sql, safe)
+        self.bump_version(None)
 
     # Executings
 
-    def select(self, filter:dict=None, table:str=None, fields:list=None, database:str=None) -> Data:
+    def select(self, filter:dict=None, table:str=None, fields:list=None, database:str=None, row_type:RowTypes=RowTypes.DICT,
+               order:Union[str, list]=None, limit:int=None, offset:int=None) -> Data:
         """Selects data in database and table with set_filter
         Arguments:
             filter: filter to use. Filter already set by default
             table: name of table. Table already set by default
             fields: list of fields to get. All fields by default
             database: name of database. Database already set by default
+            row_type: RowTypes member. Tuples, sqlite3.Row and records skip dict_factory
+            order: field or list of fields to sort by, "-field" for descending order
+            limit: maximum number of rows. All by default
+            offset: number of rows to skip. None by default
         Returns:
             Data(list of dicts) with results. If only one given a list of len==1
             will be returned
         """
         filter, table, fields, database = super().select(filter, table, fields, database)
+        sql, safe = self._create_sql_query(method=DBEnums.SELECT,
+                                            table=table,
+                                            fields=fields,
+                                            filter=filter,
+                                            order=order,
+                                            limit=limit,
+                                            offset=offset)
+        return self._cached_select(sql, safe, table, row_type)
+
+    def select_join(self, other:str, on:dict, how:str="inner", fields:list=None, filter:dict=None,
+                    table:str=None, database:str=None, row_type:RowTypes=RowTypes.DICT) -> Iterator:
+        """Selects rows of table joined with rows of other table in a single
+        query. Rows are fetched by CHUNK in its own cursor while they are read.
+        Arguments:
+            other: name of the table to join
+            on: dict of the form {"field of table": "field of other"}
+            how: "inner" or "left", see DBInterface.select_join
+            fields: list of fields as "table.field", or "field" of table. All
+                fields of both tables by default
+            filter: filter to use, with fields as in fields. Filter already set by default
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+            row_type: RowTypes.DICT or RowTypes.TUPLE
+        Returns:
+            iterator of rows, dicts with "table.field" keys or tuples in fields order
+        """
+        table, on, how, fields, filter, database = self._join_defaults(other, on, how, fields, filter, table, database)
+        sql, safe = self._create_join_query(table, other, on, how, fields, self._adapt_filter(filter, table, other))
+        cursor = self.conn.cursor()
+        if row_type is RowTypes.TUPLE:
+            cursor.row_factory = None
+        cursor.execute(sql, safe)
+        def rows():
+            try:
+                while data := cursor.fetchmany(CHUNK):
+                    yield from data
+            finally:
+                cursor.close()
+        return rows()
+
+    def select_union(self, tables:list, filter:dict=None, fields:list=None, database:str=None,
+                     row_type:RowTypes=RowTypes.DICT, order:Union[str, list]=None, limit:int=None,
+                     offset:int=None) -> Data:
+        """Selects rows with the same filter from several tables with the same
+        columns in a single query (UNION ALL). Not kept by the SelectCache
+        Arguments:
+            tables: list of names of tables
+            filter: filter to use. Filter already set by default
+            fields: list of fields to get. All fields by default
+            database: name of database. Database already set by default
+            row_type: RowTypes member
+            order: field or list of fields to sort by, "-field" for descending order
+            limit: maximum number of rows. All by default
+            offset: number of rows to skip. None by default
+        Returns:
+            Data with results
+        """
+        filter, table, fields, database = super().select(filter, tables[0], fields, database)
+        selects, safe = [], {}
+        for index, table in enumerate(tables): # Values adapted to the columns of every table
+            where_str, values = self._create_filter_query(self._adapt_filter(filter, table))
+            selects.append(f"SELECT * FROM {table} " + re.sub(r":filter", f":union{index}filter", where_str))
+            safe.update({f"union{index}{key}": value for key, value in values.items()})
+        union = " UNION ALL ".join(selects)
+        sql = "SELECT {fields} FROM ({union}) {clauses};".format(fields=", ".join(fields) or "*", union=union,
+                                                                 clauses=self._create_order_query("", safe, order, limit, offset))
+        return self._select(sql, safe, table, row_type)
+
+    def count(self, filter:dict=None, table:str=None, database:str=None) -> int:
+        """Returns the number of rows in table with filter without retrieving them
+        Arguments:
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        filter, table, fields, database = super().select(filter, table, None, database)
+        sql, safe = self._create_sql_query(method=DBEnums.COUNT,
+                                            table=table,
+                                            filter=filter)
+        return self._cached_select(sql, safe, table, RowTypes.TUPLE)[0][0]
+
+    def _cached_select(self, sql:str, safe:dict, table:str, row_type:RowTypes) -> Data:
+        """Runs a select query through the SelectCache if enabled
+        Arguments:
+            sql: sql query
+            safe: dict with values
+            table: name of table
+            row_type: RowTypes member
+        """
+        if self._cache is None or self.in_transaction():
+            return self._select(sql, safe, table, row_type) # Uncommitted data is not kept
+        key = (sql, tuple(safe.items()), row_type)
+        try:
+            hash(key)
+        except TypeError:
+            return self._select(sql, safe, table, row_type)
+        self._check_data_version()
+        version = self.table_version(table)
+        data = self._cache.get(key, version)
+        if data is MISS:
+            data = self._select(sql, safe, table, row_type)
+            self._cache.put(key, version, data)
+        if row_type is RowTypes.DICT:
+            return Data([dict(row) for row in data]) # Kept ones must not be changed
+        return Data(data)
+
+    def _select(self, sql:str, safe:dict, table:str, row_type:RowTypes) -> Data:
+        """Runs a select query and returns rows as given by row_type
+        Arguments:
+            sql: sql query
+            safe: dict with values
+            table: name of table
+            row_type: RowTypes member
+        """
+        if row_type is RowTypes.DICT:
+            return Data(self._execute(sql, safe).fetchall())
+        names, rows = self._fetch(sql, safe, sqlite3.Row if row_type is RowTypes.ROW else None)
+        if row_type is RowTypes.RECORD:
+            rows = list(map(record_type(table, names)._make, rows))
+        return Data(rows)
+
+    def select_columns(self, filter:dict=None, table:str=None, fields:list=None, database:str=None, use_numpy:bool=False) -> Columns:
+        """Selects data in database and table in a column oriented result.
+        Rows are fetched as tuples, so no dict is created by row.
+        Arguments:
+            filter: filter to use. Filter already set by default
+            table: name of table. Table already set by default
+            fields: list of fields to get. All fields by default
+            database: name of database. Database already set by default
+            use_numpy: returns numpy arrays for numbers if numpy is installed
+        Returns:
+            Columns with results
+        """
+        filter, table, fields, database = super().select(filter, table, fields, database)
         sql, safe = self._create_sql_query(method=DBEnums.SELECT,
                                             table=table,
                                             fields=fields,
                                             filter=filter)
-        self.cursor.execute(sql, safe)
-        return Data(self.cursor.fetchall())
+        names, rows = self._fetch(sql, safe)
+        return Columns.from_rows(names, rows, use_numpy)
 
-    def insert(self, data:dict, table:str=None, database:str=None) -> NoReturn:
+    def insert(self, data:dict, table:str=None, database:str=None) -> list:
         """Inserts data in database and table
         Arguments:
             data: dict or list of dicts with the same keys with data to be inserted
             table: name of table. Table already set by default
             database: name of database. Database already set by default
+        Returns:
+            list with the INTEGER PRIMARY KEY of every row inserted, in order.
+            None if the table has not one
         """
         table, fields, values, database = super().insert(data, database=database, table=table)
-        sql, safe = self._create_sql_query(method=DBEnums.INSERT,
-                                            table=table,
-                                            fields=fields,
-                                            data=values)
-        if isinstance(safe, dict):
-            self.cursor.execute(sql, safe)
-        elif isinstance(safe, list):
-            self.cursor.executemany(sql, safe)
-        self.conn.commit()
-
-    def update(self, data:dict, table:str=None, filter:dict=None, database:str=None) -> NoReturn:
+        rows = [values] if isinstance(data, dict) else values
+        key = self._rowid_column(table)
+        position = fields.index(key) if key in fields else None
+        given = [row for row in rows if position is not None and row[position] is not None]
+        missing = [row for row in rows if position is None or row[position] is None]
+        for group in (given, missing): # Rows without key last, so their rowids are consecutive
+            if group:
+                sql, safe = self._create_sql_query(method=DBEnums.INSERT,
+                                                    table=table,
+                                                    fields=fields,
+                                                    data=group if len(group) > 1 else group[0])
+                last = self._execute(sql, safe).lastrowid
+        if key is not None and len(missing) > 1: # Not given by executemany
+            last = self.conn.execute("SELECT last_insert_rowid() AS rowid;").fetchone()["rowid"]
+        self._commit()
+        self.bump_version(table)
+        if key is None:
+            return None
+        generated = iter(range(last-len(missing)+1, last+1) if missing else ())
+        return [next(generated) if position is None or row[position] is None else row[position] for row in rows]
+
+    def update(self, data:dict, table:str=None, filter:dict=None, database:str=None) -> int:
         """Updates data in database and table with given filter
             It prepares from dict in data the lists of values and fields to be
             used in _create_sql_query
         Arguments:
-            data: dict with data to be updated
+            data: dict with data to be updated. DBEnums.INCREMENT adds 1
             filter: filter to use. Filter already set by default
             table: name of table. Table already set by default
             database: name of database. Database already set by default
+        Returns:
+            number of rows changed
         """
         filter, table, fields, values, database = super().update(data, filter=filter, database=database, table=table)
         sql, safe = self._create_sql_query(method=DBEnums.UPDATE,
@@ -498,8 +1085,10 @@ class SqliteInterface(DBInterface):
                                             fields=fields,
                                             data=values,
                                             filter=filter)
-        self.cursor.execute(sql, safe)
-        self.conn.commit()
+        count = self._execute(sql, safe).rowcount
+        self._commit()
+        self.bump_version(table)
+        return count
 
     def delete(self, filter:dict=None, table:str=None, database:str=None) -> NoReturn:
         """Removes data in database and table with given filter
@@ -512,8 +1101,34 @@ class SqliteInterface(DBInterface):
         sql, safe = self._create_sql_query(method=DBEnums.DELETE,
                                             table=table,
                                             filter=filter)
-        self.cursor.execute(sql, safe)
-        self.conn.commit()
+        self._execute(sql, safe)
+        self._commit()
+        self.bump_version(table)
+
+    def move(self, filter:dict, destination:str, limit:int=None, table:str=None, database:str=None) -> int:
+        """Moves the rows of table with filter to destination, a table with the
+        same columns, with one INSERT ... SELECT and one DELETE in a transaction
+        Arguments:
+            filter: filter of the rows to move
+            destination: name of the table receiving the rows, "schema.table"
+                for attached files
+            limit: maximum number of rows to move, lowest rowids first. All by default
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            number of rows moved
+        """
+        filter, table, fields, database = super().select(filter, table, None, database)
+        where_str, safe = self._create_filter_query(self._adapt_filter(filter, table))
+        keys = f"SELECT rowid FROM {table} " + self._create_order_query(where_str, safe, "rowid", limit)
+        columns = ", ".join(self._fetch(f"SELECT * FROM {table} LIMIT 0;")[0])
+        with self.transaction():
+            count = self._execute(f"INSERT INTO {destination} ({columns}) SELECT {columns} FROM {table} "
+                                  f"WHERE rowid IN ({keys});", safe).rowcount
+            self._execute(f"DELETE FROM {table} WHERE rowid IN ({keys});", safe)
+        self.bump_version(table)
+        self.bump_version(destination)
+        return count
 
     #Table Alterations
     def alter_table_rename_table(self, new_name:str, table:str=None, database:str=None) -> NoReturn:
@@ -528,7 +1143,8 @@ class SqliteInterface(DBInterface):
                                             table=table,
                                             data=[new_name])
         self.cursor.execute(sql, safe)
-        self.conn.commit()
+        self._commit()
+        self.bump_version(None)
 
     def alter_table_rename_column(self, column:str, new_name:str, table:str=None, database:str=None) -> NoReturn:
         """Changes name of column in table
@@ -544,7 +1160,8 @@ class SqliteInterface(DBInterface):
                                             fields=[column],
                                             data=[new_name])
         self.cursor.execute(sql, safe)
-        self.conn.commit()
+        self._commit()
+        self.bump_version(None)
 
     def alter_table_add_column(self, column:str, column_type:type, table:str=None, database:str=None) -> NoReturn:
         """Adds new column in table
@@ -560,7 +1177,8 @@ class SqliteInterface(DBInterface):
                                             fields=[column],
                                             data=[column_type])
         self.cursor.execute(sql, safe)
-        self.conn.commit()
+        self._commit()
+        self.bump_version(None)
 
     def alter_table_drop_column(self, column:str, table:str=None, database:str=None) -> NoReturn:
         """Drops columns in table
@@ -594,7 +1212,7 @@ class SqliteInterface(DBInterface):
         self.create_table(temp_table, fields=list(schema.keys()), data=list(schema.values()))
         sql = f"INSERT into {temp_table} SELECT * FROM {table}"
         self.conn.execute(sql)
-        self.conn.commit()
+        self._commit()
         self.drop_table(table=table)
         self.alter_table_rename_table(table, table=temp_table)
 
@@ -610,7 +1228,12 @@ class SqliteInterface(DBInterface):
                   "integer": int,
                   "real": float,
                   "blob": object,
-                  "null": None}
+                  "null": None,
+                  "boolean": bool,
+                  "boolint": bool,
+                  "timestamp": datetime.datetime,
+                  "epochmicros": datetime.datetime,
+                  "date": datetime.date}
         table, database = super().get_schema(table, database)
         sql, safe = self._create_sql_query(method=DBEnums.GET_SCHEMA,
                                             table=table)
@@ -656,5 +1279,266 @@ class SqliteInterface(DBInterface):
                                                    table=new_table,
                                                    exists=exists)
         sql = " AS ".join((sql_new, sql))
-        self.cursor.execute(sql, safe)
-        self.conn.commit()
+        self._execute(sql, safe)
+        self._commit()
+        self.bump_version(None)
+
+    #Full-text search
+    def create_search_index(self, fields:list, table:str=None, database:str=None) -> NoReturn:
+        """Creates an FTS5 external-content table over the given fields. It's
+        kept in sync by triggers, so no data is duplicated.
+        Arguments:
+            fields: list of names of the text fields to index
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        fields, table, database = super().create_search_index(fields, table, database)
+        index = self._search_index_name(table)
+        if self.check_table_exists(index):
+            return
+        columns = ", ".join(fields)
+        new = ", ".join(["new."+field for field in fields])
+        old = ", ".join(["old."+field for field in fields])
+        statements = [f"CREATE VIRTUAL TABLE {index} USING fts5({columns}, content='{table}');",
+                      f"""CREATE TRIGGER IF NOT EXISTS {index}_ai AFTER INSERT ON {table} BEGIN
+                            INSERT INTO {index}(rowid, {columns}) VALUES (new.rowid, {new});
+                          END;""",
+                      f"""CREATE TRIGGER IF NOT EXISTS {index}_ad AFTER DELETE ON {table} BEGIN
+                            INSERT INTO {index}({index}, rowid, {columns}) VALUES ('delete', old.rowid, {old});
+                          END;""",
+                      f"""CREATE TRIGGER IF NOT EXISTS {index}_au AFTER UPDATE ON {table} BEGIN
+                            INSERT INTO {index}({index}, rowid, {columns}) VALUES ('delete', old.rowid, {old});
+                            INSERT INTO {index}(rowid, {columns}) VALUES (new.rowid, {new});
+                          END;""",
+                      f"INSERT INTO {index}({index}) VALUES ('rebuild');"] # Indexes existing data
+        for sql in statements:
+            self.cursor.execute(sql)
+        self._commit()
+        self.bump_version(None)
+
+    def drop_search_index(self, table:str=None, database:str=None) -> NoReturn:
+        """Deletes the FTS5 table of the given table and its triggers
+        Arguments:
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, database = super().drop_search_index(table, database)
+        index = self._search_index_name(table)
+        for trigger in ("ai", "ad", "au"):
+            self.cursor.execute(f"DROP TRIGGER IF EXISTS {index}_{trigger};")
+        self.drop_table(table=index)
+        self._commit()
+        self.bump_version(None)
+
+    def search(self, query:str, table:str=None, limit:int=20, database:str=None, raw:bool=False) -> Data:
+        """Searches data in the FTS5 table of the given table ranked by bm25
+        Arguments:
+            query: words to search, see fts_query. Example: "o'brien pep*"
+            table: name of table. Table already set by default
+            limit: maximum number of results. 20 by default
+            database: name of database. Database already set by default
+            raw: whether query is given as FTS5 syntax, as "name: pepi OR juan".
+                False by default
+        Returns:
+            Data(list of dicts) with results, best ranked first
+        """
+        query, table, limit, database = super().search(query, table, limit, database)
+        if not raw:
+            query = fts_query(query)
+            if not query:
+                return Data([])
+        sql, safe = self._create_sql_query(method=DBEnums.SEARCH,
+                                           table=table,
+                                           data=[query, limit])
+        return Data(self._execute(sql, safe).fetchall())
+
+    def _search_ranked(self, query:str, table:str, limit:int) -> list:
+        """Searches data as search, giving the bm25 rank of every row so results
+        of several files can be merged. Lower ranks are better
+        Arguments:
+            query: FTS5 query, see fts_query
+            table: name of table
+            limit: maximum number of results
+        Returns:
+            list of tuples (rank, dict with row), best ranked first
+        """
+        index = self._search_index_name(table)
+        rows = self._execute(f"SELECT bm25({index}) AS _search_rank, {table}.* FROM {table} "
+                             f"JOIN {index} ON {table}.rowid = {index}.rowid WHERE {index} MATCH :query "
+                             "ORDER BY _search_rank LIMIT :limit;", {"query": query, "limit": limit}).fetchall()
+        return [(row.pop("_search_rank"), row) for row in rows]
+
+    #Change data capture
+    def create_change_log(self, table:str=None, keep:int=100000, database:str=None) -> NoReturn:
+        """Creates __changes table if needed and triggers after insert, update and
+        delete of table logging (seq, table_name, pk, op, ts). Changes of primary
+        key are logged as a delete and an insert. Entries over keep are pruned
+        by a trigger every tenth of keep insertions.
+        Arguments:
+            table: name of table. Table already set by default
+            keep: number of entries kept in __changes after pruning. Shared by all tables
+            database: name of database. Database already set by default
+        """
+        table, keep, database = super().create_change_log(table, keep, database)
+        primary_key = self.get_primary_key(table)
+        log = f"INSERT INTO {CHANGES} (table_name, pk, op, ts)"
+        statements = [f"CREATE TABLE IF NOT EXISTS {CHANGES} (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                      "table_name TEXT, pk, op TEXT, ts REAL);",
+                      f"CREATE INDEX IF NOT EXISTS {CHANGES}__table_name__index ON {CHANGES} (table_name, seq);",
+                      f"DROP TRIGGER IF EXISTS {CHANGES}_prune;",
+                      f"""CREATE TRIGGER {CHANGES}_prune AFTER INSERT ON {CHANGES}
+                          WHEN new.seq % {max(1, keep // 10)} = 0 BEGIN
+                            DELETE FROM {CHANGES} WHERE seq <= new.seq - {keep};
+                          END;""",
+                      f"""CREATE TRIGGER IF NOT EXISTS {table}{CHANGES}_ai AFTER INSERT ON {table} BEGIN
+                            {log} VALUES ('{table}', new.{primary_key}, 'I', {NOW});
+                          END;""",
+                      f"""CREATE TRIGGER IF NOT EXISTS {table}{CHANGES}_ad AFTER DELETE ON {table} BEGIN
+                            {log} VALUES ('{table}', old.{primary_key}, 'D', {NOW});
+                          END;""",
+                      f"""CREATE TRIGGER IF NOT EXISTS {table}{CHANGES}_au AFTER UPDATE ON {table} BEGIN
+                            {log} SELECT '{table}', old.{primary_key}, 'D', {NOW}
+                                WHERE old.{primary_key} IS NOT new.{primary_key};
+                            {log} VALUES ('{table}', new.{primary_key},
+                                CASE WHEN old.{primary_key} IS new.{primary_key} THEN 'U' ELSE 'I' END, {NOW});
+                          END;"""]
+        for sql in statements:
+            self.cursor.execute(sql)
+        self._commit()
+        self.bump_version(None)
+
+    def drop_change_log(self, table:str=None, database:str=None) -> NoReturn:
+        """Deletes the triggers logging changes of table. Its entries are kept until pruned
+        Arguments:
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        """
+        table, database = super().drop_change_log(table, database)
+        for trigger in ("ai", "ad", "au"):
+            self.cursor.execute(f"DROP TRIGGER IF EXISTS {table}{CHANGES}_{trigger};")
+        self._commit()
+        self.bump_version(None)
+
+    def changes_since(self, seq:int=0, table:str=None, database:str=None) -> Data:
+        """Gets changes of table logged in __changes after seq
+        Arguments:
+            seq: last sequence number already known. 0 by default, all of them
+            table: name of table. Table already set by default
+            database: name of database. Database already set by default
+        Returns:
+            Data(list of tuples) (seq, pk, op, ts) ordered by seq
+        """
+        seq, table, database = super().changes_since(seq, table, database)
+        if not self.check_table_exists(CHANGES):
+            return Data([])
+        _, rows = self._fetch(f"SELECT seq, pk, op, ts FROM {CHANGES} WHERE table_name=:table AND seq>:seq ORDER BY seq;",
+                              {"table": table, "seq": seq})
+        return Data(rows)
+
+    def oldest_change(self, table:str=None, database:str=None) -> int:
+        """Gets the oldest seq kept in __changes. Pruning is shared by all tables
+        Arguments:
+            table: name of table. Not needed, kept for compatibility
+            database: name of database. Database already set by default
+        Returns:
+            sequence number or None if __changes is empty
+        """
+        if not self.check_table_exists(CHANGES):
+            return None
+        _, rows = self._fetch(f"SELECT min(seq) FROM {CHANGES};")
+        return rows[0][0]
+
+    #Storage
+    @classmethod
+    def _compact_table_sql(cls, sql:str, name:str) -> str:
+        """Returns the CREATE TABLE clause of a table with its timestamp and
+        BOOLEAN columns declared for compact storage, and named name. Any
+        other definition and constraint is kept as it is
+        Arguments:
+            sql: CREATE TABLE clause of the table, as kept in sqlite_master
+            name: name of the new table
+        """
+        start, end = sql.index("("), sql.rindex(")")
+        definitions, current, depth, quote = [], "", 0, None
+        for char in sql[start+1:end]: # Split by commas out of parentheses and quotes
+            if quote is not None:
+                quote = None if char == quote else quote
+            elif char in "'\"`[":
+                quote = "]" if char == "[" else char
+            elif char in "()":
+                depth += 1 if char == "(" else -1
+            elif char == "," and depth == 0:
+                definitions.append(current)
+                current = ""
+                continue
+            current += char
+        definitions.append(current)
+        for index, definition in enumerate(definitions):
+            match = COLUMN.match(definition)
+            if match is None or match.group(1).upper() in ("CONSTRAINT", "PRIMARY", "UNIQUE", "CHECK", "FOREIGN"):
+                continue
+            declared = COMPACT[match.group(2).upper()]
+            definition = definition[:match.start(2)] + declared + definition[match.end(2):]
+            if declared == "EPOCHMICROS":
+                definition = re.sub(r"DEFAULT\s+CURRENT_TIMESTAMP", f"DEFAULT (CAST(({NOW}) * 1000000 AS INTEGER))",
+                                    definition, flags=re.IGNORECASE)
+            definitions[index] = definition
+        return f"CREATE TABLE {name} ({','.join(definitions)}){sql[end+1:]}"
+
+    def migrate_compact(self, tables:list=None) -> list:
+        """Migrates timestamp and BOOLEAN columns of existing tables to compact
+        storage. Tables are rebuilt in a single transaction keeping rowids,
+        constraints, AUTOINCREMENT sequences, indexes and triggers, so
+        full-text indexes remain valid. It cannot be run in a transaction
+        Arguments:
+            tables: list of names of tables to migrate. All of them by default
+        Returns:
+            list of names of migrated tables
+        """
+        conn = self.conn
+        if self.in_transaction() or conn.in_transaction:
+            raise RuntimeError("Tables cannot be migrated in an open transaction")
+        if tables is None:
+            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND sql LIKE 'CREATE TABLE%' "
+                                "AND name NOT LIKE 'sqlite_%';")
+            tables = [item["name"] for item in self.cursor.fetchall()]
+        migrated = []
+        conn.execute("BEGIN")
+        try:
+            sequences = conn.execute("SELECT name FROM sqlite_master WHERE name='sqlite_sequence';").fetchall()
+            for table in tables:
+                columns = conn.execute(f"PRAGMA table_info({table});").fetchall()
+                if not any([item["type"].upper() in COMPACT for item in columns]):
+                    continue
+                sql = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=:table;",
+                                   {"table": table}).fetchone()["sql"]
+                extras = conn.execute("SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') "
+                                      "AND tbl_name=:table AND sql IS NOT NULL;", {"table": table}).fetchall()
+                sequence = sequences and conn.execute("SELECT seq FROM sqlite_sequence WHERE name=:table;",
+                                                      {"table": table}).fetchall()
+                rows = conn.execute(f"SELECT rowid AS _migration_rowid, * FROM {table};").fetchall()
+                names = [item["name"] for item in columns]
+                temp_table = "_temp_"+table
+                conn.execute(self._compact_table_sql(sql, temp_table))
+                quoted = ", ".join(['"'+name.replace('"', '""')+'"' for name in names])
+                values = ", ".join(["?"]*(len(names)+1))
+                conn.executemany(f"INSERT INTO {temp_table} (rowid, {quoted}) VALUES ({values});",
+                                 [[to_epoch_micros(value) if isinstance(value, datetime.datetime) else value
+                                   for value in row.values()] for row in rows])
+                conn.execute(f"DROP TABLE {table};")
+                conn.execute(f"ALTER TABLE {temp_table} RENAME TO {table};")
+                if sequence: # Ids of deleted rows are not given again
+                    conn.execute("DELETE FROM sqlite_sequence WHERE name IN (:table, :temp);",
+                                 {"table": table, "temp": temp_table})
+                    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (:table, :seq);",
+                                 {"table": table, "seq": sequence[0]["seq"]})
+                for item in extras:
+                    conn.execute(item["sql"])
+                migrated.append(table)
+            conn.commit()
+            self._compact = self._compact or bool(migrated)
+            self.bump_version(None)
+        except Exception:
+            conn.rollback()
+            raise
+        return migrated
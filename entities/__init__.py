@@ -1 +1,7 @@
-from .entities import Item, Entity, set_timeout
+from .entities import Item, Entity, WriteModes, set_timeout
+from .items import ConflictError
+from .queryset import QuerySet
+from .archive import ArchivePolicy
+from .cache import FilterCache
+from .events import EventBus
+from .fields import ValidationError
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+__author__ = "Iván Uría"
+
+"""This module gives an archival policy for Entities growing forever, as logs of
+activity or emails. Old rows are moved in chunks to <table>__archive, in the
+same database or in another file attached to it, so queries of recent rows read
+a small table. Entity.get(include_archive=True) reads both in one query.
+Example of use:
+    activity = Entity(database, "activity", "Activity", {"created_at": datetime, "note": str},
+                      "Activity log", loop=loop,
+                      archive=ArchivePolicy("created_at", timedelta(days=548), path="archive.db"))
+    activity.archive() # Moves rows older than 18 months now, also run every hour in loop
+    activity.get({"note": ["LIKE", "%call%"]}) # Recent rows only
+    activity.get({"note": ["LIKE", "%call%"]}, include_archive=True) # All of them
+
+Classes:
+    ArchivePolicy: which rows of an Entity are moved to its archive, and when
+"""
+
+import asyncio
+from databases.databases import DBEnums
+from datetime import datetime, date, timedelta
+from threading import Lock
+from typing import NoReturn, Union
+from .items import CHUNK
+
+INTERVAL = 3600 # Seconds between runs of a scheduled archival
+SCHEMA = "archive" # Name of attached files
+SUFFIX = "__archive" # Of archive tables
+
+
+class ArchivePolicy:
+    """Policy moving rows of an Entity older than age to its archive table, in
+    transactions of chunk rows. The archive table has the columns of the
+    Entity, without indexes, and is created when first needed. Entities with a
+    policy are installed with ids not given again, so archived ones stay unique.
+    Arguments:
+        field: name of the datetime or date field with the age of rows
+        age: timedelta, or days, rows are kept in the Entity
+        path: sqlite file to keep the archive in, attached to the database of
+            the Entity. Same database by default
+        chunk: rows moved by transaction. CHUNK by default
+        interval: seconds between runs when scheduled. INTERVAL by default
+    Attributes:
+        moved: number of rows moved by all runs
+    Methods:
+        table: returns the name of the archive table of an Entity
+        prepare: creates the archive table of an Entity if needed
+        run: moves the old rows of an Entity
+        schedule: runs the policy of an Entity periodically in a loop
+        cancel: stops a scheduled Entity
+    """
+    def __init__(self, field:str, age:Union[timedelta, int], path:str=None, chunk:int=CHUNK,
+                 interval:float=INTERVAL) -> NoReturn:
+        self.field = field
+        self.age = age if isinstance(age, timedelta) else timedelta(days=age)
+        self.path = path
+        self.chunk = chunk
+        self.interval = interval
+        self.moved = 0
+        self._prepared = set() # (database, table) created
+        self._scheduled = {} # [loop, TimerHandle] by Entity
+        self._lock = Lock()
+
+    def table(self, entity:object) -> str:
+        """Returns the name of the archive table of entity, "archive.table" if
+        it's kept in another file, attached to the connection of current thread
+        """
+        name = entity.table+SUFFIX
+        if self.path is None:
+            return name
+        entity.database.attach(self.path, SCHEMA)
+        return f"{SCHEMA}.{name}"
+
+    def prepare(self, entity:object) -> str:
+        """Creates the archive table of entity, if not done yet, with the
+        columns of its table. Returns its name
+        """
+        table = self.table(entity)
+        with self._lock:
+            if (entity.database, table) not in self._prepared:
+                schema = entity.database.get_schema(entity.table)
+                entity.database.create_table(table, {field: [item for item in definition
+                                                             if not isinstance(item, DBEnums) or item is DBEnums.PRIMARY]
+                                                     for field, definition in schema.items()}, exists=True)
+                self._prepared.add((entity.database, table))
+        return table
+
+    def run(self, entity:object, now:datetime=None) -> int:
+        """Moves the rows of entity older than age to its archive, chunk rows
+        by transaction. Returns the number of rows moved
+        Arguments:
+            entity: Entity to archive
+            now: datetime to count age from. datetime.now() by default
+        """
+        table = self.prepare(entity)
+        cutoff = (now or datetime.now()) - self.age
+        definition = entity.fields[self.field].definition
+        if (definition[0] if isinstance(definition, (list, tuple)) else definition) is date:
+            cutoff = cutoff.date()
+        moved = 0
+        filter = {self.field: ["<", cutoff]}
+        while True:
+            with entity.database.transaction():
+                keys = entity._keys(filter, self.chunk) # Only for subscribers, see EventBus
+                chunk = {entity.primary_key: ["IN", keys]} if keys is not None else filter
+                count = entity.database.move(chunk, table, limit=self.chunk, table=entity.table) if keys != [] else 0
+                if count:
+                    entity.events.publish("archive", filter=filter, keys=keys)
+            moved += count
+            if count < self.chunk:
+                break
+        self.moved += moved
+        return moved
+
+    def schedule(self, entity:object, loop:asyncio.BaseEventLoop) -> NoReturn:
+        """Runs entity.archive in loop now and every interval seconds, until
+        cancelled. Exceptions are given to the exception handler of loop
+        """
+        def run():
+            if entity not in self._scheduled:
+                return # Cancelled
+            try:
+                entity.archive()
+            finally:
+                if entity in self._scheduled:
+                    self._scheduled[entity][1] = loop.call_later(self.interval, run)
+        with self._lock:
+            if entity in self._scheduled:
+                return
+            self._scheduled[entity] = [loop, None]
+        loop.call_soon_threadsafe(run)
+
+    def cancel(self, entity:object) -> NoReturn:
+        """Stops the scheduled runs of entity
+        """
+        with self._lock:
+            scheduled = self._scheduled.pop(entity, None)
+        if scheduled is not None and scheduled[1] is not None:
+            try:
+                scheduled[0].call_soon_threadsafe(scheduled[1].cancel)
+            except RuntimeError:
+                pass # Loop already closed
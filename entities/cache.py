@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+__author__ = "Iván Uría"
+
+"""This module gives a read-through cache of query results of an Entity. Only
+the primary keys of the Items found are kept, as Items themselves are kept by
+the identity map of Item. Entries are removed after ttl seconds or when the
+Entity writes in any of the columns they were filtered or ordered by. Other
+writes keep the entry, but its rows are got again by primary key once, as
+the Items kept may be stale.
+Example of use:
+    leads = Entity(database, "leads", "Leads", {"owner": int, "status": str},
+                   "Leads", cache=FilterCache(size=128, max_bytes=2**20, ttl=30))
+    leads.get({"owner": 3, "status": "open"}) # Run in database
+    leads.get({"owner": 3, "status": "open"}) # Items of the kept primary keys
+    leads.replace({"id": 1}, {"name": "Pepi"}) # Entry is kept, no filtered column, rows got again
+    leads.replace({"id": 1}, {"status": "won"}) # Entry is removed
+    leads.insert({"name": "Manuel"}) # Entry kept too, the new row has no owner nor status
+    leads.cache.stats()
+
+Classes:
+    FilterCache: LRU cache of primary keys by query with ttl and maximum bytes
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from databases.cache import MISS
+from typing import NoReturn, Hashable, Iterable
+
+TTL = 60 # Seconds an entry is kept by default
+
+
+class FilterCache:
+    """LRU cache of the primary keys got by queries of an Entity, with a
+    maximum of entries and bytes and a time to live. Threadsafe.
+    Arguments:
+        size: maximum number of entries
+        max_bytes: maximum bytes of all entries, approximated by sys.getsizeof
+        ttl: seconds an entry is kept. TTL by default
+    Attributes:
+        hits: number of valid entries found
+        misses: number of queries not found or expired
+        evictions: number of entries removed to keep size and bytes
+        expirations: number of entries found after ttl
+        invalidations: number of entries removed by writes
+        nbytes: bytes used by entries
+        hit_ratio: hits / (hits + misses)
+    Methods:
+        get: returns the primary keys of a query and the version they were got at
+        put: keeps the primary keys of a query with the columns it depends on
+        invalidate: removes entries depending on columns written
+        clear: removes all entries
+        stats: returns a dict with the instrumentation attributes
+    """
+    def __init__(self, size:int=256, max_bytes:int=2**20, ttl:float=TTL) -> NoReturn:
+        self.size = size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict() # {key: (expires, columns, all_rows, keys, nbytes, version)}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        """Returns the ratio of hits in all lookups. 0.0 if there weren't lookups
+        """
+        lookups = self.hits + self.misses
+        return lookups and self.hits / lookups or 0.0
+
+    def get(self, key:Hashable):
+        """Returns a tuple with the list of primary keys kept for key and the
+        version of the table they were got at, or MISS
+        Arguments:
+            key: hashable key of the query
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[3], entry[5]
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return MISS
+
+    def put(self, key:Hashable, keys:list, columns:Iterable=(), all_rows:bool=False,
+            version:Hashable=None) -> NoReturn:
+        """Keeps the primary keys got by a query. Entries bigger than
+        max_bytes are not kept
+        Arguments:
+            key: hashable key of the query
+            keys: list of primary keys found
+            columns: names of the columns the query is filtered or ordered by
+            all_rows: whether the query is not filtered, so it depends on
+                every row inserted or deleted
+            version: version of the table the keys were got at, see
+                DBInterface.table_version
+        """
+        nbytes = sys.getsizeof(keys) + sum([sys.getsizeof(value) for value in keys])
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic()+self.ttl, frozenset(columns), all_rows, list(keys), nbytes, version)
+            self.nbytes += nbytes
+            while len(self._entries) > self.size or self.nbytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, columns:Iterable=None, rows:bool=False) -> NoReturn:
+        """Removes the entries depending on any of the columns written
+        Arguments:
+            columns: names of the columns written. All entries by default
+            rows: whether rows were inserted, so entries depending on all rows
+                are removed too
+        """
+        columns = None if columns is None else set(columns)
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if columns is None or entry[1] & columns or (rows and entry[2]):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def _remove(self, key:Hashable) -> NoReturn:
+        self.nbytes -= self._entries.pop(key)[4]
+
+    def clear(self) -> NoReturn:
+        """Removes all entries. Instrumentation is kept
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        """Returns a dict with instrumentation
+        """
+        return {"entries": len(self._entries),
+                "bytes": self.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_ratio": self.hit_ratio}
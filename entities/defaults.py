@@ -8,14 +8,22 @@ Functions:
     get_entity: Creates and returns an Entity object from table name
     get_entities: Creates and returns all Entity object from database
     install_persistency: Creates tables __entities and __fields in database
+    install_many: Installs several entities in one transaction by database
+    load_metadata: Gets rows of __entities and __fields, from a snapshot if still valid
+    parse_definition: Gets the definition of a field from its saved string
+    register_type: Adds a type to be read in definitions of fields
 """
 
 import asyncio
+import json
+import os
 from .fields import Field, Fields
 from .entities import Entity
-from databases.databases import DBInterface, DBEnums
-from datetime import datetime
-from typing import NoReturn
+from databases.databases import DBInterface, DBEnums, RowTypes
+from datetime import datetime, date
+from typing import NoReturn, Union
+
+TYPES = {definition.__name__: definition for definition in (str, int, float, bool, bytes, object, datetime, date)}
 
 def persistent(database:DBInterface, *, loop:asyncio.BaseEventLoop=None) -> tuple:
     """Returns a tuple with two Entitiy: the entity of entities and the entity of fields
@@ -30,7 +38,8 @@ def persistent(database:DBInterface, *, loop:asyncio.BaseEventLoop=None) -> tupl
                      "table_name": [str, DBEnums.PRIMARY],
                      "description": str,
                      "parent": str,
-                     "parent_field": str})
+                     "parent_field": str,
+                     "track_changes": bool})
     entity = Entity(database, "__entities", "Entities",
                     ent_fields,
                     "Entities description",
@@ -49,6 +58,77 @@ def persistent(database:DBInterface, *, loop:asyncio.BaseEventLoop=None) -> tupl
                           loop=loop)
     return entity, fields_entity
 
+def register_type(definition:type, name:str=None) -> NoReturn:
+    """Adds a type to be read in definitions of fields saved in __fields
+    Arguments:
+        definition: type of fields
+        name: name saved in definitions. __name__ of definition by default
+    """
+    TYPES[name or definition.__name__] = definition
+
+def parse_definition(definition:str) -> Union[type, list]:
+    """Returns the definition of a field from the string saved in __fields,
+    "type" or "type,DBEnums.FLAG,...", without evaluating it
+    Arguments:
+        definition: saved string
+    """
+    parsed = []
+    for name in definition.split(","):
+        name = name.strip()
+        if name.startswith("DBEnums.") and name[8:] in DBEnums.__members__:
+            parsed.append(DBEnums[name[8:]])
+        elif name in TYPES:
+            parsed.append(TYPES[name])
+        else:
+            raise TypeError(f"Unknown type in definition of field: {name}")
+    return parsed if len(parsed) > 1 else parsed[0] # As defined by Entity
+
+def load_metadata(database:DBInterface, snapshot:str=None, *, loop:asyncio.BaseEventLoop=None) -> tuple:
+    """Returns rows of __entities and rows of __fields grouped by table, with
+    one select by table. If a snapshot file is given and the database knows its
+    schema_version, they are read from it while it's still the same or saved
+    in it otherwise. Entities are installed and uninstalled with schema changes.
+    The entities of __entities and __fields are always registered, see persistent.
+    Arguments:
+        database: DBInterface to play with
+        snapshot: path of a json file to keep them. Optional
+    Key Arguments:
+        loop: asyncronous loop to give a real-time actualization. Optional.
+    Returns:
+        list of dicts with rows of __entities, dict of the form
+        {"table_name": [[name, definition, description], ...]}
+    """
+    entity, fields_entity = persistent(database, loop=loop) # No query, needed by Entity.install
+    version = snapshot and database.schema_version()
+    if version is not None:
+        try:
+            with open(snapshot, encoding="utf-8") as file:
+                data = json.load(file)
+            if data["schema_version"] == version:
+                return data["entities"], data["fields"]
+        except (OSError, ValueError, KeyError):
+            pass # Missing or broken snapshot, built again
+    entities = list(entity.rows(row_type=RowTypes.DICT))
+    fields = {}
+    for table, name, definition, description in fields_entity.rows(fields=["table_name", "name", "definition", "description"]):
+        fields.setdefault(table, []).append([name, definition, description])
+    if version is not None:
+        with open(snapshot+".tmp", "w", encoding="utf-8") as file:
+            json.dump({"schema_version": version, "entities": entities, "fields": fields}, file)
+        os.replace(snapshot+".tmp", snapshot) # Never half written
+    return entities, fields
+
+def _build_entity(database:DBInterface, ent:dict, rows:list, loop:asyncio.BaseEventLoop=None) -> Entity:
+    """Returns an Entity from its row of __entities and its rows of __fields
+    """
+    table = ent["table_name"]
+    fields = Fields(database, table, [Field(database, table, name, parse_definition(definition), description=description)
+                                      for name, definition, description in rows])
+    fields.set_installed()
+    track_changes = bool(ent["track_changes"]) if "track_changes" in ent.keys() else False # Older catalogs
+    return Entity(database, table, ent["name"], fields, ent["description"], parent=ent["parent"], parent_field=ent["parent_field"],
+                  loop=loop, track_changes=track_changes)
+
 def get_entity(database:DBInterface, table:str, ent:dict=None, *, loop:asyncio.BaseEventLoop=None) -> Entity:
     """Returns an Entity instance of the indicated table.
     Arguments:
@@ -59,35 +139,38 @@ def get_entity(database:DBInterface, table:str, ent:dict=None, *, loop:asyncio.B
              "name": str,
              "description": str,
              "parent": str,
-             "parent_field": str}
+             "parent_field": str,
+             "track_changes": bool}
     Key Arguments:
         loop: asyncronous loop to give a real-time actualization. Optional.
     """
     if database in Entity.persistent and table in Entity.persistent[database]:
         return Entity.persistent[database][table]
     entity, fields_entity = persistent(database)
-    flst = fields_entity.get({"table_name": table})
-    fields = Fields(database, table, [Field(database, table, item["name"], eval(item["definition"]), description=item["description"]) for item in flst])
-    fields.set_installed()
+    rows = fields_entity.rows({"table_name": table}, fields=["name", "definition", "description"])
     if ent is None:
-        ent = entity.get({"table_name": table})[0]
+        ent = entity.rows({"table_name": table}, row_type=RowTypes.RECORD)[0]
     if ent:#TODO: raise especial exception if not exists
-        return Entity(database, ent["table_name"], ent["name"], fields, ent["description"], parent=ent["parent"], parent_field=ent["parent_field"], loop=loop)
+        return _build_entity(database, ent, rows, loop)
     else:
         return None
 
-def get_entities(database:DBInterface, *, loop:asyncio.BaseEventLoop=None) -> list:
-    """Returns a list of entities from database got from get_entity in a for loop
+def get_entities(database:DBInterface, *, loop:asyncio.BaseEventLoop=None, snapshot:str=None) -> dict:
+    """Returns a dict {name: Entity} of all entities from database, with one
+    select of __entities and one of __fields at most. See load_metadata
     Arguments:
         database: DBInterface to play with
     Key Arguments:
         loop: asyncronous loop to give a real-time actualization. Optional.
+        snapshot: path of a json file to keep metadata between startups. Optional
     """
-    entity, fields_entity = persistent(database, loop=loop)
-    entities_list = entity.get({})
+    entities, fields = load_metadata(database, snapshot, loop=loop)
     final = {}
-    for ent in entities_list:
-        final[ent["name"]] = get_entity(database, ent["table_name"], ent=ent)
+    for ent in entities:
+        if database in Entity.persistent and ent["table_name"] in Entity.persistent[database]:
+            final[ent["name"]] = Entity.persistent[database][ent["table_name"]]
+        else:
+            final[ent["name"]] = _build_entity(database, ent, fields.get(ent["table_name"], []), loop)
     return final
 
 def install_persistency(database:DBInterface) -> NoReturn:
@@ -98,3 +181,19 @@ def install_persistency(database:DBInterface) -> NoReturn:
     entity, fields_entity = persistent(database)
     entity.install()
     fields_entity.install()
+    if database.check_table_exists("__entities") and "track_changes" not in database.get_schema("__entities"):
+        database.alter_table_add_column("track_changes", bool, table="__entities") # Created by older versions
+
+def install_many(entities:list) -> NoReturn:
+    """Installs entities in one transaction by database, so a whole schema is
+    installed or none of it
+    Arguments:
+        entities: list of Entity
+    """
+    by_database = {}
+    for entity in entities:
+        by_database.setdefault(entity.database, []).append(entity)
+    for database, group in by_database.items():
+        with database.transaction():
+            for entity in group:
+                entity.install()
@@ -33,11 +33,18 @@ Classes:
     Entity: An interface to access data in database more friendly
 """
 
-from databases.databases import DBInterface, DBEnums
+from databases.databases import DBInterface, DBEnums, RowTypes
+from array import array
 from collections import defaultdict
 from .fields import Fields
-from .items import Item, set_timeout, TIMEOUT
-from threading import RLock
+from .archive import ArchivePolicy
+from .cache import FilterCache
+from .events import EventBus, OPS
+from .materialized import Materialized, LIMIT
+from .queryset import QuerySet
+from .items import Item, Refresher, WriteModes, set_timeout, TIMEOUT, WRITE_DELAY, VERSION, STRIPES
+from contextlib import contextmanager, nullcontext
+from threading import Lock, RLock, current_thread
 from typing import NoReturn, Any, Callable
 
 
@@ -55,6 +62,18 @@ class Entity:
         parent: name of the parent table of this entity
         parent_field: name of the field representing the parent
         loop: event loop to check changes
+        track_changes: logs inserts, updates and deletes in the change log on install
+        write_mode: WriteModes member, when changes of Items are saved. AUTOCOMMIT by default
+        write_delay: seconds to wait with WriteModes.DELAYED, which needs a loop
+        materialize: keeps all rows in memory to answer get, see Materialized.
+            True or the maximum number of rows to keep
+        cache: FilterCache keeping the primary keys got by get, or True for one
+            with defaults. None by default
+        versioned: adds a _version field counting the updates of every row, so
+            Items are saved only if nobody changed them meanwhile, without
+            locking the entity. See ConflictError
+        archive: ArchivePolicy moving old rows to an archive table, run every
+            interval in loop if given. None by default
     Atributes:
         children: list of entities depending on this entity
         database: DBInterface associated
@@ -64,16 +83,40 @@ class Entity:
         parent_field: name of the field associated to parent (must be PRIMARY)
         table: name of the table
         primary_key: name of the field wich is primary key
+        track_changes: whether changes are logged
+        write_mode: when changes of Items are saved
+        deferred: whether changes of Items are kept to be saved later in current thread
+        materialized: Materialized copy of the rows or None
+        cache: FilterCache of queries or None
+        versioned: whether rows have a _version field and Items are saved conditionally
+        events: EventBus of the subscriptions to its writes
+        archive_policy: ArchivePolicy of old rows or None
     Methods:
+        aggregate: returns count, sum, min, max and mean of fields
+        archive: moves old rows to the archive table, see ArchivePolicy
+        changes_since: returns inserted, updated and deleted primary keys after a seq
         close: closes connections. Called from __del__
+        columns: returns data as Columns, without creating Items
         delete: deletes data from database
-        get: returns a list of Item
+        get: returns a lazy QuerySet of Item, prefetching relations if asked,
+            also of archived rows if asked
         insert: insert data in database
         install: installs in database
+        lock_for: returns the lock of the stripe of a primary key, held by its Item
+        join: returns rows joined with a related entity in one query, or pairs of Items
         uninstall: removes table from database and self from memory
-        replace: changes data from database
+        relation: returns the entity, cardinality and fields relating a child or the parent
+        relations: returns the child entities, also those loaded by get_entity
+        replace: changes data from database, returns the number of rows changed
+        rows: returns raw rows without creating Items, as tuples by default
+        save: saves changes kept in Items in one transaction
+        search: returns a list of Item ranked by full-text relevance. FTS5 syntax with raw=True
         set_child: appends a child to children
+        set_archive: sets the ArchivePolicy, scheduled in the given loop or its own one
         set_database: sets new database
+        subscribe: calls a function with the writes committed, see EventBus
+        unsubscribe: removes a subscription
+        transaction: groups writes in a transaction, saving Items changed at the end
         add_field: adds a new field and changes database if needed
         change_field: changes a field configuration
         change_fields: changes fields configurations
@@ -86,11 +129,25 @@ class Entity:
         pepi = customers[1]
         george = customers[2]
         customers.update({"name": "George"}, {"age": 24})
+        contacts = Entity(sqlite, "contacts", "Contacts",
+                          {"name": [str, DBEnums.SEARCHABLE], "notes": [str, DBEnums.SEARCHABLE]},
+                          "Searchable contacts")
+        contacts.install()
+        contacts.search("pepi*", limit=10)
+        customers.get({"age": [">", 20]}).order_by("-age")[:10] # Run when consumed
+        for customer in customers.get(prefetch=["contacts.calls"]): # 3 queries in all
+            customer.related("contacts")[0].related("calls")
+        customers.aggregate(["age"]) # {"age": {"count": 2, "sum": 56, "min": 24, "max": 32, "mean": 28.0}}
+        with customers.transaction(): # One update by Item and one commit
+            pepi["name"], pepi["age"] = "Pepa", 33
+            george["age"] = 25
+        customers.subscribe(print, ops=["update"], filter={"age": [">", 30]}) # After every commit
     """
     persistent = defaultdict(dict)
     # A dictionary with an entity by database. Why? Suddenly my intuition sais I must do this
 
-    def __new__(cls, database, table, name, fields, description, parent="", parent_field="", loop=None):
+    def __new__(cls, database, table, name, fields, description, parent="", parent_field="", loop=None, track_changes=False,
+                write_mode=WriteModes.AUTOCOMMIT, write_delay=WRITE_DELAY, materialize=False, cache=None, versioned=False, archive=None):
         if ":" in table:
             parent, table = table.split(":")[-2:]
             if parent in cls.persistent[database]:
@@ -120,7 +177,8 @@ class Entity:
         else:
             return super().__new__(cls)
 
-    def __init__(self, database, table, name, fields, description, parent="", parent_field="", loop=None):
+    def __init__(self, database, table, name, fields, description, parent="", parent_field="", loop=None, track_changes=False,
+                write_mode=WriteModes.AUTOCOMMIT, write_delay=WRITE_DELAY, materialize=False, cache=None, versioned=False, archive=None):
         if ":" in table:
             parent, table = table.split(":")[-2:]
             if parent in self.persistent[database]:
@@ -133,15 +191,22 @@ class Entity:
                 raise AttributeError("Parent must be previously defined")
         if ":" in name:
             name = name.split(":")[-1]
+        if self.persistent[database].get(table) is self:
+            return # Given by __new__, already initialized: its Items, changes and subscriptions are kept
         assert isinstance(database, DBInterface)
         assert isinstance(fields, dict)
+        if write_mode is WriteModes.DELAYED and loop is None:
+            raise AttributeError("A loop is needed to save changes later")
         self._name = name
         self._table = table
         self.description = description
         if isinstance(fields, Fields):
             self._fields = fields
         else:
+            if versioned and VERSION not in fields:
+                fields = {**fields, VERSION: int}
             self._fields = Fields(database, table, fields)
+        self.versioned = VERSION in self._fields # Also when loaded from database
         self._database = database
         self._parent = parent
         if isinstance(parent, Entity):
@@ -149,9 +214,25 @@ class Entity:
         self._parent_field = parent_field
         self._children = []
         self._primary_key = None
-        self.lock = RLock()
+        self.lock = self._fields.lock # Only for changes of schema, Items hold the lock of their stripe
+        self._stripes = [RLock() for _ in range(STRIPES)]
+        self._dirty_lock = Lock()
         self._loop = loop
+        self.track_changes = track_changes
+        self.write_mode = write_mode
+        self.write_delay = write_delay
+        self._dirty = {} # Items with changes not saved {id: Item}
+        self._transactions = {} # Depth of transactions by thread
+        self._save_scheduled = False
+        self._materialized = None
+        if materialize:
+            self._materialized = Materialized(self, LIMIT if materialize is True else materialize)
+        self._cache = FilterCache() if cache is True else cache if isinstance(cache, FilterCache) else None
+        self._events = EventBus(self)
+        self._archive = None
         self.persistent[database][self.table] = self
+        if archive is not None:
+            self.set_archive(archive)
 
     def __getitem__(self, key):
         if isinstance(key, slice):
@@ -161,19 +242,16 @@ class Entity:
                 data = self.get({self.primary_key: [(">=", key.start), ("<=", key.stop)]})
             else:
                 raise TypeError(f"Only int and string in the first field allowed, {type(key.start)}")
-            return [Item(self, item, loop=self._loop) for item in data]
+            return data
         elif isinstance(key, (int, str)):
-            item = self.get({self.primary_key: key})
-            if item:
-                return Item(self, item[0], loop=self._loop)
+            return self.get({self.primary_key: key}).first()
         else:
             raise TypeError("Only int and slice alloed")
 
     def __setitem__(self, key, values):
         if isinstance(key, (int, str)):
-            item = self.get({self.primary_key: key})
-            if item:
-                item = Item(self, item[0], loop=self._loop)
+            item = self.get({self.primary_key: key}).first()
+            if item is not None:
                 item.update_data(values)
             else:
                 values.update({self.primary_key: key})
@@ -211,6 +289,26 @@ class Entity:
     def table(self):
         return self._table.split(":")[-1]
 
+    @property
+    def deferred(self):
+        return self.write_mode is not WriteModes.AUTOCOMMIT or bool(self._transactions.get(current_thread()))
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def events(self):
+        return self._events
+
+    @property
+    def archive_policy(self):
+        return self._archive
+
+    @property
+    def materialized(self):
+        return self._materialized
+
     @property
     def primary_key(self):
         if self.fields.installed is True:
@@ -225,51 +323,205 @@ class Entity:
         return self._primary_key
 
     #Methods
+    @staticmethod
+    def _stats(values):
+        values = isinstance(values, list) and [value for value in values if value is not None] or values
+        stats = {"count": len(values), "sum": None, "min": None, "max": None, "mean": None}
+        if len(values):
+            stats["min"], stats["max"] = min(values), max(values)
+            if not isinstance(values, list) or all(isinstance(value, (int, float)) for value in values):
+                stats["sum"] = sum(values)
+                stats["mean"] = stats["sum"] / len(values)
+        return stats
+
+    def archive(self, now=None):
+        if self._archive is None:
+            raise AttributeError("No archive policy")
+        moved = self._archive.run(self, now)
+        if moved and self._cache is not None:
+            self._cache.invalidate()
+        return moved
+
+    def _archive_table(self):
+        if self._archive is None:
+            raise AttributeError("No archive policy")
+        return self._archive.prepare(self)
+
+    def aggregate(self, fields, filter={}, group_by=None):
+        columns = self.columns(fields+[group_by] if group_by else fields, filter=filter)
+        if group_by is None:
+            return {field: self._stats(columns[field]) for field in fields}
+        groups = defaultdict(list)
+        for position, key in enumerate(columns[group_by]):
+            groups[key].append(position)
+        result = {}
+        for key, positions in groups.items():
+            result[key] = {}
+            for field in fields:
+                column = columns[field]
+                if isinstance(column, array):
+                    values = array(column.typecode, [column[position] for position in positions])
+                else:
+                    values = [column[position] for position in positions]
+                result[key][field] = self._stats(values)
+        return result
+
+    def changes_since(self, seq=0):
+        reset = self.database.changes_pruned(seq, self.table)
+        changes = self.database.changes_since(seq, table=self.table)
+        inserted, updated, deleted = {}, {}, {}
+        for number, key, operation, _ in changes:
+            existed = key in updated or key in deleted or (key not in inserted and operation != "I")
+            for group in (inserted, updated, deleted):
+                group.pop(key, None)
+            if operation == "D":
+                if existed:
+                    deleted[key] = None
+            else:
+                (updated if existed else inserted)[key] = None
+        return {"seq": changes and changes[-1][0] or seq,
+                "reset": reset,
+                "inserted": list(inserted),
+                "updated": list(updated),
+                "deleted": list(deleted)}
+
+    def _source(self):
+        if self._materialized is not None:
+            return self._materialized.database()
+        return self.database
+
+    def _changed(self, item):
+        with self._dirty_lock:
+            self._dirty[id(item)] = item
+            if self.write_mode is WriteModes.DELAYED and not self._save_scheduled:
+                self._save_scheduled = True
+                self._loop.call_soon_threadsafe(self._loop.call_later, self.write_delay, self.save)
+
+    def _saved(self, item):
+        with self._dirty_lock:
+            if self._dirty.get(id(item)) is item:
+                del(self._dirty[id(item)])
+
     def close(self):
+        if "_events" not in self.__dict__:
+            return # Not initialized, wrong arguments
+        if self._dirty:
+            self.save()
+        if self._archive is not None:
+            self._archive.cancel(self)
         if self._loop is not None:
             try:
                 self._loop.call_soon_threadsafe(self.database.disconnect)
             except RuntimeError:
                 pass #It's called always because of __del__
-        for item in Item.persistent[self]:
+        for item in list(Item.persistent[self].values()):
             item.close()
+        if self in Refresher.persistent:
+            Refresher.persistent[self].close()
 
-    def delete(self, filter):
-        self.database.delete(filter=filter, table=self.table)
+    def columns(self, fields=None, filter={}, use_numpy=False):
+        return self.database.select_columns(filter=filter, table=self.table, fields=fields, use_numpy=use_numpy)
 
-    def get(self, filter={}):
-        data = self.database.select(filter=filter, table=self.table)
-        return [Item(self, item, loop=self._loop) for item in data]
+    def delete(self, filter):
+        with self.database.transaction() if self._events else nullcontext():
+            keys = self._keys(filter)
+            self.database.delete(filter=filter, table=self.table)
+        if self._cache is not None:
+            self._cache.invalidate()
+        self._events.publish("delete", filter=filter, keys=keys)
+
+    def get(self, filter={}, prefetch=None, depth=1, include_archive=False):
+        query = QuerySet(self, filter, include_archive=include_archive)
+        if prefetch or depth > 1:
+            query = query.prefetch_related(*(prefetch or []), depth=depth)
+        return query
 
     def insert(self, data):
-        self.database.insert(data, table=self.table)
+        if self.versioned:
+            data = [{**row, VERSION: 1} for row in data] if isinstance(data, (list, tuple)) else {**data, VERSION: 1}
+        data = self.fields.validate(data, self.primary_key) # Rejected before reaching the database
+        keys = self.database.insert(data, table=self.table)
+        rows = data if isinstance(data, (list, tuple)) else [data]
+        if keys is not None and self.primary_key: # Generated keys, so subscribers can find the rows
+            rows = [row if row.get(self.primary_key) is not None else {**row, self.primary_key: key}
+                    for row, key in zip(rows, keys)]
+        if self._cache is not None:
+            self._cache.invalidate({key for row in rows for key in row}, rows=True)
+        self._events.publish("insert", rows)
 
     def install(self):
-        self.database.create_table(self.table, self.fields, exists=True)
-        if self.table not in ("__entities", "__fields"):
-            if "__entities" in Entity.persistent[self.database]:
-                Entity.persistent[self.database]["__entities"].insert({"name": self.name,
-                                                                       "table_name": self.table,
-                                                                       "description": self.description,
-                                                                       "parent": self.parent and self.parent.table or "",
-                                                                       "parent_field": self.parent_field})
-            if "__fields" in Entity.persistent[self.database]:
-                for field in self.fields:
-                    if not isinstance(self.fields[field].definition, (list, tuple)):
-                        definition = self.fields[field].definition.__name__
-                    else:
-                        primary = []
-                        if DBEnums.PRIMARY in self.fields[field].definition:
-                            del(self.fields[field].definition[self.fields[field].definition.index(DBEnums.PRIMARY)])
-                            primary = ["DBEnums.PRIMARY"]
-                        definition = ",".join([i.__name__ for i in self.fields[field].definition]+primary)
-                    Entity.persistent[self.database]["__fields"].insert({"name": self.fields[field].name,
-                                                                         "definition": definition,
-                                                                         "description": self.fields[field].description,
-                                                                         "table_name": self.table})
+        if (self.table not in ("__entities", "__fields") and "__entities" not in Entity.persistent[self.database]
+            and self.database.check_table_exists("__entities")):
+            raise RuntimeError("The catalog of entities is not loaded, see persistent and get_entities")
+        fields = self.fields
+        if self._archive is not None and self.primary_key is None and "id" not in fields:
+            fields = {"id": [int, DBEnums.PRIMARY, DBEnums.AUTOINCREMENT], # Ids of archived rows not given again
+                      **dict(zip(fields.keys(), fields.values()))}
+        with self.database.transaction():
+            self.database.create_table(self.table, fields, exists=True)
+            if self.fields.searchable:
+                self.database.create_search_index(self.fields.searchable, table=self.table)
+            if self.track_changes:
+                self.database.create_change_log(self.table)
+            if self.table not in ("__entities", "__fields"):
+                if "__entities" in Entity.persistent[self.database]:
+                    Entity.persistent[self.database]["__entities"].insert({"name": self.name,
+                                                                           "table_name": self.table,
+                                                                           "description": self.description,
+                                                                           "parent": self.parent and self.parent.table or "",
+                                                                           "parent_field": self.parent_field,
+                                                                           "track_changes": bool(self.track_changes)})
+                if "__fields" in Entity.persistent[self.database] and self.fields:
+                    Entity.persistent[self.database]["__fields"].insert([{"name": self.fields[field].name,
+                                                                          "definition": self._saved_definition(self.fields[field].definition),
+                                                                          "description": self.fields[field].description,
+                                                                          "table_name": self.table}
+                                                                         for field in self.fields]) # One executemany
+            self.database.after_commit(self._set_installed) # Not if an outer transaction is rolled back
+
+    def _set_installed(self):
         self._installed = True
         self.fields.set_installed()
 
+    @staticmethod
+    def _saved_definition(definition):
+        if not isinstance(definition, (list, tuple)):
+            return definition.__name__
+        types = [i.__name__ for i in definition if not isinstance(i, DBEnums)]
+        flags = ["DBEnums."+i.name for i in definition if isinstance(i, DBEnums)]
+        return ",".join(types+flags)
+
+    def lock_for(self, key):
+        try:
+            return self._stripes[hash(key) % STRIPES]
+        except TypeError: # Not hashable
+            return self.lock
+
+    def join(self, other, on=None, how="inner", fields=None, filter={}, nested=False):
+        if not isinstance(other, Entity):
+            other = self.relation(other)[0]
+        if on is None:
+            entity, many, field, related_field = self.relation(other.table)
+            on = {field: related_field}
+        elif isinstance(on, str): # The field relating both, in any of them
+            on = {on: other.primary_key} if on in self.fields else {self.primary_key: on}
+        rows = self.database.select_join(other.table, on, how=how, fields=None if nested else fields,
+                                         filter=filter, table=self.table)
+        return self._nested(other, rows) if nested else rows
+
+    def _nested(self, other, rows):
+        for row in rows:
+            data = {self.table: {}, other.table: {}}
+            for key, value in row.items():
+                table, _, field = key.rpartition(".")
+                data[table][field] = value
+            related = data[other.table]
+            if other.primary_key:
+                found = related[other.primary_key] is not None
+            else:
+                found = any([value is not None for value in related.values()])
+            yield Item(self, data[self.table], loop=self._loop), Item(other, related, loop=other._loop) if found else None
+
     def uninstall(self):
         if self.table not in ("__entities", "__fields"):
             if "__fields" in Entity.persistent[self.database]:
@@ -277,21 +529,111 @@ class Entity:
             if "__entities" in Entity.persistent[self.database]:
                 Entity.persistent[self.database]["__entities"].delete({"table_name": self.table})
             if self.table in Entity.persistent[self.database]:
+                if self.fields.searchable:
+                    self.database.drop_search_index(self.table)
+                if self.track_changes:
+                    self.database.drop_change_log(self.table)
                 self.database.drop_table(self.table)
             del(self)
 
+    def relation(self, name):
+        parent = self.parent
+        if isinstance(parent, str) and parent:
+            parent = Entity.persistent[self.database].get(parent)
+        if isinstance(parent, Entity) and name in (parent.table, parent.name):
+            if not self.parent_field:
+                raise AttributeError(f"No parent_field to relate {self.table} with {name}")
+            return parent, False, self.parent_field, parent.primary_key
+        for child in self.relations():
+            if name in (child.table, child.name):
+                return child, True, self.primary_key, child.parent_field
+        raise AttributeError(f"Relation not found: {name}")
+
+    def relations(self):
+        children = list(self.children)
+        for entity in list(Entity.persistent[self.database].values()):
+            parent = entity.parent.table if isinstance(entity.parent, Entity) else entity.parent
+            if parent == self.table and entity.parent_field and entity not in children:
+                children.append(entity) # Loaded by get_entity, with the name of the parent
+        return children
+
     def replace(self, filter, data):
-        self.database.update(data, filter=filter, table=self.table)
+        data = self.fields.validate(data, self.primary_key)
+        changes = {**data, VERSION: DBEnums.INCREMENT} if self.versioned and VERSION not in data else data
+        with self.database.transaction() if self._events else nullcontext():
+            keys = self._keys(filter)
+            count = self.database.update(changes, filter=filter, table=self.table)
+        if self._cache is not None:
+            self._cache.invalidate(None if self.primary_key in data else data)
+        self._events.publish("update", [data], filter, keys)
+        return count
+
+    def _keys(self, filter, limit=None):
+        if not self._events or not self.primary_key: # Only read for subscribers
+            return None
+        rows = self.database.select(filter=filter, table=self.table, fields=[self.primary_key],
+                                    row_type=RowTypes.TUPLE, order=self.primary_key, limit=limit)
+        return [row[0] for row in rows]
+
+    def rows(self, filter={}, fields=None, row_type=RowTypes.TUPLE):
+        return self.database.select(filter=filter, table=self.table, fields=fields, row_type=row_type)
+
+    def save(self):
+        with self._dirty_lock:
+            self._save_scheduled = False
+            items = list(self._dirty.values())
+        if items:
+            with self.database.transaction():
+                for item in items:
+                    item.save()
+
+    def search(self, query, limit=20, raw=False):
+        data = self.database.search(query, table=self.table, limit=limit, raw=raw)
+        return [Item(self, item, loop=self._loop) for item in data]
+
+    def subscribe(self, callback, ops=OPS, filter=None, loop=None):
+        return self._events.subscribe(callback, ops=ops, filter=filter, loop=loop)
+
+    def unsubscribe(self, subscription):
+        self._events.unsubscribe(subscription)
 
     def set_child(self, entity):
         assert isinstance(entity, Entity)
         if entity not in self.children:
             self._children.append(entity)
 
+    def set_archive(self, policy, loop=None):
+        assert policy is None or isinstance(policy, ArchivePolicy)
+        if self._archive is not None:
+            self._archive.cancel(self)
+        self._archive = policy
+        loop = loop or self._loop
+        if policy is not None and loop is not None:
+            policy.schedule(self, loop)
+
     def set_database(self, database):
         assert isinstance(database, DBInterface)
         self._database = database
 
+    @contextmanager
+    def transaction(self):
+        thread = current_thread()
+        self._transactions[thread] = self._transactions.get(thread, 0) + 1
+        try:
+            with self.database.transaction():
+                yield self
+                if self._transactions[thread] == 1:
+                    self.save()
+        except BaseException:
+            if self._transactions[thread] == 1:
+                for item in list(self._dirty.values()):
+                    item.revert()
+            raise
+        finally:
+            self._transactions[thread] -= 1
+            if not self._transactions[thread]:
+                del(self._transactions[thread])
+
     def add_field(self, field_dict):
         pass
 
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+__author__ = "Iván Uría"
+
+"""This module gives an in-process publish/subscribe of the writes of an Entity,
+so views and caches can react to changes without polling the database. Events
+are delivered once the writes are committed: all events of a transaction are
+given together in one call, and nothing is delivered if it's rolled back.
+Example of use:
+    def changed(events):
+        for event in events:
+            print(event["op"], event["keys"], event["data"])
+    subscription = leads.subscribe(changed, ops=["update"], filter={"status": "won"})
+    leads.replace({"id": 1}, {"status": "won"}) # changed is called now
+    with leads.transaction():
+        leads.replace({"id": 2}, {"status": "won"})
+        leads.replace({"id": 3}, {"status": "won"}) # changed is called once, after commit
+    leads.subscribe(changed, loop=loop) # Called in loop, see asyncio.call_soon_threadsafe
+    leads.unsubscribe(subscription)
+
+Classes:
+    EventBus: subscriptions to the writes of an Entity
+"""
+
+import asyncio
+from databases.filters import compile_filter, check_condition
+from threading import RLock, current_thread
+from typing import NoReturn, Callable, Iterable
+
+OPS = ("insert", "update", "delete", "archive")
+
+
+class EventBus:
+    """Subscriptions to the writes of an Entity. Every event is a dict with the
+    primary keys of the rows written, as they were before the write:
+        {"op": "insert", "table": "leads", "filter": {}, "data": {"id": 4, "name": "Pepi"}, "keys": [4]}
+        {"op": "update", "table": "leads", "filter": {"status": "open"}, "data": {"status": "won"}, "keys": [1, 3]}
+        {"op": "delete", "table": "leads", "filter": {"id": 1}, "data": {}, "keys": [1]}
+        {"op": "archive", "table": "leads", "filter": {"created_at": ["<", cutoff]}, "data": {}, "keys": [2]}
+    "archive" events give the rows moved to the archive table, see ArchivePolicy.
+    Subscribers get a list of events after the commit, only those of their ops
+    and which may match their filter. Values not known from the event, as the
+    other fields of an updated row, are not checked. Threadsafe.
+    Arguments:
+        entity: Entity publishing the events
+    Attributes:
+        entity: Entity publishing the events
+    Methods:
+        subscribe: adds a callable to call with the events
+        unsubscribe: removes a subscription
+        publish: delivers events once they are committed
+    """
+    def __init__(self, entity:object) -> NoReturn:
+        self._entity = entity
+        self._subscriptions = []
+        self._pending = {} # Events of the open transaction by thread
+        self._lock = RLock()
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    @property
+    def entity(self) -> object:
+        """Returns the Entity publishing the events
+        """
+        return self._entity
+
+    def subscribe(self, callback:Callable, ops:Iterable=OPS, filter:dict=None,
+                  loop:asyncio.BaseEventLoop=None) -> tuple:
+        """Adds a subscription and returns it, to be given to unsubscribe
+        Arguments:
+            callback: callable getting a list of events
+            ops: operations to deliver, some of OPS. All by default
+            filter: filter as given to select the events must match. All by default
+            loop: event loop to call callback in. Called in the thread committing by default
+        """
+        ops = frozenset([ops] if isinstance(ops, str) else ops)
+        if not ops <= set(OPS):
+            raise AttributeError(f"Operations must be in {OPS}")
+        subscription = (callback, ops, compile_filter(filter or {}), loop)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription:tuple) -> NoReturn:
+        """Removes a subscription given by subscribe
+        """
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, op:str, data:Iterable=({},), filter:dict=None, keys:list=None) -> NoReturn:
+        """Delivers the events of a write, once the transaction of current
+        thread is committed or at once if there is none
+        Arguments:
+            op: one of OPS
+            data: list of the dicts written, one event by dict
+            filter: filter of the rows written. None for inserts
+            keys: primary keys of the rows written. The one in every dict of
+                data by default, as for inserts
+        """
+        if not self._subscriptions:
+            return
+        primary_key = self.entity.primary_key
+        events = [{"op": op, "table": self.entity.table, "filter": dict(filter or {}), "data": dict(row),
+                   "keys": list(keys) if keys is not None else [row[primary_key]] if primary_key in row else []}
+                  for row in data]
+        database = self.entity.database
+        if not database.in_transaction():
+            self._deliver(events)
+            return
+        thread = current_thread()
+        with self._lock:
+            pending = self._pending.get(thread)
+            if pending is None:
+                pending = self._pending[thread] = []
+                database.after_commit(lambda: self._deliver(self._pending.pop(thread, [])),
+                                      lambda: self._pending.pop(thread, None))
+            pending.extend(events)
+
+    def _deliver(self, events:list) -> NoReturn:
+        """Calls every subscriber with its events
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for callback, ops, conditions, loop in subscriptions:
+            batch = [event for event in events if event["op"] in ops and self._matches(event, conditions)]
+            if not batch:
+                continue
+            if loop is None:
+                callback(batch)
+            else:
+                loop.call_soon_threadsafe(callback, batch)
+
+    @staticmethod
+    def _matches(event:dict, conditions:list) -> bool:
+        """Checks the conditions on the values known from the event: those
+        written and those filtered by equality
+        """
+        if not conditions:
+            return True
+        values = {key: value for key, operation, value in compile_filter(event["filter"]) if operation == "="}
+        values.update(event["data"])
+        return all([check_condition(values[key], operation, value)
+                    for key, operation, value in conditions if key in values])
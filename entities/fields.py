@@ -4,12 +4,120 @@ __author__ = "Iván Uría"
 
 """This module gives an interface "Field" and "Fields" to save memory usage
 
-They are used internally by "Entity".
+They are used internally by "Entity". Fields also gives the coercers checking
+and converting values before writing them, compiled once by table:
+    fields.validate([{"name": "Pepi", "age": "32", "birthday": "1982-11-04"}])
+    # [{"name": "Pepi", "age": 32, "birthday": datetime(1982, 11, 4, 0, 0)}]
+    fields.validate({"age": "old"}) # Raises ValidationError
+
+Functions:
+    coercer: returns the function checking and converting values of a type
+
+Classes:
+    ValidationError: raised with the values that cannot be written
+    Field: a field of a table
+    Fields: the fields of a table
 """
 
+import datetime
 from collections import defaultdict
-from databases import DBInterface
-from typing import NoReturn, Union
+from threading import RLock
+from databases import DBInterface, DBEnums
+from typing import NoReturn, Union, Any
+
+TRUE = ("true", "yes", "1")
+FALSE = ("false", "no", "0")
+
+
+class ValidationError(ValueError):
+    """Raised when values cannot be written in their fields
+    Arguments:
+        errors: list of tuples (row, field, value, reason), row is the position
+            in the given list or None for a single row
+    Attributes:
+        errors: list of tuples (row, field, value, reason)
+    """
+    def __init__(self, errors:list) -> NoReturn:
+        self.errors = errors
+        super().__init__("; ".join([(f"row {row}: " if row is not None else "")+f"{field}={value!r}: {reason}"
+                                    for row, field, value, reason in errors[:10]])
+                         + (f"; and {len(errors)-10} more" if len(errors) > 10 else ""))
+
+
+def _to_bool(value:Any) -> bool:
+    if isinstance(value, str):
+        if value.strip().lower() in TRUE:
+            return True
+        if value.strip().lower() in FALSE:
+            return False
+        raise ValueError("not a boolean")
+    if value in (0, 1):
+        return bool(value)
+    raise ValueError("not a boolean")
+
+def _to_int(value:Any) -> int:
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError("not an integer")
+        return int(value)
+    if isinstance(value, (str, bytes)):
+        return int(value.strip())
+    raise ValueError("not an integer")
+
+def _to_float(value:Any) -> float:
+    if isinstance(value, (int, str, bytes)):
+        return float(value)
+    raise ValueError("not a number")
+
+def _to_datetime(value:Any) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value.strip())
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time())
+    raise ValueError("not a datetime")
+
+def _to_date(value:Any) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value.strip())
+    raise ValueError("not a date")
+
+def _to_str(value:Any) -> str:
+    if isinstance(value, bytes):
+        return bytes(value)
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    raise ValueError("not a text")
+
+# Types kept as they are and conversion of other values by type of field
+COERCERS = {str: ((str, bytes), _to_str),
+            int: ((int,), _to_int),
+            float: ((float,), _to_float),
+            bool: ((bool,), _to_bool),
+            datetime.datetime: ((datetime.datetime,), _to_datetime),
+            datetime.date: ((datetime.date,), _to_date),
+            object: (None, None)} # Anything
+
+def coercer(definition:Union[type, list]) -> tuple:
+    """Returns the types kept as they are and the function converting other
+    values of a field. None is always kept, as NULL
+    Arguments:
+        definition: definition of a field, a type or a list [type, DBEnums...]
+    Returns:
+        tuple of types or None for any type, function
+    """
+    if isinstance(definition, (list, tuple)):
+        definition = next((item for item in definition if not isinstance(item, DBEnums)), object)
+    if definition in COERCERS:
+        kept, convert = COERCERS[definition]
+    else: # Registered types are just converted by themselves
+        kept, convert = (definition,), definition
+    return kept, convert
 
 class Field:
     """Field individual class
@@ -108,6 +216,7 @@ class Field:
                                new_name, self)
             dict.__delitem__(Fields.persistent[self.database][self.table],
                                self.name)
+            Fields.persistent[self.database][self.table]._coercers = None
             self.database.alter_table_rename_column(self._name, new_name, table=self.table)
             self._name = new_name
 
@@ -122,9 +231,13 @@ class Fields(dict):
         fields: a dict of the fields contained. Literally a dict(self)
             {field_name: Field}
         installed: whether or not the database has the required tables.
+        searchable: list of names of the fields in the full-text index.
+        lock: recursive lock held while the schema changes, shared by the Entity
     Methods:
         All a dict has and...
         set_installed: sets installed to True
+        coerce: checks and converts a value of a field
+        validate: checks and converts a row or a list of rows
     Arguments:
         database: DBInterface to play with
         table: table of the name parenting the Fields
@@ -167,6 +280,8 @@ class Fields(dict):
         """
         super().__init__(self)
         self.persistent[database][table] = self
+        self._coercers = None # {name: (kept types, convert)}, compiled when needed
+        self.lock = self.__dict__.get("lock") or RLock() # Kept when given again by persistent
         self._table = table
         self._database = database
         self._installed = False #To initialize without issues
@@ -204,6 +319,13 @@ class Fields(dict):
         """
         return self._installed
 
+    @property
+    def searchable(self) -> list:
+        """Returns a list of names of the fields defined with DBEnums.SEARCHABLE
+        """
+        return [key for key, definition in zip(self.keys(), self.values())
+                if isinstance(definition, (list, tuple)) and DBEnums.SEARCHABLE in definition]
+
     #Overrides
     def __setitem__(self, key:str, value:Union[str, dict, type, Field]) -> NoReturn:
         """__setitem__ is overriden to instantiate Field with given data.
@@ -216,13 +338,15 @@ class Fields(dict):
                     {"name": "field1", "definition": type, "description": "This is optional"}
                 Field: just sets it
         """
+        self._coercers = None
         if isinstance(value, Field):
-            if self.installed is True:
-                if key in self and value.definition != self[key].definition:
-                    self.database.alter_table_modify_column(value.name, value.definition, table=self.table)
-                elif key not in self:
-                    self.database.alter_table_add_column(value.name, value.definition, table=self.table)
-            super().__setitem__(key, value)
+            with self.lock:
+                if self.installed is True:
+                    if key in self and value.definition != self[key].definition:
+                        self.database.alter_table_modify_column(value.name, value.definition, table=self.table)
+                    elif key not in self:
+                        self.database.alter_table_add_column(value.name, value.definition, table=self.table)
+                super().__setitem__(key, value)
         else:
             if isinstance(value, type):
                 Field(self.database, self.table, key, value)
@@ -247,9 +371,11 @@ class Fields(dict):
         Arguments:
             key: name of the Field
         """
-        if key in self and self.installed is True:
-            self.database.alter_table_drop_column(key, table=self.table)
-        super().__delitem__(key)
+        with self.lock:
+            if key in self and self.installed is True:
+                self.database.alter_table_drop_column(key, table=self.table)
+            super().__delitem__(key)
+            self._coercers = None
 
     def values(self) -> list:
         """Returns a list of types that can be paired with .keys()
@@ -257,6 +383,66 @@ class Fields(dict):
         return [item.definition for item in super().values()]
 
     ##methods
+    def _compiled(self) -> dict:
+        """Returns the coercers of all fields, compiled once until fields change
+        """
+        coercers = self._coercers
+        if coercers is None:
+            coercers = self._coercers = {key: coercer(definition) for key, definition in zip(self.keys(), self.values())}
+        return coercers
+
+    def coerce(self, key:str, value:Any) -> Any:
+        """Returns value checked and converted to the type of the field
+        Arguments:
+            key: name of the field
+            value: value to write
+        Raises:
+            ValidationError if it cannot be converted
+        """
+        return self.validate({key: value})[key]
+
+    def validate(self, data:Union[dict, list, tuple], primary_key:str=None) -> Union[dict, list]:
+        """Returns a copy of data with values checked and converted to the types
+        of their fields. Lists are checked by column: values of the kept types
+        are not touched one by one. Values of subclasses are converted. All
+        wrong values are reported at once
+        Arguments:
+            data: dict or list of dicts to write
+            primary_key: name of the primary key if not in fields, an integer
+        Raises:
+            ValidationError with all values that cannot be converted
+        """
+        coercers = self._compiled()
+        if primary_key is not None and primary_key not in coercers:
+            coercers = dict(coercers, **{primary_key: coercer(int)})
+        rows = [data] if isinstance(data, dict) else list(data)
+        errors = []
+        columns = {}
+        for position, row in enumerate(rows):
+            for key in row:
+                if key not in coercers:
+                    errors.append((position, key, row[key], "no such field"))
+                elif key not in columns:
+                    columns[key] = None
+        result = [dict(row) for row in rows]
+        for key in columns:
+            kept, convert = coercers[key]
+            if kept is None or all([value is None or type(value) in kept for value in [row.get(key) for row in rows]]):
+                continue # Whole column right, the common case
+            for position, row in enumerate(result):
+                value = row.get(key)
+                if value is None or type(value) in kept:
+                    continue
+                try:
+                    row[key] = convert(value)
+                except (ValueError, TypeError, AttributeError) as error:
+                    errors.append((position, key, value, str(error) or "wrong type"))
+        if errors:
+            if isinstance(data, dict):
+                errors = [(None, key, value, reason) for _, key, value, reason in errors]
+            raise ValidationError(errors)
+        return result[0] if isinstance(data, dict) else result
+
     def set_installed(self) -> NoReturn:
         """Sets installed to True
         """
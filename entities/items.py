@@ -4,44 +4,409 @@ __author__ = "Iván Uría"
 
 """
 Classes:
-    Item: dict to be given by data
+    ConflictError: a row was changed by others since its Item was got
+    Item: compact mapping to be given by data
+    WriteModes: when changes of Items are saved
+    IdentityMap: keeps one Item by entity and primary key, weakly referenced
+    Refresher: updates all live Items of an Entity from server in batches
 """
 import asyncio
-from collections import defaultdict
-from datetime import datetime
-from threading import RLock
-from typing import NoReturn, Any, Callable
+import weakref
+from collections import defaultdict, OrderedDict
+from collections.abc import Mapping, MutableMapping
+from contextlib import nullcontext
+from enum import Enum, auto
+from functools import lru_cache
+from threading import Lock, RLock
+from time import monotonic_ns
+from typing import NoReturn, Any, Callable, Union
 
 TIMEOUT = 10
-LIFETIME = 600 # Fot future implementation
+LIFETIME = 600 # Seconds an idle Item is kept strongly referenced
+HOT = 1024 # Maximum Items kept strongly referenced
+CHUNK = 500 # Maximum primary keys by IN query
+TICK = 20 # Ticks of access tracking are 2**TICK nanoseconds, about 1 ms
+WRITE_DELAY = 1 # Seconds changed Items wait to be saved with WriteModes.DELAYED
+VERSION = "_version" # Field counting the updates of rows of versioned entities
+STRIPES = 64 # Locks by Entity, Items share the one of the hash of their primary key
+
+
+class ConflictError(RuntimeError):
+    """Raised when an Item of a versioned entity is saved but its row was
+    changed by others since it was got. The Item is already refreshed from
+    server, so changes can be given again.
+    Arguments:
+        item: Item refreshed
+        changes: dict with the changes not saved {field: value}
+    """
+    def __init__(self, item:"Item", changes:dict) -> NoReturn:
+        super().__init__(f"Row {item._raw(item.primary_key)!r} of {item.entity.table} changed by others")
+        self.item = item
+        self.changes = changes
+
+
+class WriteModes(Enum):
+    AUTOCOMMIT = auto() # Every change of an Item is saved at once
+    MANUAL = auto() # Changes are kept until save or the end of a transaction
+    DELAYED = auto() # Changes are saved together WRITE_DELAY seconds after the first one
+
+
+_tick = 0
+
+def tick() -> int:
+    """Returns the monotonic time in ticks. The same int is returned while the
+    tick doesn't change, so marking events doesn't allocate memory by Item
+    """
+    global _tick
+    now = monotonic_ns() >> TICK
+    if now != _tick:
+        _tick = now
+    return _tick
 
 def set_timeout(timeout:int) -> NoReturn:
     """Sets time to check changes on database
     Arguments:
         timeout: new value. 10 by default
     """
+    global TIMEOUT
     TIMEOUT = timeout
 
-class Item(dict):
-    """dict subclass to able the direct modification of the data.
+class IdentityMap:
+    """Identity map of Items: one Item by entity and primary key. Items are
+    weakly referenced, so they are freed when not used anymore, but the most
+    recently used ones are kept strongly referenced in a bounded LRU until
+    they are idle for lifetime seconds. Threadsafe.
+    Arguments:
+        hot: maximum Items kept strongly referenced. HOT by default
+        lifetime: seconds since last event to release an Item. LIFETIME by default
+    Attributes:
+        hits: number of Items found in the map
+        misses: number of Items not found
+        evictions: number of Items released because of hot size
+        expirations: number of Items released because of being idle
+    Methods:
+        get: returns the Item of an entity and primary key or None
+        add: adds an Item
+        touch: marks an Item as recently used
+        discard: removes an Item
+        expire: releases idle Items
+        stats: returns a dict with instrumentation
+    """
+    def __init__(self, hot:int=None, lifetime:int=None) -> NoReturn:
+        self.hot = hot
+        self.lifetime = lifetime
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._items = defaultdict(weakref.WeakValueDictionary)
+        self._hot = OrderedDict()
+        self._lock = RLock()
+
+    def __getitem__(self, entity:object) -> weakref.WeakValueDictionary:
+        """Returns the Items of entity {primary key: Item}
+        """
+        return self._items[entity]
+
+    def __contains__(self, entity:object) -> bool:
+        return entity in self._items
+
+    def __len__(self) -> int:
+        return sum([len(items) for items in list(self._items.values())])
+
+    def get(self, entity:object, key:Any) -> "Item":
+        """Returns the Item of entity with primary key or None
+        Arguments:
+            entity: Entity of the Item
+            key: value of the primary key
+        """
+        try:
+            item = self._items[entity].get(key) if entity in self._items else None
+        except TypeError: # Not hashable
+            item = None
+        if item is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.touch(item)
+        return item
+
+    def add(self, item:"Item") -> NoReturn:
+        """Adds item to the map and to the hot LRU, releasing the least recently
+        used ones over hot size
+        Arguments:
+            item: Item to add
+        """
+        key = item._raw(item.primary_key)
+        try:
+            hash(key)
+        except TypeError:
+            return
+        if key is None:
+            return
+        with self._lock:
+            self._items[item.entity][key] = item
+            self._keep(item.entity, key, item)
+        self.expire()
+
+    def _keep(self, entity:object, key:Any, item:"Item") -> NoReturn:
+        """Keeps item as the most recently used one in the hot LRU
+        """
+        self._hot[(entity, key)] = item
+        self._hot.move_to_end((entity, key))
+        hot = HOT if self.hot is None else self.hot
+        while len(self._hot) > hot:
+            self._hot.popitem(last=False)
+            self.evictions += 1
+
+    def touch(self, item:"Item") -> NoReturn:
+        """Marks item as the most recently used one, keeping it strongly referenced
+        Arguments:
+            item: Item used
+        """
+        key = item._raw(item.primary_key)
+        with self._lock:
+            if (item.entity, key) in self._hot:
+                self._hot.move_to_end((item.entity, key))
+            elif self._items[item.entity].get(key) is item:
+                self._keep(item.entity, key, item)
+
+    def discard(self, item:"Item") -> NoReturn:
+        """Removes item from the map
+        Arguments:
+            item: Item to remove
+        """
+        key = item._raw(item.primary_key)
+        with self._lock:
+            if self._hot.get((item.entity, key)) is item:
+                del(self._hot[(item.entity, key)])
+            if item.entity in self._items and self._items[item.entity].get(key) is item:
+                del(self._items[item.entity][key])
+
+    def expire(self) -> int:
+        """Releases from the hot LRU the Items idle for more than lifetime seconds.
+        Least recently used ones are first, so it stops at the first active one
+        Returns:
+            number of Items released
+        """
+        limit = tick() - (int((LIFETIME if self.lifetime is None else self.lifetime) * 10**9) >> TICK)
+        expired = 0
+        with self._lock:
+            while self._hot:
+                key, item = next(iter(self._hot.items()))
+                if item._last_event > limit:
+                    break
+                del(self._hot[key])
+                expired += 1
+            self.expirations += expired
+        return expired
+
+    def stats(self) -> dict:
+        """Returns a dict with instrumentation
+        """
+        return {"items": len(self),
+                "hot": len(self._hot),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations}
+
+
+class Refresher:
+    """Checks once per TIMEOUT if the table of an Entity has changed and only then
+    gets again all its live Items in IN queries, updating just those with
+    different values. Changes are found by the change log if the Entity tracks
+    changes or by the table version and data_version of the database.
+    Don't instantiate directly, use Refresher.of
+    Arguments:
+        entity: Entity associated
+        loop: asyncio loop to run the checks
+    Attributes:
+        persistent: refreshers by entity {Entity: Refresher}
+        items: live Items {id: Item}, weakly referenced
+        checks: number of checks done
+        refreshes: number of checks that found changes
+    Methods:
+        of: returns the Refresher of an entity, creating it if needed
+        add: adds an Item to be refreshed
+        discard: removes an Item
+        refresh: gets again data of Items from server
+        close: stops checking
+    """
+    persistent = {}
+
+    def __init__(self, entity:object, loop:asyncio.BaseEventLoop) -> NoReturn:
+        self.entity = entity
+        self.loop = loop
+        self.items = weakref.WeakValueDictionary()
+        self.checks = 0
+        self.refreshes = 0
+        self._lock = Lock()
+        self._handle = None
+        self._signature = None
+        self._seq = None
+
+    @classmethod
+    def of(cls, entity:object, loop:asyncio.BaseEventLoop) -> "Refresher":
+        """Returns the Refresher of entity
+        Arguments:
+            entity: Entity associated
+            loop: asyncio loop to run the checks
+        """
+        if entity not in cls.persistent or cls.persistent[entity].loop is not loop:
+            if entity in cls.persistent:
+                cls.persistent[entity].close()
+            cls.persistent[entity] = cls(entity, loop)
+        return cls.persistent[entity]
+
+    def add(self, item:"Item") -> NoReturn:
+        """Adds item to be refreshed and starts checking if needed
+        Arguments:
+            item: Item of the entity
+        """
+        with self._lock:
+            self.items[id(item)] = item
+            if self._handle is not None or self.loop.is_closed():
+                return
+            self._handle = True # Scheduling
+        self.loop.call_soon_threadsafe(self._schedule)
+
+    def discard(self, item:"Item") -> NoReturn:
+        """Removes item from refreshing
+        Arguments:
+            item: Item of the entity
+        """
+        with self._lock:
+            self.items.pop(id(item), None)
+
+    def _schedule(self) -> NoReturn:
+        with self._lock:
+            if self._handle is not None:
+                self._handle = self.loop.call_later(TIMEOUT, self._tick)
+
+    def _tick(self) -> NoReturn:
+        """Checks changes once and schedules next check while there are live Items.
+        The first check always refreshes, as Items could have changed before.
+        """
+        try:
+            self.checks += 1
+            if self.entity.track_changes:
+                changes = self.entity.changes_since(self._seq or 0)
+                first, self._seq = self._seq is None, changes["seq"]
+                if first or changes["reset"]:
+                    self.refresh()
+                elif changes["updated"] or changes["inserted"]:
+                    self.refresh(changes["updated"]+changes["inserted"])
+            else:
+                database = self.entity.database
+                signature = (database.table_version(self.entity.table), database.data_version(self.entity.table))
+                if signature != self._signature:
+                    self._signature = signature
+                    self.refresh()
+        finally:
+            self._next() # Also after errors, raised to the exception handler of the loop
+
+    def _next(self) -> NoReturn:
+        """Schedules next check while there are live Items and it's not closed
+        """
+        with self._lock:
+            if self._handle is None:
+                return
+            if not self.items:
+                self._handle = None
+                return
+            self._handle = True
+        self._schedule()
+
+    def refresh(self, keys:list=None) -> int:
+        """Gets again data of live Items and updates those whose values differ
+        Arguments:
+            keys: primary keys to refresh. All live Items by default
+        Returns:
+            number of Items updated
+        """
+        with self._lock:
+            items = list(self.items.values())
+        if not items:
+            return 0
+        primary_key = self.entity.primary_key
+        by_key = defaultdict(list)
+        for item in items:
+            by_key[item._raw(primary_key)].append(item)
+        if keys is not None:
+            keys = [key for key in keys if key in by_key]
+        else:
+            keys = list(by_key)
+        self.refreshes += 1
+        updated = 0
+        for start in range(0, len(keys), CHUNK):
+            for row in self.entity.database.select({primary_key: ["IN", keys[start:start+CHUNK]]},
+                                                   table=self.entity.table):
+                for item in by_key.get(row[primary_key], ()):
+                    changed = {key: value for key, value in row.items() if item._raw(key) != value}
+                    if changed:
+                        item.update_data(changed)
+                        updated += 1
+        return updated
+
+    def close(self) -> NoReturn:
+        """Stops checking. Called when the entity is closed
+        """
+        with self._lock:
+            handle, self._handle = self._handle, None
+        if handle is not None and handle is not True:
+            handle.cancel()
+        if self.persistent.get(self.entity) is self:
+            del(self.persistent[self.entity])
+
+@lru_cache(maxsize=None)
+def item_class(keys:tuple) -> type:
+    """Returns the subclass of Item keeping values of keys in slots. It's created
+    only once by keys, so it's shared by all Items with the same fields
+    Arguments:
+        keys: tuple with names of fields
+    """
+    fields = {key: f"_v{position}" for position, key in enumerate(keys)}
+    return type(Item)("Item", (Item,), {"__slots__": tuple(fields.values()),
+                                        "__module__": Item.__module__,
+                                        "_fields": fields})
+
+
+class Item(MutableMapping):
+    """Compact mapping to able the direct modification of the data. Values are
+    kept in slots of a subclass generated by fields (see item_class), so it
+    needs no dict by Item. It can be compared with dicts and used as one, but
+    changes are sent to server: update and setdefault set fields as item[key].
+    Deleting a key, as pop or clear do, only forgets it in the Item, the row is
+    not changed. It's not a dict subclass, use to_dict for json and APIs
+    checking isinstance(item, dict).
     Do not instantiate directly, it will be given by Entity class.
     Arguments:
         entity: entity isinstance
         data: dictionary with data
             {"field1": "value1", "field2": "value2"...}
-        loop: Asyncio loop to check changes in server periodically
+        loop: Asyncio loop to check changes in server periodically. All Items
+            of an Entity are checked together by its Refresher
     Attributes:
-        persistent: persistency dictionary
-            {Entity: {data}}
+        persistent: IdentityMap of Items, used as {Entity: {primary key: Item}}
         entity: the associated entity
-        lock: the recursive lock to elude races
+        lock: the recursive lock to elude races, shared with the Items of its stripe
         primary_key: the primary key field name
+        dirty: fields changed and not saved yet
+    Methods:
+        to_dict: returns a dict with the data
+        save: sends changed fields to server in one update
+        revert: forgets changed fields and gets data again from server
+        related: returns the children or the parent given by a relation
         changed_handler: it returns a lambda to update data in Item
         set_handler: sets a handler to tell the server about changes
         remove_handler: removes a handler that tells the server about changes
         close: closes all connections
     """
-    persistent = defaultdict(dict)
+    __slots__ = ("_entity", "_last_event", "_server_changed_handlers", "_extra", "_dirty", "_related", "_deleted",
+                 "__weakref__")
+    _fields = {} # {field: slot}, given by item_class
+    persistent = IdentityMap()
     def __new__(cls, entity:object, data:dict={}, loop:asyncio.BaseEventLoop=None) -> NoReturn:
         """__new__ overriden for checking persistency and saving memory
         Arguments:
@@ -50,13 +415,14 @@ class Item(dict):
                 {"field1": "value1", "field2": "value2"...}
             loop: asyncio loop
         """
-        primary_key = entity.primary_key
-        #assert(primary_key in data) #TODO: Verify if primary_key is inexistent and integer. In this case, go on.
-        if entity in cls.persistent and data[primary_key] in cls.persistent[entity]:
-            cls.persistent[entity][data[primary_key]].update_data(data)
-            return cls.persistent[entity][data[primary_key]]
+        item = cls.persistent.get(entity, data.get(entity.primary_key))
+        if item is not None:
+            changed = {key: value for key, value in data.items() if item._raw(key) != value}
+            if changed:
+                item.update_data(changed)
+            return item
         else:
-            return super().__new__(cls)
+            return super().__new__(item_class(tuple(data)))
 
     def __init__(self, entity:object, data:dict, loop:asyncio.BaseEventLoop=None) -> NoReturn:
         """Instantiates new Item object. To be used by Entity.
@@ -67,20 +433,25 @@ class Item(dict):
                 {"field1": "value1", "field2": "value2"...}
             loop: asyncio loop
         """
-        super().__init__(data)
-        self._primary_key = entity.primary_key
+        if hasattr(self, "_entity"):
+            return # Given by the identity map, already initialized
+        for slot, value in zip(self._fields.values(), data.values()):
+            setattr(self, slot, value)
         self._entity = entity
-        self._last_event = datetime.now()
-        self._last_server_update = datetime.now()
-        self._loop = loop
-        self._loop_update()
-        self._handler = None
-        self._server_changed_handlers = defaultdict(list)
+        self._last_event = tick()
+        self._server_changed_handlers = None # Created when needed
+        self._extra = None # Fields not in _fields, created when needed
+        self._dirty = None # Fields changed and not saved, created when needed
+        self._related = None # Prefetched Items by relation, created when needed
+        self._deleted = None # Fields deleted from slots, created when needed
+        self._loop_update(loop)
+        self.persistent.add(self)
 
     def __del__(self) -> NoReturn:
         """Overriden __del__ for closing connections and clean deletion.
         """
-        self.close()
+        if hasattr(self, "_entity"):
+            self.close()
 
     @property
     def entity(self) -> object:
@@ -90,15 +461,31 @@ class Item(dict):
 
     @property
     def lock(self) -> RLock:
-        """Returns the Recursive Lock associated.
+        """Returns the Recursive Lock associated: the one of the stripe of its
+        primary key, see Entity.lock_for
         """
-        return self.entity.lock
+        return self.entity.lock_for(self._raw(self.primary_key))
 
     @property
     def primary_key(self) -> str:
         """Returns the name of the primary key field
         """
-        return self._primary_key
+        return self._entity.primary_key
+
+    @property
+    def dirty(self) -> dict:
+        """Returns the fields changed and not saved yet {field: value}
+        """
+        return dict(self._dirty or {})
+
+    @property
+    def _loop(self) -> asyncio.BaseEventLoop:
+        """Returns the loop of the Refresher updating the Item or None
+        """
+        refresher = Refresher.persistent.get(self._entity)
+        if refresher is not None and refresher.items.get(id(self)) is self:
+            return refresher.loop
+        return None
 
     def __setitem__(self, key:str, value:Any) -> NoReturn:
         """Sets item value to key
@@ -107,10 +494,22 @@ class Item(dict):
             value: value to set
         """
         if key in self.entity.fields:
-            with self.lock:
-                super().__setitem__(key, value)
-                self.entity.replace({self.primary_key: self[self.primary_key]}, {key: value})
-                self._last_event = datetime.now()
+            value = self.entity.fields.coerce(key, value) # ValidationError before any change
+            if key == self.primary_key or not self.entity.deferred:
+                with self._write_lock():
+                    self.save() # Changes kept before are saved with the old primary key
+                    self._replace({key: value})
+                    with self.lock:
+                        self._set(key, value)
+            else:
+                with self.lock:
+                    self._set(key, value)
+                    if self._dirty is None:
+                        self._dirty = {}
+                    self._dirty[key] = value
+                    self.entity._changed(self)
+            self._last_event = tick()
+            self.persistent.touch(self)
         else:
             raise Exception("Field not in entity")
 
@@ -119,24 +518,202 @@ class Item(dict):
         Arguments:
             key: name of the field
         """
-        self._last_event = datetime.now()
-        return super().__getitem__(key)
+        self._last_event = tick()
+        slot = self._fields.get(key)
+        if slot is not None and (self._deleted is None or key not in self._deleted):
+            return getattr(self, slot)
+        elif self._extra is not None:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __delitem__(self, key:str) -> NoReturn:
+        """Forgets the key in the Item. The row in server is not changed
+        Arguments:
+            key: name of the field
+        """
+        with self.lock:
+            if key in self._fields and (self._deleted is None or key not in self._deleted):
+                if self._deleted is None:
+                    self._deleted = set()
+                self._deleted.add(key)
+            elif self._extra is not None and key in self._extra:
+                del(self._extra[key])
+            else:
+                raise KeyError(key)
+
+    def __contains__(self, key:str) -> bool:
+        if key in self._fields:
+            return self._deleted is None or key not in self._deleted
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        if self._deleted is None:
+            yield from self._fields
+        else:
+            yield from [key for key in self._fields if key not in self._deleted]
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return (len(self._fields) - (len(self._deleted) if self._deleted is not None else 0)
+                + (len(self._extra) if self._extra is not None else 0))
+
+    def __eq__(self, other:Any) -> bool:
+        if isinstance(other, Item):
+            other = other.copy()
+        elif not isinstance(other, Mapping):
+            return NotImplemented
+        return self.copy() == other
+
+    def __repr__(self) -> str:
+        return repr(self.copy())
+
+    def _raw(self, key:str, default:Any=None) -> Any:
+        """Gets the value of the key without marking an event
+        Arguments:
+            key: name of the field
+            default: value if key is not in Item
+        """
+        slot = self._fields.get(key)
+        if slot is not None and (self._deleted is None or key not in self._deleted):
+            return getattr(self, slot)
+        elif self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def _set(self, key:str, value:Any) -> NoReturn:
+        """Sets the value of the key locally. Fields not given when created are
+        kept apart
+        Arguments:
+            key: name of the field
+            value: value to set
+        """
+        slot = self._fields.get(key)
+        if slot is not None:
+            setattr(self, slot, value)
+            if self._deleted is not None:
+                self._deleted.discard(key)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def copy(self) -> dict:
+        """Returns a dict with the data of the Item
+        """
+        data = {key: getattr(self, slot) for key, slot in self._fields.items()}
+        if self._deleted is not None:
+            for key in self._deleted:
+                del(data[key])
+        if self._extra is not None:
+            data.update(self._extra)
+        return data
+
+    def to_dict(self) -> dict:
+        """Returns a dict with the data of the Item, to be serialized as json
+        or given where a dict is needed
+        """
+        return self.copy()
+
+    def _write_lock(self):
+        """Returns the lock to hold while writing to server: none for versioned
+        entities, as their updates are conditional, the lock of the Item
+        otherwise. Changes in memory always hold the lock of the Item
+        """
+        return nullcontext() if self.entity.versioned else self.lock
+
+    def _replace(self, data:dict) -> NoReturn:
+        """Sends data to server in one update. With versioned entities only
+        if the row was not changed since it was got, see ConflictError
+        Arguments:
+            data: dict with changed fields {field: value}
+        """
+        filter = {self.primary_key: self._raw(self.primary_key)}
+        version = self._raw(VERSION) if self.entity.versioned else None
+        if version is None: # Not versioned or got without the field
+            self.entity.replace(filter, data)
+            return
+        filter[VERSION] = version
+        if not self.entity.replace(filter, data):
+            self._get_from_server()
+            raise ConflictError(self, data)
+        with self.lock:
+            self._set(VERSION, version+1)
+
+    def save(self) -> NoReturn:
+        """Sends the changed fields to server in one update. Only needed if the
+        entity doesn't autocommit, see WriteModes
+        """
+        with self._write_lock():
+            with self.lock:
+                dirty, self._dirty = self._dirty, None
+            if dirty:
+                try:
+                    self._replace(dirty)
+                except ConflictError:
+                    self.entity._saved(self) # Refreshed, changes are given by the error
+                    raise
+                except Exception:
+                    with self.lock:
+                        self._dirty = {**dirty, **(self._dirty or {})}
+                    raise
+            self.entity._saved(self)
+
+    def revert(self) -> NoReturn:
+        """Forgets the changed fields and gets data again from server
+        """
+        with self.lock:
+            self._dirty = None
+            self.entity._saved(self)
+            self._get_from_server()
+
+    def related(self, name:str) -> Union[list, "Item"]:
+        """Returns the Items related by name: a list of children or the parent
+        Item or None. Prefetched ones are given while no table of the relation
+        is written, see QuerySet.prefetch_related, otherwise they are got from server
+        Arguments:
+            name: table or name of a child or the parent entity
+        """
+        if self._related is not None and name in self._related:
+            related, entity, version = self._related[name]
+            if self._relation_version(entity) == version:
+                return related
+            self._related.pop(name, None) # Written since it was got
+        entity, many, field, related_field = self.entity.relation(name)
+        query = entity.get({related_field: self._raw(field)})
+        return list(query) if many else query.first()
+
+    def _relation_version(self, entity:object) -> tuple:
+        """Returns the versions of the tables of the Item and of a related
+        entity, changing with every write in any of them
+        """
+        return (self.entity.database.table_version(self.entity.table),
+                entity.database.table_version(entity.table))
+
+    def _relate(self, name:str, related:Union[list, "Item"], entity:object, version:tuple) -> NoReturn:
+        """Attaches the Items related by name, got from entity at version, see
+        _relation_version
+        """
+        if self._related is None:
+            self._related = {}
+        self._related[name] = (related, entity, version)
 
     def _get_from_server(self) -> NoReturn:
-        """Updates all information from server
+        """Updates all information from server, forgetting prefetched relations
         """
-        data = self.entity.get({self.primary_key: self[self.primary_key]})
+        self._related = None
+        data = self.entity.database.select({self.primary_key: self._raw(self.primary_key)}, table=self.entity.table)
         if data:
             self.update_data(data[0])
-        self._loop_update()
 
-    def _loop_update(self) -> NoReturn:
-        """Feeds the event lopp with the _get_from_server function
+    def _loop_update(self, loop:asyncio.BaseEventLoop) -> NoReturn:
+        """Adds the Item to the Refresher of its entity, which checks changes
+        for all Items of the entity at once
+        Arguments:
+            loop: asyncio loop, nothing is done if None
         """
-        if self._loop:
-            self._handler = self._loop.call_soon_threadsafe(lambda: self._loop.call_later(
-                                                            TIMEOUT,
-                                                            self._get_from_server))
+        if loop:
+            Refresher.of(self.entity, loop).add(self)
 
     def changed_handler(self, key:str) -> NoReturn:
         """Returns the handler to change the data. It can be used by the GUI or
@@ -158,6 +735,8 @@ class Item(dict):
             field: name of the field
             handler: callable that gets just the new value
         """
+        if self._server_changed_handlers is None:
+            self._server_changed_handlers = defaultdict(list)
         self._server_changed_handlers[field].append(handler)
 
     def remove_handler(self, field:str, handler:callable) -> NoReturn:
@@ -166,15 +745,14 @@ class Item(dict):
             field: name of the field
             handler: callable to be deleted
         """
-        if handler in self._server_changed_handlers[field]:
+        if self._server_changed_handlers and handler in self._server_changed_handlers[field]:
             del(self._server_changed_handlers[field][self._server_changed_handlers[field].index(handler)])
 
     def close(self) -> NoReturn:
         """Closes connections with handler and loop. It's called from __del__
         """
-        if self._handler is not None:
-            self._handler.cancel()
-        self._loop = None
+        if self._entity in Refresher.persistent:
+            Refresher.persistent[self._entity].discard(self)
 
     def update_data(self, data:dict) -> NoReturn:
         """Updates all data given in Item
@@ -184,10 +762,13 @@ class Item(dict):
         """
         #TODO: Any verification if needed
         with self.lock:
-            self.update(data)
+            if self._dirty:
+                data = {key: value for key, value in data.items() if key not in self._dirty} # Not saved yet
+            for key, value in data.items():
+                self._set(key, value)
             if self._server_changed_handlers and isinstance(self._server_changed_handlers, dict):
                 for key in self.entity.fields:
                     if key in self._server_changed_handlers and key in data and isinstance(self._server_changed_handlers[key], list):
                         for handler in self._server_changed_handlers[key]:
                             if callable(handler) is True:
-                                handler(data[key])
\ No newline at end of file
+                                handler(data[key])
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+__author__ = "Iván Uría"
+
+"""This module gives an in-memory copy of all rows of an Entity to answer its
+queries without reaching the database. Intended for small tables read on every
+request, as __users, __roles or __permissions.
+Fields declared with DBEnums.INDEX get a hash index in the copy and fields
+declared with DBEnums.SORTED a sorted index for range filters.
+Example of use:
+    roles = Entity(database, "roles", "Roles", {"name": [str, DBEnums.INDEX],
+                                                "level": [int, DBEnums.SORTED]},
+                   "Roles of users", materialize=True)
+    roles.get({"name": "admin"}) # Answered in memory
+    roles.get({"level": [">=", 3]}).count() # Answered in memory too
+
+Classes:
+    Materialized: in-memory copy of the rows of an Entity
+"""
+
+from databases.databases import DBInterface
+from threading import RLock, current_thread
+from typing import NoReturn
+
+LIMIT = 10000 # Rows kept at most by default, bigger tables are queried in database
+
+
+class Materialized:
+    """In-memory copy of all rows of an Entity. It's loaded again when the
+    table_version of the table changes, by writes through its database, or the
+    data_version seen by current thread changes, by commits of other
+    connections. Tables bigger than limit and open transactions are queried in
+    database. Once a table is too big, it's just counted on changes until it's
+    under limit again.
+    Arguments:
+        entity: Entity to copy
+        limit: maximum number of rows to keep. LIMIT by default
+    Attributes:
+        entity: Entity copied
+        limit: maximum number of rows to keep
+        loaded: whether there is an up to date copy
+    Methods:
+        database: returns the DBInterface to query, the copy if possible
+        invalidate: drops the copy, loaded again when needed
+    """
+    def __init__(self, entity:object, limit:int=LIMIT) -> NoReturn:
+        self._entity = entity
+        self.limit = limit
+        self._memory = None # MemoryInterface with the copy
+        self._version = None # table_version of the copy, or of the table too big to be copied
+        self._too_big = False # Whether the table had more than limit rows when last read
+        self._data_versions = {} # data_version seen by every thread since the copy
+        self._lock = RLock()
+
+    @property
+    def entity(self) -> object:
+        """Returns the Entity copied
+        """
+        return self._entity
+
+    @property
+    def loaded(self) -> bool:
+        """Returns whether there is a copy, without checking if it's up to date
+        """
+        return self._memory is not None
+
+    def database(self) -> DBInterface:
+        """Returns the copy if it's up to date or can be loaded, the database
+        of the entity otherwise
+        """
+        database = self.entity.database
+        if database.in_transaction():
+            return database # Uncommitted rows must not be seen by other threads
+        thread = current_thread()
+        data_version = database.data_version(self.entity.table)
+        with self._lock:
+            version = database.table_version(self.entity.table)
+            if version != self._version or self._data_versions.get(thread, ()) != data_version:
+                self._load(database, version)
+                self._data_versions[thread] = data_version # Others are still valid, the copy is newer
+            return database if self._memory is None else self._memory
+
+    def _load(self, database:DBInterface, version:tuple) -> NoReturn:
+        """Copies the rows of the table, got after version
+        Arguments:
+            database: DBInterface of the entity
+            version: table_version before reading the rows
+        """
+        table = self.entity.table
+        self._memory = None
+        self._version = version
+        if self._too_big and database.count(table=table) > self.limit:
+            return # Still too big, without getting its rows
+        rows = database.select(table=table, limit=self.limit+1)
+        self._too_big = len(rows) > self.limit
+        if self._too_big:
+            return # Kept in database until the table changes
+        from databases.memory import MemoryInterface # Only loaded by processes materializing a table
+        memory = MemoryInterface()
+        try:
+            memory.create_table(table, dict(zip(self.entity.fields.keys(), self.entity.fields.values())))
+            if rows:
+                memory.insert(list(rows), table=table)
+        except RuntimeError:
+            return # Fields not matching the table
+        self._memory = memory
+
+    def invalidate(self) -> NoReturn:
+        """Drops the copy. It will be loaded again when needed
+        """
+        with self._lock:
+            self._memory = None
+            self._version = None
+            self._too_big = False
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+
+__author__ = "Iván Uría"
+
+"""This module gives a lazy query of Items of an Entity. It's composed without
+accessing the database and compiled into a single select only when consumed.
+Example of use:
+    customers.get({"age": [">", 30]}).order_by("-age").only("name")[:10]
+    customers.get().filter(city="Madrid").count() # SELECT COUNT(*), no Item is built
+    if customers.get({"NID": "12345678H"}): # Gets one primary key at most
+        ...
+    customers.get().prefetch_related("contacts.calls") # One IN query by relation
+    activity.get({"user": 3}, include_archive=True) # UNION ALL with the archive table
+
+Functions:
+    merge_filters: joins the conditions of two filters
+    prefetch: gets related Items of a batch of Items
+
+Classes:
+    QuerySet: lazy and chainable query of Items
+"""
+
+from databases.cache import MISS
+from databases.databases import RowTypes, parse_order
+from .items import Item, CHUNK
+from typing import NoReturn, Union, Any
+
+
+def merge_filters(filter:dict, other:dict) -> dict:
+    """Returns a filter with the conditions of both filters. Conditions on the
+    same field are joined in a list [(operation, value), ...]
+    Arguments:
+        filter: filter as given to select
+        other: filter as given to select
+    """
+    def conditions(value):
+        if not isinstance(value, (list, tuple)) or len(value) != 2:
+            return [("=", value)]
+        elif not isinstance(value[0], (list, tuple)):
+            return [tuple(value)]
+        return [tuple(item) for item in value]
+    merged = dict(filter)
+    for key, value in other.items():
+        if key in merged:
+            merged[key] = conditions(merged[key])+conditions(value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def prefetch(entity:object, items:list, names:Union[list, dict], depth:int=1) -> NoReturn:
+    """Gets the related Items of all items with one IN query by relation (and
+    CHUNK keys) and attaches them to every Item until the tables of the
+    relation are written, see Item.related
+    Arguments:
+        entity: Entity of items
+        items: list of Items
+        names: names of relations, dotted for several levels: "contacts.calls".
+            Or a tree of them {"contacts": {"calls": {}}}
+        depth: levels to get. Given relations are the first one and all child
+            relations are got in next levels. 1 by default, just the given ones
+    """
+    tree = names
+    if not isinstance(tree, dict):
+        tree = {}
+        for name in names:
+            branch = tree
+            for part in name.split("."):
+                branch = branch.setdefault(part, {})
+    if depth > 0 and not tree:
+        tree = {child.table: {} for child in entity.relations()}
+    for name, branch in tree.items():
+        related, many, field, related_field = entity.relation(name)
+        version = items[0]._relation_version(related) if items else None # Before reading, stale if written meanwhile
+        keys = list(dict.fromkeys([key for key in [item._raw(field) for item in items] if key is not None]))
+        found = []
+        for start in range(0, len(keys), CHUNK):
+            found += list(related.get({related_field: ["IN", keys[start:start+CHUNK]]}))
+        groups = {}
+        for item in found:
+            if many:
+                groups.setdefault(item._raw(related_field), []).append(item)
+            else:
+                groups[item._raw(related_field)] = item
+        for item in items:
+            item._relate(name, groups.get(item._raw(field), [] if many else None), related, version)
+        if found and (branch or depth > 1):
+            prefetch(related, found, branch, depth if branch else depth-1)
+
+
+class QuerySet:
+    """Lazy and chainable query of Items of an Entity. Every method giving a
+    QuerySet returns a new one, so they can be reused. Items are built when it's
+    iterated, indexed or measured with len, and kept for next uses.
+    Do not instantiate directly, it will be given by Entity.get and slicing.
+    Arguments:
+        entity: Entity to query
+        filter: filter as given to select. All Items by default
+        include_archive: whether rows moved to the archive table of the entity
+            are got too, see ArchivePolicy. False by default
+    Attributes:
+        entity: Entity queried
+        query: dict with the arguments of the select to run
+    Methods:
+        filter: returns a QuerySet with more conditions
+        order_by: returns a QuerySet sorted by fields, "-field" for descending order
+        only: returns a QuerySet getting just some fields
+        limit: returns a QuerySet with a maximum number of Items
+        count: returns the number of Items without building them
+        exists: returns if there is any Item without building them
+        first: returns the first Item or None
+        prefetch_related: returns a QuerySet getting related Items in batch
+    """
+    def __init__(self, entity:object, filter:dict=None, include_archive:bool=False) -> NoReturn:
+        self._entity = entity
+        self._filter = dict(filter or {})
+        self._archive = include_archive
+        self._order = None
+        self._fields = None
+        self._limit = None
+        self._offset = None
+        self._prefetch = None # (names, depth) of relations to get with the Items
+        self._result = None # Items, once fetched
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+    def __len__(self) -> int:
+        return len(self._fetch())
+
+    def __bool__(self) -> bool:
+        return self.exists()
+
+    def __eq__(self, other:Any) -> bool:
+        if isinstance(other, QuerySet):
+            other = other._fetch()
+        elif not isinstance(other, list):
+            return NotImplemented
+        return self._fetch() == other
+
+    def __repr__(self) -> str:
+        return f"<QuerySet {self._fetch()!r}>"
+
+    def __getitem__(self, key:Union[int, slice]) -> Union[Item, "QuerySet", list]:
+        """Gets an Item by position or a QuerySet by slice. Negative positions
+        and steps need the whole result
+        Arguments:
+            key: int or slice
+        """
+        if isinstance(key, slice):
+            start, stop = key.start or 0, key.stop
+            if key.step not in (None, 1) or start < 0 or (stop is not None and stop < 0):
+                return self._fetch()[key]
+            limit = None if stop is None else max(stop-start, 0)
+            if self._limit is not None:
+                limit = max(self._limit-start, 0) if limit is None else min(limit, max(self._limit-start, 0))
+            clone = self._clone(_limit=limit, _offset=(self._offset or 0)+start or None)
+            if self._result is not None:
+                clone._result = self._result[key] # Already fetched
+            return clone
+        elif isinstance(key, int):
+            if key < 0 or self._result is not None:
+                return self._fetch()[key]
+            items = self[key:key+1]._fetch()
+            if not items:
+                raise IndexError("QuerySet index out of range")
+            return items[0]
+        raise TypeError("Only int and slice allowed")
+
+    @property
+    def entity(self) -> object:
+        """Returns the Entity queried
+        """
+        return self._entity
+
+    @property
+    def query(self) -> dict:
+        """Returns the arguments of the select to run
+        """
+        return {"filter": dict(self._filter),
+                "table": self.entity.table,
+                "fields": self._fields,
+                "order": self._order,
+                "limit": self._limit,
+                "offset": self._offset}
+
+    def _clone(self, **changes) -> "QuerySet":
+        """Returns a copy without result with changed attributes
+        """
+        clone = QuerySet.__new__(QuerySet)
+        clone.__dict__.update(self.__dict__)
+        clone.__dict__.update(changes)
+        clone._result = None
+        return clone
+
+    def _select(self, **changes) -> list:
+        """Runs the query with changed arguments, in the archive table too if
+        asked. Returns the rows
+        """
+        query = self.query
+        query.update(changes)
+        if self._archive:
+            table = query.pop("table")
+            return self.entity.database.select_union([table, self.entity._archive_table()], **query)
+        return self.entity._source().select(**query)
+
+    def _fetch(self) -> list:
+        """Runs the query once and returns the Items. Primary keys are kept in
+        the cache of the entity if it has one
+        """
+        if self._result is None:
+            key = self._cache_key()
+            result = None if key is None else self._from_cache(key)
+            if result is None:
+                version = None if key is None else self._version() # Before reading, stale if written meanwhile
+                if self._limit == 0:
+                    data = []
+                else:
+                    data = self._select()
+                result = [Item(self.entity, row, loop=self.entity._loop) for row in data]
+                if key is not None:
+                    self._put(key, [item._raw(self.entity.primary_key) for item in result], version)
+            if self._prefetch is not None and result:
+                prefetch(self.entity, result, *self._prefetch)
+            else:
+                for item in result:
+                    item._related = None # Those of other fetches are not given by this one
+            self._result = result
+        return self._result
+
+    def _cache_key(self) -> tuple:
+        """Returns the key of the query in the cache of the entity, or None if
+        it cannot be kept: no cache, some fields only, no primary key, an open
+        transaction or values not hashable
+        """
+        entity = self.entity
+        if entity.cache is None or self._fields is not None or not entity.primary_key or entity.database.in_transaction():
+            return None
+        def freeze(value):
+            if isinstance(value, (list, tuple)):
+                return tuple([freeze(item) for item in value])
+            return value
+        key = (tuple(sorted([(field, freeze(value)) for field, value in self._filter.items()])),
+               freeze(self._order), self._limit, self._offset, self._archive)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _version(self) -> tuple:
+        """Returns the versions of the tables queried, see DBInterface.table_version
+        """
+        tables = [self.entity.table]+([self.entity._archive_table()] if self._archive else [])
+        return tuple([self.entity.database.table_version(table) for table in tables])
+
+    def _put(self, key:tuple, keys:list, version:tuple) -> NoReturn:
+        """Keeps the primary keys found in the cache of the entity, with the
+        columns the query depends on
+        """
+        self.entity.cache.put(key, keys, list(self._filter)+[field for field, _ in parse_order(self._order)],
+                              all_rows=not self._filter, version=version)
+
+    def _from_cache(self, key:tuple) -> list:
+        """Returns the Items of the primary keys kept for key, or None. Items
+        not in the identity map anymore are got with one query, all of them if
+        the tables were written since the keys were kept, as Items may be stale
+        """
+        found = self.entity.cache.get(key)
+        if found is MISS:
+            return None
+        keys, version = found
+        current = self._version()
+        written = version != current
+        items = {value: None if written else Item.persistent.get(self.entity, value) for value in keys}
+        missing = [value for value, item in items.items() if item is None]
+        for start in range(0, len(missing), CHUNK):
+            for row in self._select(filter={self.entity.primary_key: ["IN", missing[start:start+CHUNK]]},
+                                    fields=None, order=None, limit=None, offset=None):
+                item = Item(self.entity, row, loop=self.entity._loop)
+                items[item._raw(self.entity.primary_key)] = item
+        if any([items[value] is None for value in keys]):
+            return None # Deleted by others meanwhile
+        if written:
+            self._put(key, keys, current) # Items are fresh again
+        return [items[value] for value in keys]
+
+    def filter(self, filter:dict=None, **fields) -> "QuerySet":
+        """Returns a QuerySet with the conditions added
+        Arguments:
+            filter: filter as given to select
+            fields: conditions of equality field=value
+        Example:
+            customers.get().filter({"age": [">", 30]}, city="Madrid")
+        """
+        if self._limit is not None or self._offset:
+            raise RuntimeError("Cannot filter a QuerySet once sliced")
+        return self._clone(_filter=merge_filters(merge_filters(self._filter, filter or {}), fields))
+
+    def order_by(self, *fields:str) -> "QuerySet":
+        """Returns a QuerySet sorted by fields, "-field" for descending order
+        """
+        if self._limit is not None or self._offset:
+            raise RuntimeError("Cannot order a QuerySet once sliced")
+        return self._clone(_order=list(fields) or None)
+
+    def only(self, *fields:str) -> "QuerySet":
+        """Returns a QuerySet getting just fields. The primary key is always got
+        """
+        primary_key = self.entity.primary_key
+        fields = [field for field in fields if field != primary_key]
+        return self._clone(_fields=[primary_key]+fields if primary_key else fields)
+
+    def prefetch_related(self, *names:str, depth:int=1) -> "QuerySet":
+        """Returns a QuerySet getting also the related Items of all its Items,
+        with one query by relation. See prefetch
+        Arguments:
+            names: names of child or parent entities, dotted for several levels.
+                All children by default
+            depth: levels to get, see prefetch
+        Example:
+            for account in accounts.get().prefetch_related("contacts.calls"):
+                account.related("contacts")
+        """
+        for name in names:
+            entity = self.entity
+            for part in name.split("."): # Checked before running anything
+                entity = entity.relation(part)[0]
+        return self._clone(_prefetch=(list(names), depth))
+
+    def limit(self, limit:int, offset:int=None) -> "QuerySet":
+        """Returns a QuerySet with limit Items at most, skipping offset
+        """
+        return self[(offset or 0):(offset or 0)+limit]
+
+    def count(self) -> int:
+        """Returns the number of Items. Counted in database if not fetched yet
+        """
+        if self._result is not None:
+            return len(self._result)
+        tables = [self.entity.table]+([self.entity._archive_table()] if self._archive else [])
+        database = self.entity.database if self._archive else self.entity._source()
+        count = max(sum([database.count(dict(self._filter), table=table) for table in tables])-(self._offset or 0), 0)
+        return count if self._limit is None else min(count, self._limit)
+
+    def exists(self) -> bool:
+        """Returns if there is any Item. Only a primary key is got if not fetched yet
+        """
+        if self._result is not None:
+            return bool(self._result)
+        if self._limit == 0:
+            return False
+        primary_key = self.entity.primary_key
+        return bool(self._select(fields=primary_key and [primary_key], row_type=RowTypes.TUPLE,
+                                 order=None, limit=1))
+
+    def first(self) -> Item:
+        """Returns the first Item or None
+        """
+        try:
+            return self[0]
+        except IndexError:
+            return None
@@ -43,7 +43,7 @@ DEFAULT_ROLES = [{"id": "admin",
                   "parent": "admin"},
                  {"id": "user",
                   "name": "User",
-                  "desctiption": "System User",
+                  "description": "System User",
                   "parent": "manager"},
                  {"id": "itmanager",
                   "name": "IT Manager",
@@ -6,7 +6,7 @@ import threading
 import time
 from entities import Item, Entity
 from entities.defaults import install_persistency, get_entity, get_entities
-from databases import DBInterface, new_db_interface, DBEnums
+from databases import DBInterface, new_db_interface, DBEnums, RowTypes
 from collections import defaultdict
 from configparser import ConfigParser
 from datetime import datetime, timedelta
@@ -41,10 +41,11 @@ def only_permitted(table=None, operation="r"):
                     else:
                         user = user
                     roles = user["roles"].split(" ")
-                    authorising = self.entities["__permissions"].get({"entity": table,
-                                                                      "operation": operation,
-                                                                      "__roles_id": ["IN", roles]})
-                if any([k["permitted"] for k in authorising]):
+                    authorising = self.entities["__permissions"].rows({"entity": table,
+                                                                       "operation": operation,
+                                                                       "__roles_id": ["IN", roles]},
+                                                                      fields=["permitted"])
+                if any([permitted for permitted, in authorising]):
                     return func(self, *args, **kwargs)
                 else:
                     raise RuntimeError("Unauthorised")
@@ -156,6 +157,10 @@ class Main:
         if self.installed is True:
             get_entities(self.database, loop=self._loop)
 
+    def archive(self, table, policy):
+        # Old rows are moved in the loop thread, see ArchivePolicy
+        self.entities[table].set_archive(policy, loop=self._loop)
+
     def logged(self, user, token):
         try:
             user = self.entities["__users"][user]
@@ -178,7 +183,7 @@ class Main:
         return user["token"]
 
     def get_role_children(self, role_id):
-        roles = self.entities["__roles"].get()
+        roles = self.entities["__roles"].rows(fields=["id", "parent"], row_type=RowTypes.RECORD)
         if isinstance(role_id, str):
             role_id = role_id.split(" ")
         #roles = list(role_id)
@@ -19,6 +19,9 @@ if __name__=="__main__":
     parser.add_argument("--user", help="User to access database")
     parser.add_argument("--password", help="Password to access database")
     parser.add_argument("--database", help="Database name")
+    #Maintenance
+    parser.add_argument("--migrate-compact", action="store_true",
+                        help="Migrates datetime and bool columns of the database to compact storage")
 
     args = DEFAULT_VARS.copy()
     args.update(vars(parser.parse_args(sys.argv[1:])))
@@ -37,6 +40,15 @@ if __name__=="__main__":
             if "--"+key in args:
                 config["Main DB"][key] = args["--"+key]
 
+    if args["migrate_compact"]:
+        from databases import new_db_interface
+        options = dict(config["Main DB"])
+        options["compact"] = True
+        database = new_db_interface(**options)
+        print("Migrated tables:", ", ".join(database.migrate_compact()) or "none")
+        database.disconnect()
+        sys.exit(0)
+
     if "Interface" in config.sections():
         if config["Interface"]["default"] == "tkinter":
             from interface.tkinterface import main
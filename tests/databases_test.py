@@ -4,9 +4,20 @@
 VERSION = 0.1
 
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
+import databases
+from databases import new_db_interface, register_engine, get_engine, DBTypes
+from databases.cache import SelectCache, MISS
+from databases.memory import MemoryInterface
+from databases.sharded import ShardedSqliteInterface
 from databases.sqlite import SqliteInterface as SQLite, MEMORY
-from databases.databases import Data, DBEnums
+from databases.databases import Data, Columns, DBEnums, RowTypes, record_type
+from sqlite3 import Row, connect
+from array import array
 from sqlite3 import Error
 from datetime import date, datetime, timedelta
 
@@ -77,6 +88,14 @@ class v1_Databases_sqlite(unittest.TestCase):
                                                    filter={"a": 1, "b": "dos"}),
                         ("SELECT a, b FROM foo WHERE a=:filteravalue0 and b=:filterbvalue1;",
                         {"filteravalue0": 1, "filterbvalue1": "dos"}))
+        self.assertEqual(self.db._create_sql_query(table="foo", filter={"a": 1}, order=["-a", "b"],
+                                                   limit=10, offset=20),
+                        ("SELECT * FROM foo WHERE a=:filteravalue0 ORDER BY a DESC, b LIMIT :limit OFFSET :offset;",
+                        {"filteravalue0": 1, "limit": 10, "offset": 20}))
+        self.assertEqual(self.db._create_sql_query(table="foo", method=DBEnums.COUNT, filter={"a": 1}),
+                        ("SELECT COUNT(*) FROM foo WHERE a=:filteravalue0;", {"filteravalue0": 1}))
+        with self.assertRaises(Exception):
+            self.db._create_sql_query(table="foo", order="a; DROP TABLE foo")
 
     def test__create_sql_query_insert(self):
         self.assertEqual(self.db._create_sql_query(table="foo",
@@ -133,9 +152,38 @@ class v1_Databases_sqlite(unittest.TestCase):
         self.assertEqual(self.db.select(filter={"name": "María"}),
             Data({"id": 1, "name": "María", "age": 49, "phone": "+34666777888"}))
 
+    def test_select_row_types(self):
+        self.db.set_table("customers")
+        self.assertEqual(self.db.select(fields=["id", "name"], row_type=RowTypes.TUPLE), [(1, "María")])
+        self.db.insert(data=[{"name": "José", "age": 33}, {"name": "Ana", "age": 33}])
+        self.assertEqual(self.db.select(fields=["id"], row_type=RowTypes.TUPLE, order=["age", "-name"], limit=2),
+                         [(2,), (3,)])
+        self.assertEqual(self.db.select(fields=["id"], row_type=RowTypes.TUPLE, order="-age", offset=1), [(2,), (3,)])
+        self.assertEqual(self.db.count({"age": 33}), 2)
+        row = self.db.select(row_type=RowTypes.ROW)[0]
+        self.assertIsInstance(row, Row)
+        self.assertEqual(row["phone"], "+34666777888")
+        record = self.db.select({"id": 1}, row_type=RowTypes.RECORD)[0]
+        self.assertIs(type(record), record_type("customers", ("id", "name", "phone", "age")))
+        self.assertEqual((record.name, record["age"], record[0]), ("María", 49, 1))
+        self.assertEqual(dict(record), self.db.select()[0])
+
+    def test_select_columns(self):
+        self.db.set_table("customers")
+        self.db.insert(data={"name": "José", "age": 33.5, "phone": None})
+        columns = self.db.select_columns()
+        self.assertEqual(columns.length, 2)
+        self.assertEqual(list(columns.keys()), ["id", "name", "phone", "age"])
+        self.assertEqual(columns["id"], array("q", [1, 2]))
+        self.assertEqual(columns["age"], array("d", [49, 33.5]))
+        self.assertEqual(columns["phone"], ["+34666777888", None])
+        self.assertEqual(columns.rows(), self.db.select())
+        self.assertEqual(self.db.select_columns({"id": 3}, fields=["id", "name"]),
+                         Columns({"id": [], "name": []}))
+
     def test_insert(self):
         self.db.set_table("customers")
-        self.db.insert(data={"name": "José", "age": 33, "phone": "+34777888999"})
+        self.assertEqual(self.db.insert(data={"name": "José", "age": 33, "phone": "+34777888999"}), [2])
         self.assertEqual(self.db.select(filter={"name": "José"}),
             Data({"id": 2, "name": "José", "age": 33, "phone": "+34777888999"}))
 
@@ -147,6 +195,8 @@ class v1_Databases_sqlite(unittest.TestCase):
             Data({"id": 2, "name": "José", "age": 33, "phone": "+34777888999"}))
         self.assertEqual(self.db.select(filter={"name": "Miguel"}),
             Data({"id": 3, "name": "Miguel", "age": 32, "phone": "+34777888999"}))
+        self.assertEqual(self.db.insert(data=[{"id": None, "name": "Ana"}, {"id": 10, "name": "Sofía"},
+                                              {"id": None, "name": "Juan"}]), [11, 10, 12])
 
     def test_select_many(self):
         self.db.set_table("customers")
@@ -161,6 +211,12 @@ class v1_Databases_sqlite(unittest.TestCase):
         self.assertEqual(self.db.select(filter={"name": "María"}),
             Data({"id": 1, "name": "María", "age": 25, "phone": "+34666777888"}))
 
+    def test_update_increment(self):
+        self.db.set_table("customers")
+        self.assertEqual(self.db.update({"age": DBEnums.INCREMENT}, filter={"name": "María"}), 1)
+        self.assertEqual(self.db.update({"age": DBEnums.INCREMENT}, filter={"age": 49}), 0) # Conditional
+        self.assertEqual(self.db.select(filter={"name": "María"}, fields=["age"]), Data({"age": 50}))
+
     def test_delete(self):
         self.db.set_table("customers")
         self.db.insert(data={"name": "José", "age": 33, "phone": "+34777888999"})
@@ -168,6 +224,22 @@ class v1_Databases_sqlite(unittest.TestCase):
         self.assertEqual(self.db.select(),
             Data({"id": 2, "name": "José", "age": 33, "phone": "+34777888999"}))
 
+    def test_transaction(self):
+        self.db.set_table("customers")
+        other = SQLite(database="tests\\test.db")
+        with self.db.transaction():
+            self.db.insert(data={"name": "José", "age": 33, "phone": "+34777888999"})
+            with self.db.transaction():
+                self.db.update({"age": 50}, filter={"name": "María"})
+            self.assertEqual(len(other.select(table="customers")), 1) # Not committed yet
+        self.assertEqual([item["age"] for item in other.select(table="customers")], [50, 33])
+        with self.assertRaises(ZeroDivisionError):
+            with self.db.transaction():
+                self.db.delete(filter={"name": "José"})
+                1/0
+        self.assertEqual(len(self.db.select()), 2)
+        other.disconnect()
+
     def test_create_table(self):
         self.db.create_table("hell", {"name": str, "love": int})
         self.db.set_table("hell")
@@ -240,5 +312,440 @@ class v1_Databases_sqlite(unittest.TestCase):
                          [{"id": 1, "str": "hola", "int": 1, "float": 1.5,
                           "datetime": now, "date": dat}])
 
+    def test_search(self):
+        self.db.create_table("notes", {"title": [str, DBEnums.SEARCHABLE], "body": [str, DBEnums.SEARCHABLE]})
+        self.db.insert([{"title": "Call María", "body": "She wants the premium plan"},
+                        {"title": "Premium plan", "body": "Premium premium premium"}], table="notes")
+        self.db.create_search_index(["title", "body"], table="notes")
+        self.assertEqual([item["id"] for item in self.db.search("premium", table="notes")], [2, 1])
+        self.db.update({"body": "Nothing to say"}, filter={"id": 1}, table="notes")
+        self.db.insert({"title": "Other", "body": "premium"}, table="notes")
+        self.db.delete({"id": 2}, table="notes")
+        self.assertEqual(self.db.search("premium", table="notes"),
+                         Data({"id": 3, "title": "Other", "body": "premium"}))
+        self.db.drop_search_index(table="notes")
+        self.assertFalse(self.db.check_table_exists("notes__search"))
+
+class v1_Databases_engines(unittest.TestCase):
+    def tearDown(self):
+        databases.ENGINES.pop("testing", None)
+
+    def test_lazy_loading(self):
+        code = "import sys, databases; print(sorted(m for m in sys.modules if m.startswith('databases')))"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True).stdout
+        self.assertEqual(output.strip(), "['databases', 'databases.databases']")
+        code = "import sys, entities.entities; print(sorted(m for m in sys.modules if m.startswith('databases.')))"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True).stdout
+        self.assertEqual(output.strip(), "['databases.cache', 'databases.databases', 'databases.filters']")
+        code = ("import sys, databases.databases as d; d.Columns.to_column([1, 2]); print('numpy' in sys.modules); "
+                "d.Columns.to_column([1, 2], use_numpy=True); print('numpy' in sys.modules)")
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True).stdout
+        self.assertEqual(output.split()[0], "False") # Only imported when asked for
+
+    def test_get_engine(self):
+        self.assertIs(get_engine("sqlite"), SQLite)
+        self.assertIs(get_engine(DBTypes.MEMORY), MemoryInterface)
+        self.assertIs(databases.SqliteInterface, SQLite)
+        self.assertIsInstance(new_db_interface(engine=DBTypes.SQLITE, database=MEMORY), SQLite)
+        with self.assertRaises(TypeError):
+            get_engine("not an engine")
+
+    def test_register_engine(self):
+        register_engine("testing", "databases.memory:MemoryInterface")
+        self.assertIsInstance(new_db_interface(engine="testing"), MemoryInterface)
+        register_engine("testing", SQLite)
+        self.assertIsInstance(new_db_interface(engine="testing", database=MEMORY), SQLite)
+        with self.assertRaises(TypeError):
+            register_engine("testing", dict)
+
+class v1_Databases_join(unittest.TestCase):
+    def setUp(self):
+        self.dbs = [new_db_interface(engine="sqlite", database=MEMORY), new_db_interface(engine="memory")]
+        for db in self.dbs:
+            db.create_table("accounts", {"name": str})
+            db.create_table("contacts", {"name": str, "account": int})
+            db.insert([{"name": "Acme"}, {"name": "Initech"}, {"name": "Umbrella"}], table="accounts")
+            db.insert([{"name": "Pepi", "account": 1}, {"name": "Manuel", "account": 1},
+                       {"name": "Sofía", "account": 2}], table="contacts")
+
+    def tearDown(self):
+        self.dbs[0].disconnect()
+
+    def test_create_join_query(self):
+        sql, safe = SQLite._create_join_query("accounts", "contacts", {"id": "account"}, "left",
+                                              [("accounts", "name"), ("contacts", "name")], {"contacts.name": "Pepi"})
+        self.assertEqual(sql, 'SELECT accounts.name AS "accounts.name", contacts.name AS "contacts.name" '
+                              'FROM accounts LEFT JOIN contacts ON accounts.id = contacts.account '
+                              'WHERE contacts.name=:filtercontacts_namevalue0;')
+        self.assertEqual(safe, {"filtercontacts_namevalue0": "Pepi"})
+
+    def test_select_join(self):
+        for db in self.dbs:
+            with self.subTest(db=type(db).__name__):
+                rows = db.select_join("contacts", {"id": "account"}, how="left", fields=["name", "contacts.name"],
+                                      table="accounts")
+                self.assertNotIsInstance(rows, list)
+                self.assertEqual(sorted(rows, key=lambda row: (row["accounts.name"], row["contacts.name"] or "")),
+                                 [{"accounts.name": "Acme", "contacts.name": "Manuel"},
+                                  {"accounts.name": "Acme", "contacts.name": "Pepi"},
+                                  {"accounts.name": "Initech", "contacts.name": "Sofía"},
+                                  {"accounts.name": "Umbrella", "contacts.name": None}])
+                rows = db.select_join("contacts", {"id": "account"}, table="accounts", row_type=RowTypes.TUPLE,
+                                      filter={"contacts.name": ["IN", ["Pepi", "Sofía"]], "id": ["<", 3]})
+                self.assertEqual(sorted(rows), [(1, "Acme", 1, "Pepi", 1), (2, "Initech", 3, "Sofía", 2)])
+                self.assertEqual(len(list(db.select_join("contacts", {"id": "account"}, how="left", table="accounts",
+                                                         filter={"contacts.name": "Pepi"}))), 1)
+                with self.assertRaises(Exception):
+                    db.select_join("contacts", {"id": "account"}, how="outer", table="accounts")
+                with self.assertRaises(Exception):
+                    db.select_join("contacts", {"id": "account"}, fields=["calls.subject"], table="accounts")
+
+class v1_Databases_archive(unittest.TestCase):
+    def engines(self):
+        yield SQLite(database=MEMORY)
+        yield new_db_interface(engine="memory")
+
+    def test_move_and_union(self):
+        for db in self.engines():
+            with self.subTest(engine=type(db).__name__):
+                for table in ("customers", "customers__archive"):
+                    db.create_table(table, {"name": str, "age": int})
+                db.insert([{"name": "María", "age": 49}, {"name": "José", "age": 33},
+                           {"name": "Miguel", "age": 32}, {"name": "Ana", "age": 20}], table="customers")
+                self.assertEqual(db.move({"age": [">", 30]}, "customers__archive", limit=2, table="customers"), 2)
+                self.assertEqual([row["name"] for row in db.select(table="customers__archive", order="id")], ["María", "José"])
+                self.assertEqual(db.move({"age": [">", 30]}, "customers__archive", table="customers"), 1)
+                self.assertEqual(db.count(table="customers"), 1)
+                tables = ["customers", "customers__archive"]
+                self.assertEqual([row["name"] for row in db.select_union(tables, {"age": [">", 30]}, fields=["name"],
+                                                                         order="-age", limit=2, offset=1)],
+                                 ["José", "Miguel"])
+                self.assertEqual(db.select_union(tables, fields=["id"], order="id", row_type=RowTypes.TUPLE),
+                                 Data([(1,), (2,), (3,), (4,)]))
+
+    def test_attach(self):
+        path = os.path.join(tempfile.mkdtemp(), "archive.db")
+        db = SQLite(database=MEMORY)
+        db.attach(path, "archive")
+        db.create_table("archive.customers", {"name": str})
+        db.insert({"name": "María"}, table="archive.customers")
+        self.assertEqual(connect(path).execute("SELECT name FROM customers;").fetchall(), [("María",)])
+        db.disconnect()
+        db.connect() # Attached again
+        self.assertEqual(db.count(table="archive.customers"), 1)
+        with self.assertRaises(Exception):
+            db.attach(path, "archive; DROP")
+
+class v1_Databases_select_cache(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.database = os.path.join(self.path, "data.db")
+        self.db = SQLite(database=self.database, cache=4)
+        self.db.create_table("roles", {"id": [str, DBEnums.PRIMARY], "parent": str})
+        self.db.insert([{"id": "admin", "parent": ""}, {"id": "sales", "parent": "admin"}], table="roles")
+
+    def tearDown(self):
+        self.db.disconnect()
+        shutil.rmtree(self.path)
+
+    def test_lru(self):
+        cache = SelectCache(size=2, max_bytes=2**20)
+        cache.put("a", 1, [(1,)])
+        cache.put("b", 1, [(2,)])
+        self.assertEqual(cache.get("a", 1), [(1,)])
+        cache.put("c", 1, [(3,)])
+        self.assertIs(cache.get("b", 1), MISS)
+        self.assertIs(cache.get("a", 2), MISS)
+        self.assertEqual((len(cache), cache.evictions, cache.invalidations), (1, 1, 1))
+        cache.put("d", 1, [("x"*2**20,)])
+        self.assertIs(cache.get("d", 1), MISS)
+
+    def test_hits_and_writes(self):
+        self.assertEqual(self.db.select(table="roles"), self.db.select(table="roles"))
+        self.assertEqual((self.db.cache.hits, self.db.cache.misses), (1, 1))
+        self.db.select(table="roles")[0]["id"] = "changed"
+        self.db.update({"parent": "none"}, filter={"id": "admin"}, table="roles")
+        self.assertEqual(self.db.select({"id": "admin"}, table="roles", row_type=RowTypes.TUPLE), [("admin", "none")])
+        self.assertEqual(self.db.select(table="roles")[0]["id"], "admin")
+        self.assertEqual(self.db.cache.stats()["hit_ratio"], self.db.cache.hit_ratio)
+
+    def test_other_connections(self):
+        self.assertEqual(len(self.db.select(table="roles")), 2)
+        conn = connect(self.database)
+        conn.execute("INSERT INTO roles (id, parent) VALUES ('support', 'admin');")
+        conn.commit()
+        conn.close()
+        self.assertEqual(len(self.db.select(table="roles")), 3)
+        self.assertEqual(self.db.cache.hits, 0)
+
+class v1_Databases_sqlite_compact(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.database = os.path.join(self.path, "compact.db")
+        self.now = datetime(2021, 3, 4, 5, 6, 7, 891011)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_compact_storage(self):
+        db = SQLite(database=self.database, compact=True)
+        db.create_table("events", {"name": str, "at": datetime, "done": bool})
+        db.insert([{"name": "a", "at": self.now, "done": True},
+                   {"name": "b", "at": self.now+timedelta(days=1), "done": False}], table="events")
+        self.assertEqual(db.select(table="events"),
+                         Data([{"id": 1, "name": "a", "at": self.now, "done": True},
+                               {"id": 2, "name": "b", "at": self.now+timedelta(days=1), "done": False}]))
+        self.assertEqual([item["name"] for item in db.select({"at": [">", self.now]}, table="events")], ["b"])
+        db.cursor.execute("SELECT typeof(at) AS at, typeof(done) AS done FROM events")
+        self.assertEqual(db.cursor.fetchone(), {"at": "integer", "done": "integer"})
+        self.assertEqual(db.get_schema(table="events")["at"], [datetime])
+        db.disconnect()
+
+    def test_migrate_compact(self):
+        db = SQLite(database=self.database)
+        db.create_table("events", {"name": [str, DBEnums.SEARCHABLE, DBEnums.INDEX], "at": datetime, "done": bool})
+        db.create_search_index(["name"], table="events")
+        db.insert([{"name": "first call", "at": self.now, "done": True},
+                   {"name": "second call", "at": self.now, "done": False}], table="events")
+        db.disconnect()
+        db = SQLite(database=self.database, compact=True)
+        self.assertEqual(db.migrate_compact(), ["events"])
+        self.assertEqual(db.migrate_compact(), [])
+        self.assertEqual(db.select({"done": True}, table="events"),
+                         Data({"id": 1, "name": "first call", "at": self.now, "done": True}))
+        self.assertEqual([item["id"] for item in db.search("second", table="events")], [2])
+        db.insert({"name": "third call", "at": self.now, "done": True}, table="events")
+        self.assertEqual(len(db.search("call", table="events")), 3)
+        db.disconnect()
+
+    def test_migrate_constraints(self):
+        db = SQLite(database=self.database)
+        db.cursor.execute("CREATE TABLE calls (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                          "at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, code TEXT UNIQUE, done BOOLEAN);")
+        db.cursor.execute("CREATE TABLE slots (day INTEGER, room TEXT, at TIMESTAMP, PRIMARY KEY (day, room));")
+        db.insert([{"id": 9, "at": self.now, "code": "a"}, {"id": 10, "at": self.now, "code": "b"}], table="calls")
+        db.delete({"id": 10}, table="calls")
+        db.insert({"day": 1, "room": "a", "at": self.now}, table="slots")
+        with db.transaction():
+            with self.assertRaises(RuntimeError):
+                db.migrate_compact()
+        self.assertEqual(db.migrate_compact(), ["calls", "slots"])
+        self.assertEqual(db.insert({"code": "c"}, table="calls"), [11]) # AUTOINCREMENT kept
+        with self.assertRaises(Error):
+            db.insert({"code": "a"}, table="calls")
+        with self.assertRaises(Error):
+            db.insert({"at": None, "code": "d"}, table="calls")
+        self.assertLess(abs(db.select({"id": 11}, table="calls", fields=["at"])[0]["at"]-datetime.utcnow()), timedelta(minutes=1))
+        self.assertEqual(db.select(table="slots"), Data({"day": 1, "room": "a", "at": self.now}))
+        db.disconnect()
+
+    def test_storage_by_column(self):
+        db = SQLite(database=self.database)
+        db.create_table("events", {"name": str, "at": datetime})
+        db.disconnect()
+        db = SQLite(database=self.database, compact=True)
+        db.create_table("calls", {"at": datetime})
+        db.insert({"name": "a", "at": self.now}, table="events")
+        db.insert({"at": self.now}, table="calls")
+        self.assertEqual(db.select({"at": self.now}, table="events"), Data({"id": 1, "name": "a", "at": self.now}))
+        self.assertEqual(db.select({"at": ["<=", self.now]}, table="calls"), Data({"id": 1, "at": self.now}))
+        db.cursor.execute("SELECT typeof(events.at) AS events, typeof(calls.at) AS calls FROM events, calls")
+        self.assertEqual(db.cursor.fetchone(), {"events": "text", "calls": "integer"})
+        self.assertEqual(db.migrate_compact(["events"]), ["events"])
+        db.disconnect()
+        db = SQLite(database=self.database)
+        self.assertTrue(db._compact)
+        db.insert({"name": "b", "at": self.now+timedelta(days=1)}, table="events")
+        db.update({"at": self.now+timedelta(days=2)}, filter={"at": [">", self.now]}, table="events")
+        self.assertEqual([item["at"] for item in db.select(table="events")], [self.now, self.now+timedelta(days=2)])
+        db.disconnect()
+
+class v1_Databases_memory(unittest.TestCase):
+    def setUp(self):
+        self.db = new_db_interface(engine="memory")
+        self.db.create_table("customers", {"name": [str, DBEnums.INDEX], "phone": str, "age": int})
+        self.db.insert({"name": "María", "age": 49, "phone": "+34666777888"}, table="customers")
+        self.db.set_table("customers")
+
+    def test_engine(self):
+        self.assertIsInstance(self.db, MemoryInterface)
+
+    def test_update_increment(self):
+        self.assertEqual(self.db.update({"age": DBEnums.INCREMENT}, filter={"age": 49}), 1)
+        self.assertEqual(self.db.update({"age": DBEnums.INCREMENT}, filter={"age": 49}), 0)
+        self.assertEqual(self.db.select(fields=["age"]), Data({"age": 50}))
+
+    def test_select(self):
+        self.assertEqual(self.db.select(filter={"name": "María"}),
+            Data({"id": 1, "name": "María", "phone": "+34666777888", "age": 49}))
+        self.assertEqual(self.db.select(filter={"name": "José"}), Data([]))
+
+    def test_filters(self):
+        self.db.insert(data=[{"name": "José", "age": 33, "phone": "+34777888999"},
+                             {"name": "Miguel", "age": 32, "phone": None}])
+        def ids(filter):
+            return [item["id"] for item in self.db.select(filter=filter, fields=["id"])]
+        self.assertEqual(ids({"id": [(">=", 2), ("<=", 3)]}), [2, 3])
+        self.assertEqual(ids({"name": ["IN", ["María", "Miguel"]]}), [1, 3])
+        self.assertEqual(ids({"name": ["like", "jo%"]}), [2])
+        self.assertEqual(ids({"age": ["!=", 33], "name": ["!=", "María"]}), [3])
+        self.assertEqual(ids({"phone": None}), [])
+        self.assertEqual(ids({"phone": ["like", "+34%"]}), [1, 2])
+        self.assertEqual([item["id"] for item in self.db.select(fields=["id"], order=["phone", "-age"], limit=2)], [3, 1])
+        self.assertEqual([item["id"] for item in self.db.select(fields=["id"], order="age", offset=1)], [2, 1])
+        self.assertEqual(self.db.count({"age": [">", 32]}), 2)
+
+    def test_sorted_index(self):
+        self.db.create_table("deals", {"stage": str, "amount": [float, DBEnums.SORTED]})
+        self.db.insert([{"stage": "won", "amount": 100.0}, {"stage": "lost", "amount": None},
+                        {"stage": "won", "amount": 25.5}, {"stage": "open", "amount": 50}], table="deals")
+        def ids(filter):
+            return [item["id"] for item in self.db.select(filter=filter, table="deals", fields=["id"])]
+        self.assertEqual(ids({"amount": [(">", 25.5), ("<=", 100)]}), [1, 4])
+        self.assertEqual(ids({"amount": ["<", 50], "stage": "won"}), [3])
+        self.assertIsNotNone(self.db._get_table("deals").sorted["amount"])
+        self.db.update({"amount": 10}, filter={"id": 1}, table="deals")
+        self.assertIsNone(self.db._get_table("deals").sorted["amount"])
+        self.assertEqual(ids({"amount": ["<", 50]}), [1, 3])
+        self.db.delete({"id": 3}, table="deals")
+        self.assertEqual(ids({"amount": [">=", 10]}), [1, 4])
+        self.assertEqual(ids({"amount": ["<", "a"]}), [1, 4]) # Numbers before text, as in sqlite
+
+    def test_select_row_types(self):
+        self.assertEqual(self.db.select(fields=["name", "age"], row_type=RowTypes.TUPLE), [("María", 49)])
+        record = self.db.select({"name": "María"}, row_type=RowTypes.RECORD)[0]
+        self.assertEqual((record.id, record["phone"]), (1, "+34666777888"))
+        self.assertIs(type(self.db.select(row_type=RowTypes.ROW)[0]), type(record))
+
+    def test_select_columns(self):
+        self.db.insert(data=[{"name": "José", "age": 33, "phone": "+34777888999"},
+                             {"name": "Miguel", "age": None, "phone": None}])
+        columns = self.db.select_columns({"id": [">", 1]}, fields=["id", "age"])
+        self.assertEqual(columns, {"id": array("q", [2, 3]), "age": [33, None]})
+        self.assertEqual(columns.length, 2)
+
+    def test_change_log(self):
+        self.db.create_change_log(keep=3)
+        self.db.insert(data=[{"name": "José", "age": 33, "phone": "+34777888999"},
+                             {"name": "Miguel", "age": 32, "phone": None}])
+        self.db.update({"age": 34}, filter={"name": "José"})
+        self.db.delete({"name": "Miguel"})
+        self.assertEqual([row[:3] for row in self.db.changes_since(1)], [(2, 3, "I"), (3, 2, "U"), (4, 3, "D")])
+        self.db.insert({"name": "Pepe"})
+        self.assertEqual(self.db.oldest_change(), 3)
+
+    def test_insert_update_delete(self):
+        self.db.insert(data=[{"name": "José", "age": 33, "phone": "+34777888999"},
+                             {"name": "Miguel", "age": 32, "phone": "+34777888999"}])
+        self.db.update({"name": "Pepe"}, filter={"name": "José"})
+        self.db.delete(filter={"id": 1})
+        self.assertEqual(self.db.insert(data={"name": "Ana", "age": 20, "phone": ""}), [4])
+        self.assertEqual(self.db.select(filter={"name": "Pepe"}),
+            Data({"id": 2, "name": "Pepe", "phone": "+34777888999", "age": 33}))
+        self.assertEqual([item["id"] for item in self.db.select()], [2, 3, 4])
+        with self.assertRaises(RuntimeError):
+            self.db.insert(data={"id": 2, "name": "Clone"})
+
+    def test_alter_table(self):
+        self.db.alter_table_add_column("mail", str)
+        self.db.alter_table_rename_column("phone", "contact")
+        self.db.alter_table_modify_column("age", str)
+        self.db.alter_table_drop_column("mail")
+        self.assertEqual(self.db.select(), Data({"id": 1, "name": "María", "contact": "+34666777888", "age": "49"}))
+        self.assertEqual(self.db.get_primary_key(), "id")
+        self.db.alter_table_rename_table("clientes")
+        self.assertFalse(self.db.check_table_exists("customers"))
+        self.assertEqual(self.db.get_schema(table="clientes"),
+                         {"id": [int, DBEnums.PRIMARY], "name": [str], "contact": [str], "age": [str]})
+
+class v1_Databases_sharded(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db = new_db_interface(engine="sqlite_sharded", database=os.path.join(self.path, "data.db"),
+                                   partitions="activities:3;notes:3")
+        self.db.create_table("customers", {"name": str, "age": int})
+        self.db.create_table("activities", {"subject": str, "customer": int})
+
+    def tearDown(self):
+        self.db.delete_database()
+        shutil.rmtree(self.path)
+
+    def test_files(self):
+        self.assertIsInstance(self.db, ShardedSqliteInterface)
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         ["data.activities.0.db", "data.activities.1.db", "data.activities.2.db",
+                          "data.customers.db", "data.db"])
+
+    def test_partitioned_insert_select(self):
+        self.db.insert([{"subject": "Call "+str(i), "customer": i % 2} for i in range(10)], table="activities")
+        self.assertEqual([item["id"] for item in self.db.select(table="activities")], list(range(1, 11)))
+        for index, shard in enumerate(self.db._route("activities")):
+            self.assertTrue(all([item["id"] % 3 == index for item in shard.select(table="activities")]))
+        self.assertEqual(self.db.select({"id": 4}, table="activities"),
+                         Data({"id": 4, "subject": "Call 3", "customer": 1}))
+        self.assertEqual(len(self.db._prune("activities", {"id": ["IN", [1, 4]]})), 1)
+        self.assertEqual(len(self.db.select({"customer": 0}, table="activities")), 5)
+        self.assertEqual(self.db.select({"id": [">", 8]}, table="activities", row_type=RowTypes.TUPLE),
+                         [(9, "Call 8", 0), (10, "Call 9", 1)])
+        self.assertEqual(self.db.select(table="activities", fields=["subject"], order=["-customer", "-id"], limit=3, offset=1),
+                         [{"subject": "Call 7"}, {"subject": "Call 5"}, {"subject": "Call 3"}])
+        self.assertEqual([item["id"] for item in self.db.select(table="activities", limit=2, offset=4)], [5, 6])
+        self.assertEqual(self.db.count({"customer": 1}, table="activities"), 5)
+        self.assertEqual(self.db.select_columns(table="activities", fields=["id", "customer"]),
+                         {"id": array("q", range(1, 11)), "customer": array("q", [0, 1]*5)})
+
+    def test_partitioned_update_delete(self):
+        self.db.insert([{"subject": "Call "+str(i), "customer": i % 2} for i in range(10)], table="activities")
+        self.db.update({"subject": "Done"}, filter={"customer": 1}, table="activities")
+        self.db.delete({"id": ["<=", 5]}, table="activities")
+        self.db.insert({"subject": "New", "customer": 3}, table="activities")
+        self.assertEqual([(item["id"], item["subject"]) for item in self.db.select(table="activities")],
+                         [(6, "Done"), (7, "Call 6"), (8, "Done"), (9, "Call 8"), (10, "Done"), (11, "New")])
+        with self.assertRaises(RuntimeError):
+            self.db.update({"id": 20}, filter={"id": 6}, table="activities")
+
+    def test_transaction(self):
+        with self.assertRaises(ZeroDivisionError):
+            with self.db.transaction():
+                self.db.insert([{"subject": "Call "+str(i)} for i in range(4)], table="activities")
+                self.db.insert({"name": "María"}, table="customers")
+                1/0
+        self.assertEqual(self.db.select(table="activities"), [])
+        self.assertEqual(self.db.select(table="customers"), [])
+        with self.db.transaction():
+            self.db.insert([{"subject": "Call "+str(i)} for i in range(4)], table="activities")
+        self.assertEqual([item["id"] for item in self.db.select(table="activities")], [1, 2, 3, 4])
+
+    def test_search(self):
+        self.db.create_table("notes", {"body": [str, DBEnums.SEARCHABLE]})
+        self.db.create_search_index(["body"], table="notes")
+        subjects = {3: "call about the premium plan and other things", 4: "call back", 8: "call call call"}
+        self.db.insert([{"body": subjects.get(i, "mail")} for i in range(1, 10)], table="notes")
+        self.assertEqual([item["id"] for item in self.db.search("call", table="notes", limit=1)], [8])
+        self.assertEqual([item["id"] for item in self.db.search("call", table="notes")], [8, 4, 3])
+        self.assertEqual([item["id"] for item in self.db.search("call-back", table="notes")], [4])
+        self.assertEqual([item["id"] for item in self.db.search("body: back OR premium", table="notes", raw=True)], [4, 3])
+
+    def test_change_log(self):
+        self.db.create_change_log("activities")
+        self.db.insert([{"subject": "Call "+str(i)} for i in range(4)], table="activities")
+        changes = self.db.changes_since(0, table="activities")
+        self.assertEqual(sorted([row[1:3] for row in changes]), [(1, "I"), (2, "I"), (3, "I"), (4, "I")])
+        self.assertEqual([row[0] for row in changes], sorted(set([row[0] for row in changes])))
+        self.db.update({"subject": "Done"}, filter={"id": 2}, table="activities")
+        self.db.delete({"id": 4}, table="activities")
+        later = self.db.changes_since(changes[-1][0], table="activities")
+        self.assertEqual(sorted([row[1:3] for row in later]), [(2, "U"), (4, "D")])
+        self.assertEqual(self.db.changes_since(later[0][0], table="activities"), later[1:])
+        self.assertEqual(self.db.changes_since(later[-1][0], table="activities"), [])
+        self.assertFalse(self.db.changes_pruned(later[-1][0], table="activities"))
+
+    def test_routed_table(self):
+        self.db.insert({"name": "María", "age": 49}, table="customers")
+        self.db.alter_table_rename_table("clients", table="customers")
+        self.assertEqual(self.db.select(table="clients"), Data({"id": 1, "name": "María", "age": 49}))
+        self.assertEqual(self.db.get_primary_key("clients"), "id")
+        self.assertFalse(self.db.check_table_exists("customers"))
+
 if __name__ == '__main__':
     unittest.main()
@@ -4,16 +4,26 @@
 VERSION = 0.1
 
 import unittest
+from array import array
 from databases.sqlite import SqliteInterface as SQLite, MEMORY
 from databases.databases import Data, DBEnums
-from entities.defaults import get_entity, get_entities, persistent, install_persistency
+from entities.defaults import get_entity, get_entities, persistent, install_persistency, parse_definition, install_many
 from entities.entities import Entity, TIMEOUT, set_timeout
-from entities.fields import Field, Fields
+from entities.items import Item, Refresher, WriteModes, ConflictError
+from entities.queryset import QuerySet
+from entities.cache import FilterCache
+from entities.archive import ArchivePolicy
+from entities import items
+from entities.fields import Field, Fields, ValidationError
 from sqlite3 import Error
+import gc
+import json
 import threading
 import asyncio
 import time
 import os
+import tempfile
+from datetime import datetime, date, timedelta
 
 class v1_Fields(unittest.TestCase):
     def setUp(self):
@@ -41,6 +51,21 @@ class v1_Fields(unittest.TestCase):
         self.assertEqual(fields["foo"].description, "")
         self.assertEqual(fields["bar"].description, "")
 
+    def test_validate(self):
+        fields = Fields(self.db, "validated", {"name": str, "age": int, "score": float, "active": bool,
+                                               "born": datetime, "day": date, "data": object})
+        self.assertEqual(fields.validate([{"name": b"raw", "age": "32", "score": 1, "active": "yes"},
+                                          {"born": "1982-11-04T10:00", "day": datetime(2020, 1, 2, 3), "data": [1]}]),
+                         [{"name": b"raw", "age": 32, "score": 1.0, "active": True},
+                          {"born": datetime(1982, 11, 4, 10), "day": date(2020, 1, 2), "data": [1]}])
+        self.assertEqual(fields.validate({"id": "3", "age": None}, "id"), {"id": 3, "age": None})
+        with self.assertRaises(ValidationError) as context:
+            fields.validate([{"age": "old", "other": 1}, {"age": 1.5}, {"active": "maybe"}])
+        self.assertEqual([(row, field) for row, field, _, _ in context.exception.errors],
+                         [(0, "other"), (0, "age"), (1, "age"), (2, "active")])
+        fields["rank"] = int # Compiled again
+        self.assertEqual(fields.coerce("rank", "7"), 7)
+
 class v1_Entity_setup(unittest.TestCase):
     def setUp(self):
         self.db = SQLite(database=MEMORY)
@@ -119,6 +144,81 @@ class v1_Entity_and_defaults(unittest.TestCase):
         entity = get_entity(self.db, "ninini")
         self.assertEqual(entity.get({"foo": "Hola"}), [{"id":1, "foo": "Hola", "bar": 10}])
 
+    def test_get_entities(self):
+        Entity(self.db, "contacts", "Contacts", {"name": [str, DBEnums.SEARCHABLE], "born": datetime},
+               "Contacts", parent=self.entity, parent_field="bar").install()
+        snapshot = os.path.join(tempfile.mkdtemp(), "metadata.json")
+        for cached in (False, True):
+            for table in ("ninini", "contacts"):
+                del(Entity.persistent[self.db][table])
+            queries = []
+            self.db.conn.set_trace_callback(lambda sql: "FROM __" in sql and queries.append(sql))
+            entities = get_entities(self.db, snapshot=snapshot)
+            self.db.conn.set_trace_callback(None)
+            self.assertEqual(len(queries), 0 if cached else 2)
+            self.assertEqual(entities["Contacts"].fields["born"].definition, datetime)
+            self.assertEqual(entities["Contacts"].fields.searchable, ["name"])
+            self.assertIs(entities["Contacts"].relation("ninini")[0], entities["ninini"])
+        Entity(self.db, "calls", "Calls", {"subject": str}, "Calls").install()
+        self.assertIn("Calls", get_entities(self.db, snapshot=snapshot))
+
+    def test_warm_start(self):
+        path = tempfile.mkdtemp()
+        database, snapshot = os.path.join(path, "data.db"), os.path.join(path, "metadata.json")
+        db = SQLite(database=database)
+        install_persistency(db)
+        get_entities(db, snapshot=snapshot)
+        db.disconnect()
+        db = SQLite(database=database)
+        get_entities(db, snapshot=snapshot) # From the snapshot
+        Entity(db, "deals", "Deals", {"stage": str}, "Deals").install()
+        self.assertEqual(db.count({"table_name": "deals"}, table="__entities"), 1)
+        self.assertEqual(db.count({"table_name": "deals"}, table="__fields"), 1)
+        db.disconnect()
+        db = SQLite(database=database)
+        with self.assertRaises(RuntimeError):
+            Entity(db, "leads", "Leads", {"name": str}, "Leads").install()
+        self.assertFalse(db.check_table_exists("leads"))
+        self.assertIn("Deals", get_entities(db, snapshot=snapshot))
+        db.disconnect()
+
+    def test_install(self):
+        queries = []
+        self.db.conn.set_trace_callback(queries.append)
+        Entity(self.db, "deals", "Deals", {"stage": str, "amount": float, "units": int}, "Deals").install()
+        self.assertEqual((queries[0], queries[-1]), ("BEGIN", "COMMIT"))
+        self.assertEqual(queries.count("COMMIT"), 1)
+        leads = Entity(self.db, "leads", "Leads", {"name": str}, "Leads")
+        with self.assertRaises(Error):
+            install_many([leads, Entity(self.db, "bad table", "Bad", {"name": str}, "Wrong name")])
+        self.assertFalse(self.db.check_table_exists("leads"))
+        self.assertEqual(self.db.count({"table_name": "leads"}, table="__entities"), 0)
+        self.assertFalse(leads.fields.installed or getattr(leads, "_installed", False))
+        install_many([leads])
+        self.assertTrue(leads.fields.installed and leads._installed)
+        self.assertEqual([field["name"] for field in self.db.select({"table_name": "leads"}, table="__fields")], ["name"])
+
+    def test_validation(self):
+        queries = []
+        self.db.conn.set_trace_callback(queries.append)
+        with self.assertRaises(ValidationError):
+            self.entity.insert([{"foo": "Bien", "bar": "13"}, {"foo": "Mal", "bar": "trece"}])
+        self.assertEqual(queries, [])
+        self.entity.insert([{"foo": "Bien", "bar": "13"}])
+        self.assertEqual(self.entity.get({"foo": "Bien"}).first()["bar"], 13)
+        hola = self.entity[1]
+        hola["bar"] = "11"
+        self.assertEqual(hola["bar"], 11)
+        with self.assertRaises(ValidationError):
+            hola["bar"] = "once"
+        self.assertEqual(self.db.select({"id": 1}, table="ninini")[0]["bar"], 11)
+
+    def test_parse_definition(self):
+        self.assertIs(parse_definition("int"), int)
+        self.assertEqual(parse_definition("str,DBEnums.SEARCHABLE"), [str, DBEnums.SEARCHABLE])
+        with self.assertRaises(TypeError):
+            parse_definition("__import__('os').getcwd()")
+
     def test_new_field(self):
         self.entity.fields["kitty"] = float
         self.entity.replace({"id": 1}, {"kitty": 1.3})
@@ -141,6 +241,756 @@ class v1_Entity_and_defaults(unittest.TestCase):
                                              {"id": 2, "foo": "Adios", "bar": 12}])
         self.assertEqual(self.entity["foo": "Hola"], [{"id": 1, "foo": "Hola", "bar": 10}])
 
+class v1_Entity_search(unittest.TestCase):
+    def setUp(self):
+        self.db = SQLite(database=MEMORY)
+        self.db.connect()
+        install_persistency(self.db)
+        self.entity = Entity(self.db, "contacts", "Contacts",
+                             {"name": [str, DBEnums.SEARCHABLE],
+                              "notes": [str, DBEnums.SEARCHABLE],
+                              "age": int}, "Searchable contacts")
+        self.entity.install()
+        self.entity.insert([{"name": "Pepi", "notes": "Wants a call from Manuel", "age": 32},
+                            {"name": "Manuel", "notes": "Manuel is Pepi's manager", "age": 54}])
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def test_search(self):
+        self.assertEqual(self.entity.search("manuel"),
+                         [{"id": 2, "name": "Manuel", "notes": "Manuel is Pepi's manager", "age": 54},
+                          {"id": 1, "name": "Pepi", "notes": "Wants a call from Manuel", "age": 32}])
+        self.assertEqual(self.entity.search("name: pepi", raw=True),
+                         [{"id": 1, "name": "Pepi", "notes": "Wants a call from Manuel", "age": 32}])
+        self.assertEqual(len(self.entity.search("manuel", limit=1)), 1)
+
+    def test_punctuation(self):
+        self.entity.insert([{"name": "Brian O'Brien", "notes": "AT&T Inc. co-op", "age": 40}])
+        for query in ("O'Brien", "AT&T", "Inc.", "co-op", 'co-op "', "name: pepi", "brie*", "*", ""):
+            with self.subTest(query=query):
+                self.assertEqual([item["id"] for item in self.entity.search(query)],
+                                 [] if query in ("name: pepi", "*", "") else [3])
+
+    def test_search_after_reload(self):
+        del(Entity.persistent[self.db]["contacts"])
+        entity = get_entity(self.db, "contacts")
+        self.assertEqual(entity.fields.searchable, ["name", "notes"])
+        self.assertEqual([item["id"] for item in entity.search("manager")], [2])
+
+class v1_Entity_aggregate(unittest.TestCase):
+    def setUp(self):
+        self.db = SQLite(database=MEMORY)
+        self.db.connect()
+        self.entity = Entity(self.db, "deals", "Deals",
+                             {"stage": str, "amount": float, "units": int}, "Deals by stage")
+        self.entity.install()
+        self.entity.insert([{"stage": "won", "amount": 100.0, "units": 1},
+                            {"stage": "won", "amount": 50.0, "units": 3},
+                            {"stage": "lost", "amount": 25.5, "units": None}])
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def test_columns(self):
+        self.assertEqual(self.entity.columns(["id", "stage"]),
+                         {"id": array("q", [1, 2, 3]), "stage": ["won", "won", "lost"]})
+
+    def test_aggregate(self):
+        self.assertEqual(self.entity.aggregate(["amount", "units"]),
+                         {"amount": {"count": 3, "sum": 175.5, "min": 25.5, "max": 100.0, "mean": 58.5},
+                          "units": {"count": 2, "sum": 4, "min": 1, "max": 3, "mean": 2.0}})
+        self.assertEqual(self.entity.aggregate(["amount"], group_by="stage"),
+                         {"won": {"amount": {"count": 2, "sum": 150.0, "min": 50.0, "max": 100.0, "mean": 75.0}},
+                          "lost": {"amount": {"count": 1, "sum": 25.5, "min": 25.5, "max": 25.5, "mean": 25.5}}})
+        self.assertEqual(self.entity.aggregate(["stage"], filter={"units": 3}),
+                         {"stage": {"count": 1, "sum": None, "min": "won", "max": "won", "mean": None}})
+
+class v1_Entity_queryset(unittest.TestCase):
+    def setUp(self):
+        self.db = SQLite(database=MEMORY)
+        self.db.connect()
+        self.entity = Entity(self.db, "people", "People", {"name": str, "age": int, "city": str}, "QuerySets")
+        self.entity.install()
+        self.entity.insert([{"name": "Pepi", "age": 42, "city": "Madrid"},
+                            {"name": "Manuel", "age": 50, "city": "Soria"},
+                            {"name": "Sofía", "age": 30, "city": "Madrid"},
+                            {"name": "Ana", "age": 50, "city": "Madrid"}])
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def test_lazy(self):
+        query = self.entity.get({"city": "Madrid"})
+        self.assertIsInstance(query, QuerySet)
+        self.assertEqual(query.count(), 3)
+        self.assertTrue(query)
+        self.assertFalse(query.filter(age=[">", 60]))
+        self.assertIsNone(query._result) # Nothing fetched yet
+        self.assertEqual(query.filter({"age": [">", 30]}).order_by("-age")[0]["name"], "Ana")
+        self.assertIsNone(query._result)
+        items = list(query)
+        self.assertIs(query._result, query._fetch())
+        self.assertIs(query[0], items[0])
+        self.assertIs(self.entity[1], items[0])
+
+    def test_chaining(self):
+        query = self.entity.get().order_by("-age", "name")
+        self.assertEqual([item["name"] for item in query], ["Ana", "Manuel", "Pepi", "Sofía"])
+        self.assertEqual([item["name"] for item in query[1:3]], ["Manuel", "Pepi"])
+        self.assertEqual([item["name"] for item in query[1:][1:]], ["Pepi", "Sofía"])
+        self.assertEqual(query.limit(2, offset=1).count(), 2)
+        self.assertEqual(query.filter(city="Madrid").filter(city=["!=", "Soria"]).first()["name"], "Ana")
+        self.assertIsNone(query.filter(name="Nadie").first())
+        self.assertEqual(self.entity.get({"id": 3}).only("name").query["fields"], ["id", "name"])
+        self.assertEqual(self.entity.get({"id": 3}).only("name")[0]["name"], "Sofía")
+        self.assertEqual(self.entity[2:3], [{"id": 2, "name": "Manuel", "age": 50, "city": "Soria"},
+                                            {"id": 3, "name": "Sofía", "age": 30, "city": "Madrid"}])
+        with self.assertRaises(IndexError):
+            query[10]
+        with self.assertRaises(RuntimeError):
+            query[:2].filter(city="Madrid")
+
+class v1_Entity_prefetch(unittest.TestCase):
+    def setUp(self):
+        self.db = SQLite(database=MEMORY)
+        self.db.connect()
+        self.accounts = Entity(self.db, "accounts", "Accounts", {"name": str}, "Accounts")
+        self.contacts = Entity(self.db, "accounts:contacts", "Contacts", {"name": str, "account": int},
+                               "Contacts of accounts", parent_field="account")
+        self.calls = Entity(self.db, "contacts:calls", "Calls", {"subject": str, "contact": int},
+                            "Calls to contacts", parent_field="contact")
+        for entity in (self.accounts, self.contacts, self.calls):
+            entity.install()
+        self.accounts.insert([{"name": "Acme"}, {"name": "Initech"}, {"name": "Umbrella"}])
+        self.contacts.insert([{"name": "Pepi", "account": 1}, {"name": "Manuel", "account": 1},
+                              {"name": "Sofía", "account": 2}])
+        self.calls.insert([{"subject": "Hello", "contact": 1}, {"subject": "Bye", "contact": 1},
+                           {"subject": "Offer", "contact": 3}])
+        self.queries = []
+        self.db.conn.set_trace_callback(lambda sql: "sqlite_master" not in sql and self.queries.append(sql))
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def test_prefetch(self):
+        accounts = list(self.accounts.get(prefetch=["contacts.calls"]))
+        self.assertEqual(len(self.queries), 3)
+        self.assertEqual([contact["name"] for contact in accounts[0].related("contacts")], ["Pepi", "Manuel"])
+        self.assertEqual([call["subject"] for call in accounts[0].related("contacts")[0].related("calls")], ["Hello", "Bye"])
+        self.assertEqual(accounts[2].related("contacts"), [])
+        self.assertEqual(accounts[1].related("contacts")[0].related("calls")[0]["subject"], "Offer")
+        self.assertEqual(len(self.queries), 3)
+        self.assertIs(self.contacts[3].related("accounts"), accounts[1])
+
+    def test_stale(self):
+        account = self.accounts.get(prefetch=["contacts"])[0]
+        self.assertEqual(len(account.related("contacts")), 2)
+        self.contacts.insert({"name": "Sofía", "account": 1})
+        self.assertEqual([contact["name"] for contact in account.related("contacts")], ["Pepi", "Manuel", "Sofía"])
+        account = self.accounts.get(prefetch=["contacts"])[0]
+        self.contacts.delete({"id": 1})
+        self.assertEqual([contact["id"] for contact in self.accounts[1].related("contacts")], [2, 4])
+        self.accounts.get(prefetch=["contacts"])[0]
+        self.assertIsNotNone(account._related)
+        self.accounts[1]
+        self.assertIsNone(account._related)
+
+    def test_depth_and_parents(self):
+        accounts = list(self.accounts.get().prefetch_related(depth=2))
+        self.assertEqual(len(self.queries), 3)
+        self.assertEqual(len(accounts[0].related("contacts")[1].related("calls")), 0)
+        calls = list(self.calls.get().prefetch_related("contacts.accounts"))
+        self.assertEqual([call.related("contacts").related("accounts")["name"] for call in calls],
+                         ["Acme", "Acme", "Initech"])
+        with self.assertRaises(AttributeError):
+            self.accounts.get().prefetch_related("calls")
+
+class v1_Entity_join(unittest.TestCase):
+    def setUp(self):
+        self.db = SQLite(database=MEMORY)
+        self.db.connect()
+        self.accounts = Entity(self.db, "accounts", "Accounts", {"name": str}, "Accounts")
+        self.contacts = Entity(self.db, "accounts:contacts", "Contacts", {"name": str, "account": int},
+                               "Contacts of accounts", parent_field="account")
+        for entity in (self.accounts, self.contacts):
+            entity.install()
+        self.accounts.insert([{"name": "Acme"}, {"name": "Initech"}, {"name": "Umbrella"}])
+        self.contacts.insert([{"name": "Pepi", "account": 1}, {"name": "Sofía", "account": 2}])
+        self.queries = []
+        self.db.conn.set_trace_callback(lambda sql: "sqlite_master" not in sql and self.queries.append(sql))
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def test_join(self):
+        rows = sorted(self.accounts.join("contacts", how="left", fields=["name", "contacts.name"]),
+                      key=lambda row: row["accounts.name"])
+        self.assertEqual([row["contacts.name"] for row in rows], ["Pepi", "Sofía", None])
+        self.assertEqual(len(self.queries), 1)
+        self.assertEqual(list(self.contacts.join(self.accounts, fields=["name", "accounts.name"], filter={"name": "Pepi"})),
+                         [{"contacts.name": "Pepi", "accounts.name": "Acme"}])
+        self.assertEqual(list(self.accounts.join(self.contacts, on="account", filter={"id": 2}, fields=["contacts.name"])),
+                         [{"contacts.name": "Sofía"}])
+
+    def test_nested(self):
+        pairs = sorted(self.accounts.join("contacts", how="left", nested=True), key=lambda pair: pair[0]["id"])
+        self.assertIs(pairs[0][0], self.accounts[1])
+        self.assertEqual(pairs[1][1], {"id": 2, "name": "Sofía", "account": 2})
+        self.assertIsNone(pairs[2][1])
+
+class v1_Entity_materialized(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "materialized.db")
+        self.db = SQLite(database=self.path)
+        self.db.connect()
+        self.roles = Entity(self.db, "roles", "Roles", {"name": [str, DBEnums.INDEX], "level": [int, DBEnums.SORTED]},
+                            "Roles of users", materialize=True)
+        self.roles.install()
+        self.roles.insert([{"name": "admin", "level": 5}, {"name": "user", "level": 1}, {"name": "guest", "level": 0}])
+        self.queries = []
+        self.db.conn.set_trace_callback(lambda sql: sql.startswith("SELECT") and "sqlite_master" not in sql
+                                        and self.queries.append(sql))
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def test_get(self):
+        self.assertEqual(list(self.roles.get({"name": "admin"})), [{"id": 1, "name": "admin", "level": 5}])
+        self.assertEqual(len(self.queries), 1) # Loading the copy
+        self.assertEqual(self.roles.get({"level": [">=", 1]}).order_by("-level").only("name")[0]["name"], "admin")
+        self.assertEqual(self.roles.get({"level": [(">", 0), ("<", 5)]}).count(), 1)
+        self.assertFalse(self.roles.get({"name": "nobody"}))
+        self.assertEqual(len(self.queries), 1)
+
+    def test_coherence(self):
+        self.roles.get().count()
+        self.roles[2]["level"] = 3
+        self.assertEqual(self.roles.get({"level": 3}).count(), 1)
+        other = SQLite(database=self.path)
+        other.connect()
+        other.insert({"name": "root", "level": 9}, table="roles")
+        other.disconnect()
+        self.assertEqual(self.roles.get({"level": [">", 5]}).count(), 1)
+        with self.roles.transaction():
+            self.roles.insert({"name": "temporal", "level": 1})
+            self.assertIs(self.roles.materialized.database(), self.db)
+        self.assertEqual(len(self.queries), 3) # A load after every write
+
+    def test_limit(self):
+        self.roles.materialized.limit = 2
+        self.assertEqual(self.roles.get({"level": [">=", 1]}).count(), 2)
+        self.assertFalse(self.roles.materialized.loaded)
+        self.assertIs(self.roles.materialized.database(), self.db)
+        self.roles.insert({"name": "root", "level": 9})
+        self.queries.clear()
+        self.assertIs(self.roles.materialized.database(), self.db)
+        self.assertEqual(self.queries, ["SELECT COUNT(*) FROM roles ;"]) # No rows got
+        self.roles.delete({"level": [">=", 1]})
+        self.assertIsNot(self.roles.materialized.database(), self.db)
+
+class v1_Entity_cache(unittest.TestCase):
+    def setUp(self):
+        self.db = SQLite(database=MEMORY)
+        self.db.connect()
+        self.leads = Entity(self.db, "leads", "Leads", {"name": str, "owner": int, "status": str}, "Cached leads",
+                            cache=FilterCache(size=2, ttl=30))
+        self.leads.install()
+        self.leads.insert([{"name": "Pepi", "owner": 1, "status": "open"}, {"name": "Manuel", "owner": 1, "status": "won"},
+                           {"name": "Sofía", "owner": 2, "status": "open"}])
+        self.queries = []
+        self.db.conn.set_trace_callback(lambda sql: sql.startswith("SELECT") and "sqlite_master" not in sql
+                                        and self.queries.append(sql))
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def mine(self):
+        return [item["name"] for item in self.leads.get({"owner": 1, "status": "open"})]
+
+    def test_read_through(self):
+        self.assertEqual(self.mine(), ["Pepi"])
+        self.assertEqual(self.mine(), ["Pepi"])
+        self.assertEqual(len(self.queries), 1)
+        self.assertEqual(self.leads.cache.stats()["hits"], 1)
+        self.leads.get({"owner": 2}).count() # Counted in database, not kept
+        list(self.leads.get({"owner": 2}))
+        list(self.leads.get().order_by("name"))
+        self.assertEqual(self.leads.cache.evictions, 1)
+        self.leads.cache.ttl = 0
+        list(self.leads.get({"owner": 3}))
+        list(self.leads.get({"owner": 3}))
+        self.assertEqual(self.leads.cache.expirations, 1)
+
+    def test_invalidation(self):
+        self.mine()
+        list(self.leads.get().order_by("name"))
+        self.leads.replace({"id": 2}, {"name": "Manolo"})
+        self.assertEqual(len(self.leads.cache), 1) # Only the one ordered by name
+        self.leads.insert({"name": "Temporal"})
+        self.assertEqual(self.mine(), ["Pepi"])
+        self.assertEqual(len(self.queries), 3)
+        self.assertIn(" IN ", self.queries[2]) # Entry kept, its rows got again as the table was written
+        self.leads.insert({"name": "Juan", "owner": 1, "status": "open"})
+        self.assertEqual(self.mine(), ["Pepi", "Juan"])
+        self.leads[4]["status"] = "lost"
+        self.assertEqual(self.mine(), ["Pepi", "Juan"])
+        self.leads.delete({"name": "Juan"})
+        self.assertEqual(self.mine(), ["Pepi"])
+
+    def test_stale_items(self):
+        self.mine()
+        self.leads.replace({"owner": 1}, {"name": "Pepa"}) # Not a column of the entry
+        self.assertEqual(len(self.leads.cache), 1)
+        self.queries.clear()
+        self.assertEqual(self.mine(), ["Pepa"])
+        self.assertEqual(self.mine(), ["Pepa"])
+        self.assertEqual(len(self.queries), 1)
+        self.assertIn(" IN ", self.queries[0])
+
+    def test_identity_map(self):
+        self.mine()
+        Item.persistent.discard(self.leads[1])
+        self.queries.clear()
+        self.assertEqual(self.mine(), ["Pepi"])
+        self.assertEqual(len(self.queries), 1)
+        self.assertIn(" IN ", self.queries[0])
+
+class v1_Entity_events(unittest.TestCase):
+    def setUp(self):
+        self.db = SQLite(database=MEMORY)
+        self.db.connect()
+        self.leads = Entity(self.db, "leads", "Leads", {"name": str, "status": str}, "Observed leads")
+        self.leads.install()
+        self.leads.insert([{"name": "Pepi", "status": "open"}, {"name": "Manuel", "status": "open"}])
+        self.calls = []
+        self.subscription = self.leads.subscribe(self.calls.append)
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def test_synchronous(self):
+        self.leads.insert([{"name": "Sofía", "status": "open"}, {"name": "Juan", "status": "lost"}])
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual([event["data"]["name"] for event in self.calls[0]], ["Sofía", "Juan"])
+        self.leads[1]["status"] = "won"
+        self.assertEqual(self.calls[1], [{"op": "update", "table": "leads", "filter": {"id": 1}, "data": {"status": "won"},
+                                          "keys": [1]}])
+        self.leads.delete({"id": 2})
+        self.assertEqual(self.calls[2][0]["op"], "delete")
+        self.leads.unsubscribe(self.subscription)
+        self.leads.delete({"id": 3})
+        self.assertEqual(len(self.calls), 3)
+
+    def test_ops_and_filter(self):
+        won = []
+        self.leads.subscribe(won.append, ops=["update"], filter={"status": "won"})
+        self.leads.insert({"name": "Sofía", "status": "won"})
+        self.leads.replace({"id": 1}, {"status": "lost"})
+        self.leads.replace({"id": 2}, {"name": "Manolo"}) # Status not known, delivered
+        self.leads.replace({"status": "won"}, {"name": "Sofi"})
+        self.assertEqual([events[0]["filter"] for events in won], [{"id": 2}, {"status": "won"}])
+        with self.assertRaises(AttributeError):
+            self.leads.subscribe(won.append, ops=["select"])
+
+    def test_transaction(self):
+        with self.leads.transaction():
+            self.leads.insert({"name": "Sofía"})
+            self.leads.replace({"id": 1}, {"status": "won"})
+            self.assertEqual(self.calls, []) # Not committed yet
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual([event["op"] for event in self.calls[0]], ["insert", "update"])
+        with self.assertRaises(ZeroDivisionError):
+            with self.db.transaction():
+                self.leads.delete({"id": 1})
+                1/0
+        self.assertEqual(len(self.calls), 1) # Rolled back, nothing delivered
+        self.leads.delete({"id": 1})
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(len(self.calls[1]), 1)
+
+    def test_keys(self):
+        leads = Entity(self.db, "leads", "Leads", {"name": str, "status": str}, "Observed leads") # Constructed again
+        self.assertIs(leads, self.leads)
+        leads.insert([{"id": None, "name": "Sofía"}, {"id": 10, "name": "Juan"}, {"id": None, "name": "Luis"}])
+        self.assertEqual([(event["data"]["id"], event["data"]["name"]) for event in self.calls[0]],
+                         [(11, "Sofía"), (10, "Juan"), (12, "Luis")])
+        self.assertEqual([self.leads[key]["name"] for key in (11, 10, 12)], ["Sofía", "Juan", "Luis"])
+        leads.insert({"name": "Ana"})
+        self.assertEqual(self.calls[1][0]["data"], {"id": 13, "name": "Ana"})
+        self.assertEqual(self.calls[1][0]["keys"], [13])
+
+    def test_affected_keys(self):
+        self.leads.insert({"name": "Sofía", "status": "lost"})
+        self.leads.replace({"status": "open"}, {"status": "lost"})
+        self.assertEqual(self.calls[1][0]["keys"], [1, 2])
+        self.leads.delete({"status": "lost"})
+        self.assertEqual(self.calls[2][0]["keys"], [1, 2, 3])
+        self.leads.delete({"status": "lost"})
+        self.assertEqual(self.calls[3][0]["keys"], [])
+
+    def test_loop(self):
+        loop = asyncio.new_event_loop()
+        delivered = []
+        self.leads.subscribe(lambda events: delivered.append(threading.current_thread()), loop=loop)
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            self.leads.replace({"id": 1}, {"status": "won"})
+            for _ in range(100):
+                if delivered:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(delivered, [thread])
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+class v1_Entity_versioned(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "versioned.db")
+        self.db = SQLite(database=self.path)
+        self.db.connect()
+        self.customers = Entity(self.db, "customers", "Customers", {"name": str, "age": int}, "Versioned", versioned=True)
+        self.customers.install()
+        self.customers.insert({"name": "Pepi", "age": 32})
+        self.other = SQLite(database=self.path) # As another process
+        self.other.connect()
+        self.theirs = Entity(self.other, "customers", "Customers", {"name": str, "age": int}, "Versioned", versioned=True)
+        self.theirs.fields.set_installed()
+
+    def tearDown(self):
+        self.other.disconnect()
+        self.db.disconnect()
+
+    def test_conflict(self):
+        mine, theirs = self.customers[1], self.theirs[1]
+        self.assertEqual(mine["_version"], 1)
+        mine["name"] = "Pepa"
+        self.assertEqual(mine["_version"], 2)
+        with self.assertRaises(ConflictError) as error:
+            theirs["age"] = 40 # Got before the change
+        self.assertEqual(error.exception.changes, {"age": 40})
+        self.assertEqual((theirs["name"], theirs["age"], theirs["_version"]), ("Pepa", 32, 2)) # Refreshed
+        theirs["age"] = 40
+        self.assertEqual(self.db.select({"id": 1}, table="customers"), Data({"id": 1, "name": "Pepa", "age": 40, "_version": 3}))
+
+    def test_manual(self):
+        self.customers.write_mode = WriteModes.MANUAL
+        mine = self.customers[1]
+        mine["age"] = 33
+        self.theirs.replace({"id": 1}, {"name": "Pepa"})
+        with self.assertRaises(ConflictError):
+            mine.save()
+        self.assertEqual(mine.dirty, {})
+        self.assertEqual(mine["age"], 32)
+        self.assertEqual(self.customers.replace({"age": 32}, {"age": 34}), 1) # Entity writes are not conditional
+        self.assertEqual(self.db.select({"id": 1}, table="customers", fields=["_version"]),
+                         Data({"_version": 3}))
+
+    def test_locked(self):
+        self.customers.write_mode = WriteModes.MANUAL
+        mine = self.customers[1]
+        with mine.lock: # Changes in memory wait for the lock of the Item
+            thread = threading.Thread(target=lambda: mine.__setitem__("age", 33))
+            thread.start()
+            thread.join(0.1)
+            self.assertTrue(thread.is_alive())
+            self.assertEqual(mine.dirty, {})
+        thread.join()
+        self.assertEqual(mine.dirty, {"age": 33})
+        mine.save()
+        self.assertEqual(self.db.select({"id": 1}, table="customers", fields=["age", "_version"]),
+                         Data({"age": 33, "_version": 2}))
+
+    def test_loaded(self):
+        db = SQLite(database=MEMORY)
+        db.connect()
+        install_persistency(db)
+        Entity(db, "leads", "Leads", {"name": str}, "Versioned leads", versioned=True).install()
+        del(Entity.persistent[db]["leads"])
+        self.assertTrue(get_entities(db)["Leads"].versioned)
+        db.disconnect()
+
+class v1_Entity_archive(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = SQLite(database=os.path.join(self.dir, "hot.db"))
+        self.db.connect()
+        self.now = datetime.now()
+        self.rows = [{"note": f"note {day}", "created_at": self.now-timedelta(days=day)} for day in (900, 700, 600, 30, 1)]
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def activity(self, **policy):
+        entity = Entity(self.db, "activity", "Activity", {"note": str, "created_at": [datetime, DBEnums.INDEX]},
+                        "Activity log", archive=ArchivePolicy("created_at", 548, chunk=2, **policy))
+        entity.install()
+        entity.insert(self.rows)
+        return entity
+
+    def test_archive(self):
+        activity = self.activity()
+        self.assertEqual(activity.archive(self.now), 3)
+        self.assertEqual(activity.archive(self.now), 0)
+        self.assertEqual([item["note"] for item in activity.get()], ["note 30", "note 1"])
+        everything = activity.get(include_archive=True).order_by("created_at")
+        self.assertEqual([item["note"] for item in everything], [row["note"] for row in self.rows])
+        self.assertEqual(activity.get({"note": ["LIKE", "note 9%"]}, include_archive=True).count(), 1)
+        self.assertTrue(activity.get({"id": 1}, include_archive=True))
+        self.assertFalse(activity.get({"id": 1}))
+        self.assertEqual(self.db.count(table="activity__archive"), 3)
+
+    def test_events(self):
+        activity = self.activity()
+        calls = []
+        activity.subscribe(calls.append, ops=["archive"])
+        self.assertEqual(activity.archive(self.now), 3)
+        self.assertEqual([[event["keys"] for event in events] for events in calls], [[[1, 2]], [[3]]])
+        self.assertEqual(calls[0][0]["op"], "archive")
+        self.assertEqual(self.db.count(table="activity__archive"), 3)
+
+    def test_ids_not_reused(self):
+        activity = self.activity()
+        self.assertEqual(activity.archive(self.now+timedelta(days=1000)), 5) # Everything
+        activity.insert({"note": "new", "created_at": self.now-timedelta(days=900)})
+        self.assertEqual([item["id"] for item in activity.get()], [6])
+        self.assertEqual(activity.archive(self.now), 1)
+        self.assertEqual(sorted([item["id"] for item in activity.get(include_archive=True)]), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(activity.get({"id": 6}, include_archive=True).first()["note"], "new")
+
+    def test_attached(self):
+        activity = self.activity(path=os.path.join(self.dir, "archive.db"))
+        self.assertEqual(activity.archive(self.now), 3)
+        self.assertEqual(len(activity.get(include_archive=True)), 5)
+        archive = SQLite(database=os.path.join(self.dir, "archive.db"))
+        self.assertEqual(archive.count(table="activity__archive"), 3)
+        archive.disconnect()
+
+    def test_scheduled(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            activity = self.activity(interval=60)
+            policy = activity.archive_policy
+            activity.set_archive(policy, loop=loop)
+            for _ in range(100):
+                if policy.moved:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(policy.moved, 3) # Older than 18 months
+            activity.set_archive(None)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+class v1_Entity_changes(unittest.TestCase):
+    def setUp(self):
+        self.db = SQLite(database=MEMORY)
+        self.db.connect()
+        self.entity = Entity(self.db, "leads", "Leads", {"name": str}, "Tracked leads", track_changes=True)
+        self.entity.install()
+        self.entity.insert([{"name": "Pepi"}, {"name": "Manuel"}, {"name": "Sofía"}])
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def test_changes_since(self):
+        changes = self.entity.changes_since()
+        self.assertEqual(changes, {"seq": 3, "reset": False, "inserted": [1, 2, 3], "updated": [], "deleted": []})
+        self.entity.replace({"id": 1}, {"name": "Pepa"})
+        self.entity.replace({"id": 2}, {"id": 20})
+        self.entity.delete({"id": 3})
+        self.entity.insert({"name": "Temporal"})
+        self.entity.delete({"name": "Temporal"})
+        self.assertEqual(self.entity.changes_since(changes["seq"]),
+                         {"seq": 9, "reset": False, "inserted": [20], "updated": [1], "deleted": [2, 3]})
+        self.assertEqual(self.entity.changes_since(9)["inserted"], [])
+
+    def test_pruning(self):
+        self.db.create_change_log("leads", keep=10)
+        self.entity.insert([{"name": str(number)} for number in range(20)])
+        self.assertEqual(self.db.oldest_change("leads"), 14)
+        self.assertTrue(self.entity.changes_since(3)["reset"])
+        self.assertEqual(self.entity.changes_since(13)["inserted"], list(range(14, 24)))
+
+    def test_catalog(self):
+        install_persistency(self.db)
+        Entity(self.db, "deals", "Deals", {"name": str}, "Tracked deals", track_changes=True).install()
+        del(Entity.persistent[self.db]["deals"])
+        self.assertTrue(get_entity(self.db, "deals").track_changes)
+
+class v1_Item_identity(unittest.TestCase):
+    def setUp(self):
+        self.db = SQLite(database=MEMORY)
+        self.db.connect()
+        self.entity = Entity(self.db, "people", "People", {"name": str}, "Identity map")
+        self.entity.install()
+        self.entity.insert([{"name": "Pepi"}, {"name": "Manuel"}, {"name": "Sofía"}])
+
+    def tearDown(self):
+        Item.persistent.hot = None
+        Item.persistent.lifetime = None
+        self.db.disconnect()
+
+    def test_identity(self):
+        pepi = self.entity[1]
+        pepi.set_handler("name", lambda name: None)
+        self.db.update({"name": "Pepa"}, filter={"id": 1}, table="people")
+        self.assertIs(self.entity.get({"name": "Pepa"})[0], pepi)
+        self.assertEqual(pepi["name"], "Pepa")
+        self.assertEqual(len(pepi._server_changed_handlers["name"]), 1)
+        self.assertIs(Item.persistent.get(self.entity, 1), pepi)
+
+    def test_eviction(self):
+        Item.persistent.hot = 1
+        evictions = Item.persistent.evictions
+        list(self.entity[1:3])
+        self.assertGreaterEqual(Item.persistent.evictions - evictions, 2)
+        gc.collect()
+        self.assertEqual(list(Item.persistent[self.entity].keys()), [3])
+
+    def test_expiration(self):
+        manuel = self.entity[2]
+        Item.persistent.lifetime = 0
+        self.assertGreaterEqual(Item.persistent.expire(), 1)
+        self.assertIs(self.entity[2], manuel)
+        del(manuel)
+        Item.persistent.expire()
+        gc.collect()
+        self.assertIsNone(Item.persistent.get(self.entity, 2))
+        self.assertGreaterEqual(Item.persistent.stats()["expirations"], 1)
+
+    def test_compact(self):
+        pepi, manuel = self.entity[1:2]
+        self.assertIs(type(pepi), type(manuel))
+        self.assertFalse(hasattr(pepi, "__dict__"))
+        self.assertIsNone(pepi._server_changed_handlers)
+        self.assertEqual(dict(pepi), {"id": 1, "name": "Pepi"})
+        self.assertEqual(list(pepi.keys()), ["id", "name"])
+        self.assertEqual(pepi.get("surname", "none"), "none")
+        self.assertIn("name", pepi)
+        pepi.update_data({"surname": "Pérez"})
+        self.assertEqual(len(pepi), 3)
+        self.assertEqual(pepi, {"id": 1, "name": "Pepi", "surname": "Pérez"})
+        with self.assertRaises(KeyError):
+            manuel["surname"]
+        with self.assertRaises(Exception):
+            manuel["surname"] = "García"
+
+    def test_dict_api(self):
+        pepi = self.entity[1]
+        pepi.update({"name": "Pepa"})
+        self.assertEqual(self.db.select({"id": 1}, table="people")[0]["name"], "Pepa")
+        self.assertEqual(pepi.setdefault("name", "Other"), "Pepa")
+        self.assertEqual(pepi.pop("name"), "Pepa")
+        self.assertNotIn("name", pepi)
+        self.assertEqual((dict(pepi), len(pepi), pepi.get("name")), ({"id": 1}, 1, None))
+        self.assertEqual(pepi.setdefault("name", "Pepi"), "Pepi")
+        self.assertEqual(self.db.select({"id": 1}, table="people")[0]["name"], "Pepi")
+        self.assertEqual(json.loads(json.dumps(pepi.to_dict())), {"id": 1, "name": "Pepi"})
+        self.assertIsInstance(pepi.to_dict(), dict)
+
+class v1_Item_locks(unittest.TestCase):
+    def setUp(self):
+        self.db = SQLite(database=MEMORY)
+        self.db.connect()
+        self.leads = Entity(self.db, "leads", "Leads", {"name": str}, "Striped leads")
+        self.leads.install()
+        self.leads.insert([{"name": "Pepi"}, {"name": "Manuel"}])
+        self.pepi, self.manuel = self.leads[1], self.leads[2]
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def test_stripes(self):
+        self.assertIs(self.pepi.lock, self.leads.lock_for(1))
+        self.assertIsNot(self.pepi.lock, self.manuel.lock)
+        self.assertIs(self.leads.lock, self.leads.fields.lock) # Schema changes
+        self.assertIs(self.leads.lock_for([1]), self.leads.lock)
+
+    def test_concurrency(self):
+        def update(item, name):
+            thread = threading.Thread(target=item.update_data, args=({"name": name},))
+            thread.start()
+            thread.join(0.2)
+            return thread
+        with self.pepi.lock:
+            self.assertFalse(update(self.manuel, "Manolo").is_alive()) # Another stripe
+            waiting = update(self.pepi, "Pepa")
+            self.assertTrue(waiting.is_alive())
+        waiting.join()
+        self.assertEqual((self.pepi["name"], self.manuel["name"]), ("Pepa", "Manolo"))
+
+class v1_Item_write_behind(unittest.TestCase):
+    def setUp(self):
+        self.db = SQLite(database=MEMORY)
+        self.db.connect()
+        self.entity = Entity(self.db, "people", "People", {"name": str, "age": int, "city": str},
+                             "Write behind", write_mode=WriteModes.MANUAL)
+        self.entity.install()
+        self.entity.insert([{"name": "Pepi", "age": 42, "city": "Madrid"}, {"name": "Manuel", "age": 50, "city": "Soria"}])
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def test_save(self):
+        pepi, manuel = self.entity[1:2]
+        version = self.db.table_version("people")
+        pepi["name"], pepi["age"] = "Pepa", 43
+        manuel["city"] = "Burgos"
+        self.assertEqual(pepi.dirty, {"name": "Pepa", "age": 43})
+        self.assertEqual(self.db.select({"id": 1}, table="people")[0]["name"], "Pepi")
+        self.db.update({"age": 99, "city": "Lugo"}, filter={"id": 1}, table="people")
+        pepi._get_from_server()
+        self.assertEqual(pepi, {"id": 1, "name": "Pepa", "age": 43, "city": "Lugo"}) # Changes kept win
+        version = self.db.table_version("people")
+        self.entity.save()
+        self.assertEqual(self.db.table_version("people")[1] - version[1], 2) # One update by Item
+        self.assertEqual(self.db.select(table="people"),
+                         [{"id": 1, "name": "Pepa", "age": 43, "city": "Lugo"},
+                          {"id": 2, "name": "Manuel", "age": 50, "city": "Burgos"}])
+        self.assertEqual(pepi.dirty, {})
+        self.assertEqual(self.entity._dirty, {})
+
+    def test_constructed_again(self):
+        pepi = self.entity[1]
+        pepi["name"] = "Pepa"
+        entity = Entity(self.db, "people", "People", {"name": str, "age": int, "city": str}, "Write behind")
+        self.assertIs(entity, self.entity)
+        self.assertIs(entity.write_mode, WriteModes.MANUAL)
+        self.assertEqual(pepi.dirty, {"name": "Pepa"})
+        entity.save()
+        self.assertEqual(self.db.select({"id": 1}, table="people")[0]["name"], "Pepa")
+        entities = persistent(self.db)[0]
+        entities.write_mode = WriteModes.MANUAL
+        self.assertIs(persistent(self.db)[0].write_mode, WriteModes.MANUAL)
+
+    def test_transaction(self):
+        self.entity.write_mode = WriteModes.AUTOCOMMIT
+        pepi = self.entity[1]
+        version = self.db.table_version("people")
+        with self.entity.transaction():
+            self.assertTrue(self.entity.deferred)
+            pepi["name"], pepi["age"], pepi["city"] = "Pepa", 43, "Lugo"
+            self.entity.insert({"name": "Sofía", "age": 30, "city": "Vigo"})
+        self.assertFalse(self.entity.deferred)
+        self.assertEqual(self.db.table_version("people")[1] - version[1], 2)
+        self.assertEqual(self.db.select({"id": 1}, table="people")[0]["city"], "Lugo")
+        with self.assertRaises(ZeroDivisionError):
+            with self.entity.transaction():
+                pepi["name"] = "Pepi"
+                self.entity.delete({"id": 3})
+                1/0
+        self.assertEqual(pepi["name"], "Pepa")
+        self.assertEqual(len(self.entity.rows()), 3)
+        pepi["age"] = 44
+        self.assertEqual(self.db.select({"id": 1}, table="people")[0]["age"], 44)
+
 class v1_Item(unittest.TestCase):
     def setUp(self):
         self.db = SQLite(database="test.db")
@@ -205,6 +1055,45 @@ class v1_Item(unittest.TestCase):
         testing("nana")
         self.assertEqual(self.hola, {"id": 1, "foo": "nana", "bar": 10})
 
+    def test_refresher(self):
+        self.assertEqual(items.TIMEOUT, 1)
+        refresher = Refresher.persistent[self.entity]
+        self.assertEqual(sorted([item["id"] for item in refresher.items.values()]), [1, 2])
+        self.changes = []
+        self.adios.set_handler("bar", self.changes.append)
+        self.adios.set_handler("foo", self.changes.append)
+        self.entity.replace({"id": 2}, {"bar": 13})
+        self.assertEqual(refresher.refresh(), 1)
+        self.assertEqual(self.changes, [13])
+        self.assertEqual(refresher.refresh([1]), 0)
+        self.adios.close()
+        self.assertEqual(len(refresher.items), 1)
+
+    def test_refresher_errors(self):
+        errors = []
+        self.loop.call_soon_threadsafe(self.loop.set_exception_handler, lambda loop, context: errors.append(context["exception"]))
+        refresher = Refresher.persistent[self.entity]
+        refresher.refresh = lambda keys=None: 1/0
+        refresher._signature = None
+        checks = refresher.checks
+        time.sleep(items.TIMEOUT*2+1.5)
+        self.assertIsInstance(errors[0], ZeroDivisionError)
+        self.assertGreaterEqual(refresher.checks, checks+2)
+
+    def test_write_delayed(self):
+        entity = Entity(self.db, "delayed", "delayed", {"foo": str}, "Test entity",
+                        loop=self.loop, write_mode=WriteModes.DELAYED, write_delay=0.5)
+        entity.install()
+        entity.insert({"foo": "Hola"})
+        item = entity[1]
+        item["foo"] = "Adios"
+        self.assertEqual(self.db.select(table="delayed")[0]["foo"], "Hola")
+        time.sleep(1.5)
+        self.assertEqual(self.db.select(table="delayed")[0]["foo"], "Adios")
+        self.assertEqual(item.dirty, {})
+        with self.assertRaises(AttributeError):
+            Entity(self.db, "delayed2", "delayed2", {"foo": str}, "Test entity", write_mode=WriteModes.DELAYED)
+
 
 if __name__ == '__main__':
     unittest.main()